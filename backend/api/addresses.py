@@ -0,0 +1,108 @@
+"""
+Default shipping addresses.
+
+The partial unique index ``unique_default_address`` allows each user at
+most one default address. A user's first address becomes their default,
+the default cannot be unset directly (only moved to another address),
+and deleting the default promotes their newest remaining address. So checkout
+can resolve the shipping address with one read of that index
+(``default_address``).
+
+Every change locks the user's address rows first. Concurrent switches
+therefore run one after another instead of failing on the index.
+
+``default_address`` results are cached per user under a version number
+that each change bumps once it commits. A read that raced a change stores
+its result under the old version, which is never looked up again, so a
+stale default does not outlive the change. The bump only reaches other
+workers through a shared cache, so without one nothing is cached.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .checks import cache_is_shared
+from .models import Address
+
+
+def _version_key(user_id):
+    return f'address-default:{user_id}:version'
+
+
+def invalidate(user_id):
+    def bump():
+        key = _version_key(user_id)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr().
+            cache.set(key, 1, None)
+    transaction.on_commit(bump)
+
+
+def default_address(user_id):
+    """
+    The user's default ``Address``, or ``None``.
+    """
+    if not cache_is_shared():
+        return Address.objects.filter(user_id=user_id, is_default=True).first()
+    version = cache.get(_version_key(user_id), 0)
+    key = f'address-default:{user_id}:{version}'
+    cached = cache.get(key)
+    if cached is not None:
+        return cached['address']
+    address = Address.objects.filter(user_id=user_id, is_default=True).first()
+    cache.set(key, {'address': address}, settings.ADDRESS_DEFAULT_CACHE_SECONDS)
+    return address
+
+
+def _lock(user_id):
+    return list(Address.objects.select_for_update().filter(user_id=user_id).values_list('pk', flat=True))
+
+
+def _clear_default(user_id, keep=None):
+    Address.objects.filter(user_id=user_id, is_default=True).exclude(pk=keep).update(is_default=False)
+
+
+def save(serializer, user):
+    """
+    Create or update an address through ``serializer``.
+    """
+    instance = serializer.instance
+    with transaction.atomic():
+        extra = {'user': user}
+        if not _lock(user.pk):
+            extra['is_default'] = True
+        elif instance is not None and Address.objects.filter(pk=instance.pk, is_default=True).exists():
+            # Unsetting the default would leave the user without one.
+            extra['is_default'] = True
+        if extra.get('is_default') or serializer.validated_data.get('is_default'):
+            _clear_default(user.pk, keep=instance.pk if instance else None)
+        address = serializer.save(**extra)
+        invalidate(user.pk)
+    return address
+
+
+def set_default(address):
+    with transaction.atomic():
+        _lock(address.user_id)
+        # Two statements rather than one CASE: the unique index is checked
+        # row by row, so setting the new default before the old one is
+        # cleared would fail.
+        _clear_default(address.user_id, keep=address.pk)
+        Address.objects.filter(pk=address.pk).update(is_default=True)
+        invalidate(address.user_id)
+    address.is_default = True
+    return address
+
+
+def delete(address):
+    with transaction.atomic():
+        _lock(address.user_id)
+        address.delete()
+        if address.is_default:
+            newest = Address.objects.filter(user_id=address.user_id).order_by('-pk').first()
+            if newest is not None:
+                Address.objects.filter(pk=newest.pk).update(is_default=True)
+        invalidate(address.user_id)
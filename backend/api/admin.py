@@ -1,5 +1,150 @@
+import json
+
+from django import forms
 from django.contrib import admin
-from .models import Product, Category
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, OuterRef, QuerySet
+from django.utils.functional import cached_property
+
+from .models import Product, Category, ProductSpecValue, SpecAttribute
+from . import specs
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses PostgreSQL's planner estimates instead of an exact
+    COUNT(*) once a table is large. Unfiltered lists read pg_class.reltuples;
+    filtered lists use the row estimate from EXPLAIN.
+    """
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or connections[queryset.db].vendor != 'postgresql':
+            return super().count
+        estimate = self.estimate(queryset)
+        if estimate is None or estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+    def estimate(self, queryset):
+        if not queryset.query.where:
+            with connections[queryset.db].cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 until the table has been vacuumed or analyzed.
+            if row and row[0] >= 0:
+                return row[0]
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return plan[0]['Plan']['Plan Rows']
+
+
+class ProductChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        # The list never shows the large text/JSON columns.
+        return super().get_queryset(request, exclude_parameters).defer('description', 'specifications')
+
+
+class StockFilter(admin.SimpleListFilter):
+    title = 'stock'
+    parameter_name = 'stock'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('out', 'Out of stock'),
+            ('low', 'Low stock (under 5)'),
+            ('in', 'In stock'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'out':
+            return queryset.filter(stock=0)
+        if self.value() == 'low':
+            return queryset.filter(stock__gt=0, stock__lt=5)
+        if self.value() == 'in':
+            return queryset.filter(stock__gt=0)
+        return queryset
+
+
+class DiscountFilter(admin.SimpleListFilter):
+    title = 'discount'
+    parameter_name = 'discounted'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', 'Discounted'),
+            ('no', 'Full price'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(discount__gt=0)
+        if self.value() == 'no':
+            return queryset.filter(discount=0)
+        return queryset
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'category', 'price', 'discount', 'price_after_discount', 'stock')
+    list_select_related = ('category',)
+    list_filter = ('category', StockFilter, DiscountFilter)
+    # '^' makes these prefix searches, which product_name_search_idx serves.
+    search_fields = ('^name',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    autocomplete_fields = ('category',)
+    readonly_fields = ('price_after_discount', 'updated_at')
+
+    def get_changelist(self, request, **kwargs):
+        return ProductChangeList
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None:
+            # Edit the specifications whole, typed values included.
+            obj.specifications = specs.full_specifications(obj)
+        return obj
+
+    def save_model(self, request, obj, form, change):
+        values, obj.specifications = specs.split(obj.specifications, specs.schema(obj.category_id))
+        super().save_model(request, obj, form, change)
+        specs.replace_values({obj.pk: values})
+
+
+class SpecAttributeForm(forms.ModelForm):
+    # Stored values are rendered with the attribute's name, unit and type,
+    # so those are fixed once any product has a value for it.
+    locked_fields = ('name', 'type', 'unit')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if getattr(self.instance, 'has_values', False):
+            for name in self.locked_fields:
+                self.fields[name].disabled = True
+                self.fields[name].help_text = 'Fixed: products have values for this attribute.'
+
+
+class SpecAttributeInline(admin.TabularInline):
+    model = SpecAttribute
+    form = SpecAttributeForm
+    extra = 0
+
+    def get_queryset(self, request):
+        values = ProductSpecValue.objects.filter(attribute=OuterRef('pk'))
+        return super().get_queryset(request).annotate(has_values=Exists(values))
+
 
-admin.site.register(Product)
-admin.site.register(Category)
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+    # Run migrate_specifications after changing a schema.
+    inlines = [SpecAttributeInline]
@@ -0,0 +1,214 @@
+"""
+Sales and inventory analytics.
+
+Cart adds/removes and stock changes are recorded as ``AnalyticsEvent``
+rows. Recording never touches the database on the request path: events
+are queued when the surrounding transaction commits and written by
+``EventBuffer`` (see api/buffers.py) in one ``bulk_create`` once ``ANALYTICS_BUFFER_SIZE``
+events are pending or ``ANALYTICS_FLUSH_SECONDS`` have passed. Events
+still buffered when a worker is killed are lost; analytics are
+best-effort.
+
+``roll_up`` folds new events, in id order from a cursor, into hourly and
+daily ``ProductRollup`` and ``CategoryRollup`` rows. Dashboards read only
+the rollups (``product_summary``, ``product_series``,
+``category_summary``), never the raw events.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .buffers import WriteBehindBuffer
+from .models import AnalyticsCursor, AnalyticsEvent, AnalyticsRollup, Category, CategoryRollup, Product, ProductRollup
+
+CURSOR_NAME = 'rollups'
+ROLLUP_FIELDS = ['units_added', 'units_removed', 'stock_delta', 'events']
+
+
+class EventBuffer(WriteBehindBuffer):
+    size_setting = 'ANALYTICS_BUFFER_SIZE'
+    seconds_setting = 'ANALYTICS_FLUSH_SECONDS'
+    description = 'analytics events'
+
+    def __init__(self):
+        super().__init__()
+        self._events = []
+
+    def collect(self, event):
+        self._events.append(event)
+
+    def pending_count(self):
+        return len(self._events)
+
+    def take(self):
+        events, self._events = self._events, []
+        return events
+
+    def write(self, events):
+        AnalyticsEvent.objects.bulk_create(events, batch_size=500)
+
+
+buffer = EventBuffer()
+
+
+def record(kind, product, quantity):
+    """
+    Queue an event for ``product`` once the current transaction commits,
+    so rolled-back cart changes are not counted.
+    """
+    if not quantity:
+        return
+    event = AnalyticsEvent(
+        kind=kind, product_id=product.pk, category_id=product.category_id,
+        quantity=quantity, created_at=timezone.now(),
+    )
+    transaction.on_commit(lambda: buffer.add(event))
+
+
+def _apply(model, key_field, totals):
+    """
+    Add ``totals`` ({(period, bucket, key): {field: n}}) onto the rollup
+    rows of ``model``, creating the missing ones.
+    """
+    if not totals:
+        return
+    buckets = {bucket for _, bucket, _ in totals}
+    keys = {key for _, _, key in totals}
+    existing = {
+        (row.period, row.bucket, getattr(row, f'{key_field}_id')): row
+        for row in model.objects.filter(bucket__in=buckets, **{f'{key_field}_id__in': keys})
+    }
+    created, updated = [], []
+    for (period, bucket, key), values in totals.items():
+        row = existing.get((period, bucket, key))
+        if row is None:
+            created.append(model(period=period, bucket=bucket, **{f'{key_field}_id': key}, **values))
+        else:
+            for field, value in values.items():
+                setattr(row, field, getattr(row, field) + value)
+            updated.append(row)
+    model.objects.bulk_create(created, batch_size=500)
+    model.objects.bulk_update(updated, ROLLUP_FIELDS, batch_size=500)
+
+
+def roll_up(batch_size=10000):
+    """
+    Fold the next ``batch_size`` event ids into the rollups. Returns the
+    number of events consumed, or ``None`` once the rollups are up to date.
+
+    Only events older than ``ANALYTICS_ROLLUP_LAG_SECONDS`` are taken, so
+    a batch whose insert is still in flight (and may hold lower ids) is
+    not skipped by the cursor.
+    """
+    AnalyticsCursor.objects.get_or_create(name=CURSOR_NAME)
+    with transaction.atomic():
+        # The row lock keeps concurrent runs from counting a batch twice.
+        cursor = AnalyticsCursor.objects.select_for_update().get(name=CURSOR_NAME)
+        cutoff = timezone.now() - timedelta(seconds=settings.ANALYTICS_ROLLUP_LAG_SECONDS)
+        upper = (
+            AnalyticsEvent.objects.filter(id__gt=cursor.last_event_id, created_at__lt=cutoff)
+            .order_by('-id').values_list('id', flat=True).first()
+        )
+        if upper is None:
+            return None
+        upper = min(upper, cursor.last_event_id + batch_size)
+        events = AnalyticsEvent.objects.filter(id__gt=cursor.last_event_id, id__lte=upper)
+
+        products = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+        categories = defaultdict(lambda: dict.fromkeys(ROLLUP_FIELDS, 0))
+        consumed = 0
+        rows = (
+            events.annotate(hour=TruncHour('created_at'))
+            .values('hour', 'product_id', 'category_id', 'kind')
+            .annotate(count=Count('id'), units=Sum('quantity'))
+            .order_by()
+        )
+        for row in rows:
+            consumed += row['count']
+            if row['kind'] == AnalyticsEvent.CART_ADD:
+                values = {'units_added': row['units']}
+            elif row['kind'] == AnalyticsEvent.CART_REMOVE:
+                values = {'units_removed': row['units']}
+            else:
+                values = {'stock_delta': row['units']}
+            values['events'] = row['count']
+            day = row['hour'].replace(hour=0)
+            for period, bucket in ((AnalyticsRollup.HOUR, row['hour']), (AnalyticsRollup.DAY, day)):
+                for totals, key in ((products, row['product_id']), (categories, row['category_id'])):
+                    if key is None:
+                        continue
+                    target = totals[(period, bucket, key)]
+                    for field, value in values.items():
+                        target[field] += value
+
+        # Products and categories deleted since the event have nowhere to go.
+        live_products = set(Product.objects.filter(pk__in={key for _, _, key in products}).values_list('pk', flat=True))
+        live_categories = set(Category.objects.filter(pk__in={key for _, _, key in categories}).values_list('pk', flat=True))
+        _apply(ProductRollup, 'product', {k: v for k, v in products.items() if k[2] in live_products})
+        _apply(CategoryRollup, 'category', {k: v for k, v in categories.items() if k[2] in live_categories})
+
+        cursor.last_event_id = upper
+        cursor.save(update_fields=['last_event_id', 'updated_at'])
+    return consumed
+
+
+def purge_events(days):
+    """
+    Delete rolled-up events older than ``days`` days.
+    """
+    cursor = AnalyticsCursor.objects.filter(name=CURSOR_NAME).first()
+    if cursor is None:
+        return 0
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = AnalyticsEvent.objects.filter(id__lte=cursor.last_event_id, created_at__lt=cutoff).delete()
+    return deleted
+
+
+def default_since(period):
+    return timezone.now() - (timedelta(hours=48) if period == AnalyticsRollup.HOUR else timedelta(days=30))
+
+
+def _totals():
+    return {field: Sum(field) for field in ROLLUP_FIELDS}
+
+
+def product_summary(period, since, until=None, category_id=None, limit=20):
+    rows = ProductRollup.objects.filter(period=period, bucket__gte=since)
+    if until is not None:
+        rows = rows.filter(bucket__lt=until)
+    if category_id is not None:
+        rows = rows.filter(product__category_id=category_id)
+    return list(
+        rows.values('product_id', 'product__name').annotate(**_totals())
+        .order_by('-units_added', 'product_id')[:limit]
+    )
+
+
+def product_series(product_id, period, since, until=None):
+    rows = ProductRollup.objects.filter(product_id=product_id, period=period, bucket__gte=since)
+    if until is not None:
+        rows = rows.filter(bucket__lt=until)
+    return list(rows.order_by('bucket').values('bucket', *ROLLUP_FIELDS))
+
+
+def category_summary(period, since, until=None):
+    rows = CategoryRollup.objects.filter(period=period, bucket__gte=since)
+    if until is not None:
+        rows = rows.filter(bucket__lt=until)
+    return list(
+        rows.values('category_id', 'category__name').annotate(**_totals())
+        .order_by('-units_added', 'category_id')
+    )
+
+
+def freshness():
+    cursor = AnalyticsCursor.objects.filter(name=CURSOR_NAME).first()
+    return {
+        'last_event_id': cursor.last_event_id if cursor else 0,
+        'rolled_up_at': cursor.updated_at if cursor else None,
+    }
@@ -0,0 +1,77 @@
+"""
+Expiring API tokens.
+
+Every sign-in issues a new ``AuthToken``. The token expires
+``AUTH_TOKEN_TTL_SECONDS`` after it was last used. Sending it as
+``Authorization: Token <key>`` works the same as with
+rest_framework.authtoken.
+
+``ExpiringTokenAuthentication`` loads the token, its user and the user's
+profile in one query. The expiry and revocation checks then read only
+what was loaded. An active token's expiry is pushed forward at most every
+``AUTH_TOKEN_RENEW_SECONDS``, so most requests write nothing.
+
+Each token stores the owner's ``Profile.token_version`` from the moment
+it was issued. ``revoke_all`` bumps that number, which invalidates every
+token of the user with a single UPDATE. Revoked tokens are never renewed,
+so they expire and ``manage.py purge_tokens`` removes them along with
+the other expired tokens.
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import AuthToken, Profile
+
+
+def token_version(user):
+    try:
+        return user.profile.token_version
+    except Profile.DoesNotExist:
+        return 0
+
+
+def issue(user):
+    return AuthToken.objects.create(
+        key=secrets.token_hex(20),
+        user=user,
+        version=token_version(user),
+        expires_at=timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL_SECONDS),
+    )
+
+
+def revoke_all(user):
+    """
+    Invalidate every token of ``user``.
+    """
+    if not Profile.objects.filter(user=user).update(token_version=F('token_version') + 1):
+        Profile.objects.create(user=user, token_version=1)
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        try:
+            token = AuthToken.objects.select_related('user__profile').get(key=key)
+        except AuthToken.DoesNotExist:
+            raise AuthenticationFailed('Invalid token.')
+
+        now = timezone.now()
+        if token.expires_at <= now:
+            raise AuthenticationFailed('Token has expired.')
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        if token.version != token_version(token.user):
+            raise AuthenticationFailed('Token has been revoked.')
+
+        ttl = timedelta(seconds=settings.AUTH_TOKEN_TTL_SECONDS)
+        if token.expires_at - now < ttl - timedelta(seconds=settings.AUTH_TOKEN_RENEW_SECONDS):
+            token.expires_at = now + ttl
+            AuthToken.objects.filter(pk=token.pk).update(expires_at=token.expires_at)
+        return token.user, token
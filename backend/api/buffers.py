@@ -0,0 +1,80 @@
+"""
+In-memory write-behind buffers.
+
+``WriteBehindBuffer`` collects items on the request path and writes them
+in one go once ``size_setting`` items are pending, or ``seconds_setting``
+seconds after the first of them arrived, from a timer thread. Pending
+items are also written when the process exits normally. Items still
+buffered when a worker is killed are lost, so this only suits data that
+is allowed to be best-effort (analytics events, popularity counters).
+
+A subclass keeps the pending items and implements ``collect``,
+``pending_count``, ``take`` and ``write``. All but ``write`` run under
+the buffer's lock.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    size_setting = None
+    seconds_setting = None
+    # What the items are, for the log line when a write fails.
+    description = 'buffered items'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def collect(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def pending_count(self):
+        raise NotImplementedError
+
+    def take(self):
+        """
+        Return the pending items and start an empty batch.
+        """
+        raise NotImplementedError
+
+    def write(self, pending):
+        raise NotImplementedError
+
+    def add(self, *args, **kwargs):
+        with self._lock:
+            self.collect(*args, **kwargs)
+            full = self.pending_count() >= getattr(settings, self.size_setting)
+            if not full and self._timer is None:
+                self._timer = threading.Timer(getattr(settings, self.seconds_setting), self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            count = self.pending_count()
+            pending = self.take()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not count:
+            return
+        try:
+            self.write(pending)
+        except DatabaseError:
+            logger.exception('Dropped %d %s', count, self.description)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
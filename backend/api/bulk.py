@@ -0,0 +1,260 @@
+"""
+Set-based product maintenance for admins.
+
+Every operation selects products either by ``ids`` or by a whitelisted
+``filter`` and runs as a handful of statements, never a save() per row:
+
+* ``patch`` with ``set`` applies the same values to all selected rows in
+  one ``UPDATE`` (``price_after_discount`` is recomputed in SQL); with
+  ``items`` it applies per-product values through ``bulk_update``.
+* ``restock`` adds to stock with ``UPDATE ... SET stock = stock + n``.
+  Sharded products get the units added to one shard by ``inventory.release``.
+* ``delete`` removes products in batches. Their image names are queued
+  as ``PendingFileDeletion`` rows rather than deleted inline.
+
+Bulk writes bypass ``Product.save()`` and its signals, so they set
+``updated_at`` themselves and publish live stock changes only for small
+selections (``BULK_PUBLISH_LIMIT``).
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import inventory, specs
+from .events import get_broadcaster
+from .models import Category, PendingFileDeletion, Product, ProductDeletion
+from .typeahead import typeahead
+
+BATCH_SIZE = 2000
+
+# filter key -> (lookup, parser)
+FILTERS = {
+    'category': ('category_id', int),
+    'name_startswith': ('name__istartswith', str),
+    'stock_lte': ('stock__lte', int),
+    'stock_gte': ('stock__gte', int),
+    'price_lte': ('price_after_discount__lte', Decimal),
+    'price_gte': ('price_after_discount__gte', Decimal),
+    'updated_before': ('updated_at__lt', parse_datetime),
+}
+PATCH_FIELDS = {'category_id', 'price', 'discount', 'description'}
+
+
+class BulkError(Exception):
+    pass
+
+
+def select(data):
+    """
+    Build the product queryset named by ``ids`` or ``filter`` in ``data``.
+    An empty selection is refused rather than read as "everything".
+    """
+    ids, filters = data.get('ids'), data.get('filter')
+    if bool(ids) == bool(filters):
+        raise BulkError('Give either a non-empty ids list or a filter')
+    if ids:
+        if not isinstance(ids, list) or len(ids) > settings.BULK_MAX_IDS:
+            raise BulkError(f'ids must be a list of at most {settings.BULK_MAX_IDS} product ids')
+        try:
+            return Product.objects.filter(pk__in=[int(pk) for pk in ids])
+        except (TypeError, ValueError):
+            raise BulkError('ids must be integers')
+    if not isinstance(filters, dict):
+        raise BulkError('filter must be an object')
+    lookups = {}
+    for key, value in filters.items():
+        if key not in FILTERS:
+            raise BulkError(f'Unknown filter {key!r}; use one of {", ".join(FILTERS)}')
+        lookup, parse = FILTERS[key]
+        try:
+            parsed = parse(value)
+        except (TypeError, ValueError, InvalidOperation):
+            parsed = None
+        if parsed is None:
+            raise BulkError(f'Invalid value for {key}')
+        lookups[lookup] = parsed
+    return Product.objects.filter(**lookups)
+
+
+def _clean_values(values):
+    unknown = set(values) - PATCH_FIELDS
+    if unknown:
+        raise BulkError(f'Cannot patch {", ".join(sorted(unknown))}; allowed: {", ".join(sorted(PATCH_FIELDS))}')
+    cleaned = {}
+    try:
+        for field, value in values.items():
+            if field == 'category_id':
+                cleaned[field] = None if value is None else int(value)
+            elif field in ('price', 'discount'):
+                cleaned[field] = None if value is None else Decimal(str(value))
+            else:
+                cleaned[field] = str(value)
+    except (TypeError, ValueError, InvalidOperation):
+        raise BulkError('Invalid patch values')
+    if cleaned.get('price', 0) is None:
+        raise BulkError('price cannot be null')
+    if cleaned.get('category_id') is not None and not Category.objects.filter(pk=cleaned['category_id']).exists():
+        raise BulkError('Category not found')
+    return cleaned
+
+
+def _price_after_discount(price, discount):
+    # Mirrors Product.save().
+    if discount is None:
+        return price
+    return price - (discount / 100) * price
+
+
+def patch(queryset, values):
+    values = _clean_values(values)
+    if not values:
+        raise BulkError('Nothing to patch')
+    if 'price' in values or 'discount' in values:
+        price = values.get('price', F('price'))
+        # A NULL discount means full price, as in Product.save().
+        discount = values.get('discount', Coalesce(F('discount'), Value(Decimal('0'))))
+        if discount is None:
+            values['price_after_discount'] = price
+        elif 'price' in values and 'discount' in values:
+            values['price_after_discount'] = _price_after_discount(price, discount)
+        else:
+            values['price_after_discount'] = ExpressionWrapper(
+                price - discount * price / 100, output_field=DecimalField(max_digits=10, decimal_places=2),
+            )
+    with transaction.atomic():
+        if 'category_id' in values:
+            # The filter may stop matching once the category changes.
+            ids = list(queryset.values_list('pk', flat=True))
+        updated = queryset.update(**values, updated_at=timezone.now())
+        if 'category_id' in values:
+            # Typed specifications follow the new category's schema.
+            for start in range(0, len(ids), BATCH_SIZE):
+                specs.convert(specs.for_conversion(Product.objects.filter(pk__in=ids[start:start + BATCH_SIZE])))
+    return updated
+
+
+def patch_items(items):
+    """
+    Per-product values: ``[{"id": 1, "price": "10.00"}, ...]``.
+    """
+    if not isinstance(items, list) or not items or len(items) > settings.BULK_MAX_IDS:
+        raise BulkError(f'items must be a list of 1 to {settings.BULK_MAX_IDS} objects')
+    changes = {}
+    try:
+        for item in items:
+            item = dict(item)
+            product_id = int(item.pop('id'))
+            changes[product_id] = _clean_values(item)
+    except (TypeError, ValueError, KeyError):
+        raise BulkError('Every item needs an integer id')
+    fields = set().union(*changes.values())
+    if not fields:
+        raise BulkError('Nothing to patch')
+    loaded = set(fields)
+    if fields & {'price', 'discount'}:
+        fields.add('price_after_discount')
+        # price_after_discount needs both, whichever one is patched.
+        loaded |= {'price', 'discount'}
+    fields.add('updated_at')
+
+    now = timezone.now()
+    updated = 0
+    ids = list(changes)
+    with transaction.atomic():
+        for start in range(0, len(ids), BATCH_SIZE):
+            products = list(Product.objects.filter(pk__in=ids[start:start + BATCH_SIZE]).only('pk', *loaded))
+            for product in products:
+                for field, value in changes[product.pk].items():
+                    setattr(product, field, value)
+                if 'price_after_discount' in fields:
+                    product.price_after_discount = _price_after_discount(product.price, product.discount)
+                product.updated_at = now
+            # Small batches: each row is matched against every WHEN of the CASE.
+            Product.objects.bulk_update(products, sorted(fields), batch_size=100)
+            if 'category_id' in fields:
+                specs.convert(specs.for_conversion(Product.objects.filter(pk__in=[product.pk for product in products])))
+            updated += len(products)
+    return updated
+
+
+def _publish_stock(stocks):
+    broadcaster = get_broadcaster()
+    for pk, stock in stocks:
+        broadcaster.publish(pk, {'stock': stock})
+
+
+def restock(queryset, quantity):
+    with transaction.atomic():
+        sharded = list(queryset.filter(stock_shards__gt=0))
+        plain = queryset.filter(stock_shards=0)
+        # The filter may stop matching once stock changes, so note ids first.
+        ids = list(plain.values_list('pk', flat=True)[:settings.BULK_PUBLISH_LIMIT + 1])
+        updated = plain.update(stock=F('stock') + quantity, updated_at=timezone.now())
+        publish_sharded = len(sharded) <= settings.BULK_PUBLISH_LIMIT
+        for product in sharded:
+            # One atomic increment; reading the total and rewriting every
+            # shard would lose reservations made in between.
+            inventory.release(product, quantity, publish=publish_sharded)
+        if len(ids) <= settings.BULK_PUBLISH_LIMIT:
+            stocks = list(Product.objects.filter(pk__in=ids).values_list('pk', 'stock'))
+            transaction.on_commit(lambda: _publish_stock(stocks))
+    return updated + len(sharded)
+
+
+def delete(queryset):
+    deleted = 0
+    # Per-product index updates would dominate; rebuild once afterwards.
+    with typeahead.batch():
+        while True:
+            batch = list(queryset.values_list('pk', 'image')[:BATCH_SIZE])
+            if not batch:
+                break
+            with transaction.atomic():
+                PendingFileDeletion.objects.bulk_create(
+                    [PendingFileDeletion(name=image) for _, image in batch if image],
+                )
+                _delete_rows([pk for pk, _ in batch])
+            deleted += len(batch)
+        if deleted:
+            typeahead.invalidate()
+    return deleted
+
+
+def _delete_rows(pks):
+    """
+    Delete products and what cascades from them with one statement per
+    related table; going through the collector would load and signal
+    every row. Product has no pre_delete receivers. Its post_delete
+    receiver, api.signals.product_deleted, is not sent, and its two side
+    effects are replayed in bulk instead: the export tombstones are
+    written here, and the caller rebuilds the typeahead index once.
+    Cascaded deletes of related rows go through QuerySet.delete() and do
+    send their own signals. Keep this in step with api/signals.py.
+    """
+    # include_hidden: RelatedProduct.related and SimilarityState use related_name='+'.
+    relations = [
+        field for field in Product._meta.get_fields(include_hidden=True)
+        if field.auto_created and not field.concrete and (field.one_to_many or field.one_to_one)
+    ]
+    for relation in relations:
+        if relation.on_delete is models.DO_NOTHING:
+            continue
+        related = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': pks})
+        if relation.on_delete is models.CASCADE:
+            related.delete()
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{relation.field.name: None})
+        else:
+            # PROTECT and friends need the collector's checks.
+            Product.objects.filter(pk__in=pks).delete()
+            return
+    ProductDeletion.objects.bulk_create([ProductDeletion(product_id=pk) for pk in pks])
+    connection = connections[Product.objects.db]
+    table, pk = (connection.ops.quote_name(name) for name in (Product._meta.db_table, Product._meta.pk.column))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {pk} = ANY(%s)', [pks])
@@ -0,0 +1,29 @@
+"""
+System checks for settings the features in this app depend on.
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+def cache_is_shared():
+    """
+    Whether every worker process sees the same default cache. A
+    local-memory cache is private to its process, which is only enough
+    with a single worker (``WEB_CONCURRENCY``).
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    return backend != 'django.core.cache.backends.locmem.LocMemCache' or settings.WEB_CONCURRENCY == 1
+
+
+@register()
+def check_guest_cart_cache(app_configs, **kwargs):
+    # Guest carts exist only in the cache (api/guest_cart.py). With a
+    # per-process cache a visitor's cart vanishes whenever a request lands
+    # on another worker.
+    if cache_is_shared():
+        return []
+    return [Error(
+        'Guest carts need a cache shared by all workers.',
+        hint='Set REDIS_URL, or run a single worker (WEB_CONCURRENCY=1).',
+        id='api.E001',
+    )]
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+def connection_stats(alias='default'):
+    """
+    Connection reuse metrics for this worker process.
+    """
+    connection = connections[alias]
+    stats = {
+        'mode': settings.DB_POOL_MODE,
+        'vendor': connection.vendor,
+        'connected': connection.connection is not None,
+    }
+
+    pool = getattr(connection, 'pool', None)
+    if pool is not None:
+        stats['pool'] = pool.get_stats()
+    elif settings.DB_POOL_MODE == 'persistent':
+        close_at = connection.close_at
+        stats['persistent'] = {
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'expires_in': round(close_at - time.monotonic(), 1) if close_at is not None else None,
+        }
+    return stats
@@ -0,0 +1,200 @@
+"""
+Fan-out of product stock/price changes to server-sent-event subscribers.
+
+Publishers run in ordinary (sync) request threads. Subscribers are
+``Subscription`` objects owned by an ASGI event loop: a dict of pending
+deltas plus an ``asyncio.Event``. An idle subscriber costs a few hundred
+bytes and no task or thread. Deltas for the same product are merged until
+the connection next writes, so a burst of stock changes reaches each
+client as a single message.
+
+``InProcessBroadcaster`` only reaches subscribers in the current process.
+``RedisBroadcaster`` relays through Redis pub/sub so that every worker
+sees every change. Pick one with ``PRODUCT_EVENTS_BROADCASTER``.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, product_ids, loop):
+        self.product_ids = frozenset(product_ids)
+        self.loop = loop
+        self.pending = {}
+        self.event = asyncio.Event()
+
+    def push(self, product_id, delta):
+        # Always runs on self.loop.
+        self.pending.setdefault(product_id, {}).update(delta)
+        self.event.set()
+
+    async def next_batch(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for changes, then return them merged
+        by product id, or ``None`` on timeout.
+        """
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        # Give closely spaced changes a moment to coalesce.
+        await asyncio.sleep(settings.PRODUCT_EVENTS_COALESCE_SECONDS)
+        self.event.clear()
+        batch, self.pending = self.pending, {}
+        return batch
+
+
+class InProcessBroadcaster:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, product_ids):
+        subscription = Subscription(product_ids, asyncio.get_running_loop())
+        with self._lock:
+            for product_id in subscription.product_ids:
+                self._subscribers[product_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for product_id in subscription.product_ids:
+                subscribers = self._subscribers.get(product_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[product_id]
+
+    def publish(self, product_id, delta):
+        self.deliver(product_id, delta)
+
+    def deliver(self, product_id, delta):
+        with self._lock:
+            subscribers = list(self._subscribers.get(product_id, ()))
+        # One thread-safe callback per event loop, however many of its
+        # connections are subscribed to the product.
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_push_all, subscriptions, product_id, delta)
+            except RuntimeError:
+                # The loop has shut down; its subscriptions are going away.
+                pass
+
+
+def _push_all(subscriptions, product_id, delta):
+    for subscription in subscriptions:
+        subscription.push(product_id, delta)
+
+
+class RedisBroadcaster(InProcessBroadcaster):
+    channel = 'product-events'
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+        except ImportError as e:
+            raise ImproperlyConfigured('RedisBroadcaster requires the redis package.') from e
+        if not settings.REDIS_URL:
+            raise ImproperlyConfigured('RedisBroadcaster requires REDIS_URL.')
+        self._redis = redis.Redis.from_url(settings.REDIS_URL)
+        self._redis_error = redis.RedisError
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, product_ids):
+        self._ensure_listener()
+        return super().subscribe(product_ids)
+
+    def publish(self, product_id, delta):
+        # Runs in on_commit callbacks: the write has already committed, so
+        # a Redis outage costs live updates, never the request.
+        try:
+            self._redis.publish(self.channel, json.dumps([product_id, delta]))
+        except self._redis_error:
+            logger.exception('Could not publish product event for %s', product_id)
+
+    def _ensure_listener(self):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        # Runs for the life of the process. A dropped connection is retried
+        # with backoff; changes published while disconnected are lost.
+        backoff = 1
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                backoff = 1
+                for message in pubsub.listen():
+                    product_id, delta = json.loads(message['data'])
+                    self.deliver(product_id, delta)
+            except Exception:
+                logger.exception('Product event listener failed; reconnecting in %ss', backoff)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                _broadcaster = import_string(settings.PRODUCT_EVENTS_BROADCASTER)()
+    return _broadcaster
+
+
+def product_delta(product, fields=None):
+    # Imported here: inventory publishes through this module.
+    from .inventory import available_stock
+
+    delta = {}
+    if fields is None or 'stock' in fields:
+        # For sharded products Product.stock is only a snapshot.
+        delta['stock'] = available_stock(product)
+    if fields is None or 'price' in fields or 'discount' in fields:
+        delta['price'] = str(product.price)
+        delta['price_after_discount'] = (
+            str(product.price_after_discount) if product.price_after_discount is not None else None
+        )
+    return delta
+
+
+def product_snapshot(product_ids):
+    products = Product.objects.filter(pk__in=product_ids).only(
+        'id', 'stock', 'stock_shards', 'price', 'discount', 'price_after_discount',
+    )
+    return {product.pk: product_delta(product) for product in products}
+
+
+def publish_product(product, fields=None):
+    delta = product_delta(product, fields)
+    if delta:
+        get_broadcaster().publish(product.pk, delta)
@@ -0,0 +1,127 @@
+"""
+Streaming catalog exports (NDJSON or CSV) for feeds and partners.
+
+An incremental export (``updated_since``) lists the products changed since
+the cursor, followed by a tombstone for each product deleted since then:
+a row with only ``id``, ``deleted`` set and ``updated_at`` holding the
+deletion time. Full exports carry no tombstones.
+"""
+import csv
+import io
+import itertools
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .inventory import available_stock
+from .models import Product, ProductDeletion
+from .specs import full_specifications, values_prefetch
+
+EXPORT_FIELDS = (
+    'id', 'name', 'category_id', 'category', 'price', 'discount', 'price_after_discount',
+    'stock', 'description', 'image', 'specifications', 'updated_at', 'deleted',
+)
+
+# Rows are grouped into blocks before they are written to the response so
+# the server does not flush one tiny chunk per product.
+ROWS_PER_BLOCK = 500
+
+
+def export_queryset(updated_since=None):
+    queryset = Product.objects.select_related('category').prefetch_related(values_prefetch()).order_by('pk')
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    return queryset
+
+
+def product_row(product, media_url):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'category_id': product.category_id,
+        'category': product.category.name if product.category else None,
+        'price': product.price,
+        'discount': product.discount,
+        'price_after_discount': product.price_after_discount,
+        'stock': available_stock(product),
+        'description': product.description,
+        'image': media_url(product.image.name) if product.image else None,
+        'specifications': full_specifications(product),
+        'updated_at': product.updated_at,
+        'deleted': False,
+    }
+
+
+def tombstone_row(deletion):
+    row = dict.fromkeys(EXPORT_FIELDS)
+    row.update(id=deletion.product_id, updated_at=deletion.deleted_at, deleted=True)
+    return row
+
+
+def iter_rows(queryset, media_url, chunk_size=2000):
+    for product in queryset.iterator(chunk_size=chunk_size):
+        yield product_row(product, media_url)
+
+
+def iter_tombstones(deleted_since, chunk_size=2000):
+    deletions = ProductDeletion.objects.filter(deleted_at__gte=deleted_since).order_by('deleted_at', 'pk')
+    for deletion in deletions.iterator(chunk_size=chunk_size):
+        yield tombstone_row(deletion)
+
+
+def iter_ndjson(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    block = []
+    for row in rows:
+        block.append(encoder.encode(row))
+        if len(block) >= ROWS_PER_BLOCK:
+            yield '\n'.join(block) + '\n'
+            block = []
+    if block:
+        yield '\n'.join(block) + '\n'
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        if row['specifications'] is not None:
+            row['specifications'] = json.dumps(row['specifications'], ensure_ascii=False)
+        row['updated_at'] = row['updated_at'].isoformat()
+        writer.writerow(row)
+        count += 1
+        if count % ROWS_PER_BLOCK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv'),
+}
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(fmt, media_url, updated_since=None, compress=False):
+    serialize, _ = FORMATS[fmt]
+    rows = iter_rows(export_queryset(updated_since), media_url)
+    if updated_since is not None:
+        rows = itertools.chain(rows, iter_tombstones(updated_since))
+    chunks = serialize(rows)
+    if compress:
+        return iter_gzip(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
@@ -0,0 +1,103 @@
+"""
+Carts for anonymous visitors, kept in the cache rather than the database.
+
+The browser holds only a signed cookie with a random cart id; the items
+(``{product_id: quantity}``) live in the cache under that id. Guest carts
+reserve no stock. When the visitor logs in or signs up, the cart is merged
+into their ``Cart`` in one transaction and the cache entry is dropped.
+"""
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import analytics, inventory
+from .models import AnalyticsEvent, Cart, CartItem, Product
+
+COOKIE_NAME = 'guest_cart'
+COOKIE_SALT = 'api.guest_cart'
+
+
+class GuestCart:
+    def __init__(self, cart_id, items=None):
+        self.cart_id = cart_id
+        self.items = items if items is not None else cache.get(self.cache_key, {})
+
+    @property
+    def cache_key(self):
+        return f'guest-cart:{self.cart_id}'
+
+    @classmethod
+    def from_request(cls, request, create=False):
+        cart_id = request.get_signed_cookie(COOKIE_NAME, default=None, salt=COOKIE_SALT)
+        if cart_id is None:
+            return cls(secrets.token_urlsafe(18), items={}) if create else None
+        return cls(cart_id)
+
+    def set_quantity(self, product_id, quantity):
+        if quantity > 0:
+            self.items[product_id] = quantity
+        else:
+            self.items.pop(product_id, None)
+
+    def save(self, response):
+        cache.set(self.cache_key, self.items, settings.GUEST_CART_TTL)
+        response.set_signed_cookie(
+            COOKIE_NAME, self.cart_id, salt=COOKIE_SALT,
+            max_age=settings.GUEST_CART_TTL, httponly=True, samesite='Lax',
+        )
+
+    def merge_into(self, user):
+        """
+        Move the guest items into ``user``'s cart, reserving stock for each.
+        Items that no longer exist or are out of stock are skipped. Returns
+        the ids of skipped products.
+        """
+        skipped = []
+        if not self.items:
+            return skipped
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=user)
+            # Concurrent logins (two tabs) merge one after the other. Reading
+            # the items again under the lock makes the later merge find the
+            # guest cart already emptied instead of adding it twice.
+            Cart.objects.select_for_update().get(pk=cart.pk)
+            self.items = cache.get(self.cache_key, {})
+            if self.items:
+                products = Product.objects.in_bulk(list(self.items))
+                existing = {
+                    item.product_id: item
+                    for item in CartItem.objects.select_for_update().filter(cart=cart, product_id__in=list(products))
+                }
+                created, updated = [], []
+                for product_id, quantity in self.items.items():
+                    product = products.get(product_id)
+                    try:
+                        if product is None:
+                            raise inventory.OutOfStock
+                        inventory.reserve(product, quantity)
+                    except inventory.OutOfStock:
+                        skipped.append(product_id)
+                        continue
+                    analytics.record(AnalyticsEvent.CART_ADD, product, quantity)
+                    price = product.price_after_discount if product.price_after_discount is not None else product.price
+                    item = existing.get(product_id)
+                    if item is None:
+                        created.append(CartItem(cart=cart, product=product, quantity=quantity, price=price))
+                    else:
+                        item.quantity += quantity
+                        item.price = price
+                        updated.append(item)
+                CartItem.objects.bulk_create(created)
+                CartItem.objects.bulk_update(updated, ['quantity', 'price'])
+            # Still under the lock, so a waiting merge sees the cart gone.
+            cache.delete(self.cache_key)
+        return skipped
+
+
+def merge_guest_cart(request, response, user):
+    guest_cart = GuestCart.from_request(request)
+    if guest_cart is not None:
+        guest_cart.merge_into(user)
+        response.delete_cookie(COOKIE_NAME)
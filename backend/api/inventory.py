@@ -0,0 +1,145 @@
+"""
+Stock reservations.
+
+Stock normally lives in ``Product.stock`` and is reserved with a single
+conditional ``UPDATE ... SET stock = stock - n WHERE stock >= n``.
+
+A product can be switched to sharded mode for launches and flash sales
+(``Product.stock_shards > 0``, see the ``shard_stock`` command). Its stock
+is then split across that many ``ProductStockShard`` rows. A reservation
+tries the shards in random order, so concurrent buyers mostly lock
+different rows instead of queueing on one. Only when no single shard can
+cover the quantity does it lock them all and drain them together. The
+public stock figure is the sum of the shards, cached for
+``SHARDED_STOCK_CACHE_SECONDS``, and ``Product.stock`` holds only a
+snapshot.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .events import get_broadcaster
+from .models import Product, ProductStockShard
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def _cache_key(product_id):
+    return f'stock:{product_id}'
+
+
+def available_stock(product):
+    if not product.stock_shards:
+        return product.stock
+    key = _cache_key(product.pk)
+    stock = cache.get(key)
+    if stock is None:
+        stock = ProductStockShard.objects.filter(product_id=product.pk).aggregate(total=Sum('stock'))['total'] or 0
+        cache.set(key, stock, settings.SHARDED_STOCK_CACHE_SECONDS)
+    return stock
+
+
+def _publish(product):
+    stock = available_stock(product)
+    transaction.on_commit(lambda: get_broadcaster().publish(product.pk, {'stock': stock}))
+
+
+def reserve(product, quantity):
+    """
+    Take ``quantity`` units of stock or raise ``OutOfStock``.
+    """
+    if product.stock_shards:
+        _reserve_sharded(product, quantity)
+    else:
+        updated = Product.objects.filter(pk=product.pk, stock__gte=quantity).update(
+            stock=F('stock') - quantity, updated_at=timezone.now(),
+        )
+        if not updated:
+            raise OutOfStock
+        product.refresh_from_db(fields=['stock'])
+    _publish(product)
+
+
+def _reserve_sharded(product, quantity):
+    shards = ProductStockShard.objects.filter(product_id=product.pk)
+    for shard in random.sample(range(product.stock_shards), product.stock_shards):
+        if shards.filter(shard=shard, stock__gte=quantity).update(stock=F('stock') - quantity):
+            return
+
+    # No single shard can cover it: lock every shard and drain them together.
+    with transaction.atomic():
+        rows = list(shards.select_for_update().order_by('shard'))
+        if sum(row.stock for row in rows) < quantity:
+            raise OutOfStock
+        remaining = quantity
+        for row in rows:
+            take = min(row.stock, remaining)
+            if take:
+                row.stock -= take
+                row.save(update_fields=['stock'])
+                remaining -= take
+            if not remaining:
+                break
+
+
+def release(product, quantity, publish=True):
+    """
+    Add ``quantity`` units of stock, e.g. when a cart item is removed or
+    a product is restocked. ``publish=False`` skips the live stock event,
+    for bulk restocks.
+    """
+    if product.stock_shards:
+        shard = random.randrange(product.stock_shards)
+        ProductStockShard.objects.filter(product_id=product.pk, shard=shard).update(stock=F('stock') + quantity)
+    else:
+        Product.objects.filter(pk=product.pk).update(stock=F('stock') + quantity, updated_at=timezone.now())
+        product.refresh_from_db(fields=['stock'])
+    if publish:
+        _publish(product)
+
+
+@transaction.atomic
+def set_stock(product, total):
+    """
+    Overwrite a product's stock, spreading it evenly over its shards.
+    """
+    if not product.stock_shards:
+        product.stock = total
+        product.save(update_fields=['stock'])
+        return
+    base, extra = divmod(total, product.stock_shards)
+    for shard in range(product.stock_shards):
+        ProductStockShard.objects.update_or_create(
+            product_id=product.pk, shard=shard, defaults={'stock': base + (1 if shard < extra else 0)},
+        )
+    Product.objects.filter(pk=product.pk).update(stock=total, updated_at=timezone.now())
+    cache.delete(_cache_key(product.pk))
+    _publish(product)
+
+
+@transaction.atomic
+def set_shards(product, shards):
+    """
+    Switch a product to ``shards`` stock shards, or back to a single row
+    with ``shards=0``, preserving the total.
+    """
+    product = Product.objects.select_for_update().get(pk=product.pk)
+    if product.stock_shards:
+        rows = ProductStockShard.objects.select_for_update().filter(product_id=product.pk)
+        total = rows.aggregate(total=Sum('stock'))['total'] or 0
+        rows.delete()
+    else:
+        total = product.stock
+    Product.objects.filter(pk=product.pk).update(stock_shards=shards, stock=total, updated_at=timezone.now())
+    product.stock_shards = shards
+    product.stock = total
+    cache.delete(_cache_key(product.pk))
+    if shards:
+        set_stock(product, total)
+    return product
@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core import signals
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request database connection overhead with and without connection reuse.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Simulated requests per mode.')
+
+    def handle(self, *args, **options):
+        n = options['requests']
+
+        fresh = self.measure(n, self.fresh_connection_request)
+        configured = self.measure(n, self.configured_request)
+
+        self.report('fresh connection per request', fresh)
+        self.report(f'DB_POOL_MODE={settings.DB_POOL_MODE}', configured)
+        saved = statistics.mean(fresh) - statistics.mean(configured)
+        self.stdout.write(self.style.SUCCESS(f'Overhead removed per request: {saved:.3f} ms'))
+
+    def measure(self, n, fn):
+        fn()  # Let the first connection / pool warm up outside the timings.
+        timings = []
+        for _ in range(n):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def fresh_connection_request(self):
+        # What every request paid before: connect, authenticate, query, disconnect.
+        conn = connection.Database.connect(**connection.get_connection_params())
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        finally:
+            conn.close()
+
+    def configured_request(self):
+        # Replay the request lifecycle so close_old_connections() applies the
+        # configured CONN_MAX_AGE / pool behaviour exactly as in production.
+        signals.request_started.send(sender=self.__class__)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        finally:
+            signals.request_finished.send(sender=self.__class__)
+
+    def report(self, label, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'{label:<32} mean {statistics.mean(timings):7.3f} ms  '
+            f'p50 {statistics.median(timings):7.3f} ms  p95 {p95:7.3f} ms'
+        )
@@ -0,0 +1,77 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the latency of the first requests a fresh worker serves, with and without warm-up. Each '
+        'run starts a new process that loads the WSGI application like a server would, optionally waits '
+        'for the WARMUP_ON_STARTUP warm-up to finish, then GETs every path twice.'
+    )
+    # System checks import the URLconf, which is part of what is measured.
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes per mode.')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path to request (repeatable). Defaults to WARMUP_PATHS plus an autocomplete lookup.',
+        )
+        parser.add_argument('--child', choices=['cold', 'warm'], help='Internal: run one measurement.')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [*settings.WARMUP_PATHS, '/api/autocomplete/?q=lap']
+        if options['child']:
+            self.child(paths)
+            return
+
+        results = {mode: [self.spawn(mode, paths) for _ in range(options['runs'])] for mode in ('cold', 'warm')}
+        warmups = [run['warmup_ms'] for run in results['warm']]
+        self.stdout.write(f'{"path":<36} {"cold 1st":>10} {"warm 1st":>10} {"2nd":>10}   (median ms of {options["runs"]} runs)')
+        for i, path in enumerate(paths):
+            cold = statistics.median(run['first'][i] for run in results['cold'])
+            warm = statistics.median(run['first'][i] for run in results['warm'])
+            second = statistics.median(run['second'][i] for run in results['cold'] + results['warm'])
+            self.stdout.write(f'{path:<36} {cold:10.1f} {warm:10.1f} {second:10.1f}')
+        cold_total = statistics.median(sum(run['first']) for run in results['cold'])
+        warm_total = statistics.median(sum(run['first']) for run in results['warm'])
+        self.stdout.write(f'{"all first requests":<36} {cold_total:10.1f} {warm_total:10.1f}')
+        self.stdout.write(f'warm-up itself took {statistics.median(warmups):.1f} ms (median), before traffic')
+
+    def spawn(self, mode, paths):
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_first_request', '--child', mode]
+        for path in paths:
+            command += ['--path', path]
+        env = {**os.environ, 'WARMUP_ON_STARTUP': '1' if mode == 'warm' else ''}
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f'{mode} run failed:\n{completed.stderr}')
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def child(self, paths):
+        # Importing the WSGI module is what a server does; it starts the
+        # warm-up when WARMUP_ON_STARTUP is set.
+        started = time.perf_counter()
+        from backend_project.wsgi import application
+        while not warmup.is_ready():
+            time.sleep(0.005)
+        warmup_ms = (time.perf_counter() - started) * 1000
+
+        result = {'warmup_ms': round(warmup_ms, 1), 'first': [], 'second': []}
+        for attempt in ('first', 'second'):
+            for path in paths:
+                started = time.perf_counter()
+                status = warmup.get(application, path)
+                result[attempt].append(round((time.perf_counter() - started) * 1000, 2))
+                if not status.startswith('2'):
+                    raise CommandError(f'{path}: {status}')
+        self.stdout.write(json.dumps(result))
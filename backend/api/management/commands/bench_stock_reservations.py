@@ -0,0 +1,62 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api import inventory
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure stock reservation throughput for one hot product under many concurrent clients, '
+        'unsharded and with increasing shard counts. Creates and deletes a scratch product.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=32)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--shards', type=int, nargs='+', default=[0, 4, 16, 64])
+        parser.add_argument(
+            '--hold-ms', type=float, default=2,
+            help='Time each transaction stays open after reserving, standing in for the cart write in add_item.',
+        )
+
+    def handle(self, *args, **options):
+        product = Product.objects.create(
+            name='bench: hot product', price=1, discount=0, description='', stock=10 ** 9,
+        )
+        try:
+            baseline = None
+            for shards in options['shards']:
+                product = inventory.set_shards(product, shards)
+                rate = self.run(product, options['clients'], options['seconds'], options['hold_ms'] / 1000)
+                baseline = baseline or rate
+                label = f'{shards} shards' if shards else 'unsharded'
+                self.stdout.write(f'{label:<12} {rate:9.0f} reservations/s  ({rate / baseline:4.1f}x)')
+        finally:
+            product.delete()
+
+    def run(self, product, clients, seconds, hold):
+        counts = [0] * clients
+        stop = threading.Event()
+
+        def client(i):
+            try:
+                while not stop.is_set():
+                    with transaction.atomic():
+                        inventory.reserve(product, 1)
+                        time.sleep(hold)
+                    counts[i] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return sum(counts) / seconds
@@ -0,0 +1,124 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import query_plans
+from api.models import Address, AuthToken, Cart, CartItem, Category, Product, ProductSpecValue, ProductStats, RelatedProduct, SpecAttribute
+
+SEEDED_TABLES = [
+    'auth_user', 'api_category', 'api_product', 'api_productstats', 'api_relatedproduct',
+    'api_cart', 'api_cartitem', 'api_address', 'api_specattribute', 'api_productspecvalue', 'api_authtoken',
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a dataset, EXPLAIN every query in api/query_plans.py and fail if any plan falls back to a '
+        'sequential scan on a table it should reach through an index. Everything is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--show-plans', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are only checked on PostgreSQL.')
+        failures = []
+        try:
+            with transaction.atomic():
+                fixture = self.seed(options['products'], options['users'])
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {', '.join(SEEDED_TABLES)}")
+                for name, (tables, build) in query_plans.HOT_QUERIES.items():
+                    plan = query_plans.explain(build(fixture))
+                    scanned = query_plans.seq_scanned(plan, tables)
+                    if scanned:
+                        failures.append(name)
+                        self.stdout.write(self.style.ERROR(f'{name:<28} SEQ SCAN on {", ".join(scanned)}'))
+                    else:
+                        used = ', '.join(query_plans.indexes_used(plan)) or plan['Node Type']
+                        self.stdout.write(f'{name:<28} ok  ({used})')
+                    if options['show_plans'] or scanned:
+                        self.stdout.write(build(fixture).explain())
+                raise Rollback
+        except Rollback:
+            pass
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries regressed to sequential scans: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS(f'All {len(query_plans.HOT_QUERIES)} hot queries use indexes'))
+
+    def seed(self, product_count, user_count):
+        rng = random.Random(0)
+        run = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        categories = Category.objects.bulk_create([Category(name=f'plan-check-{run}-{i}') for i in range(20)])
+
+        products = []
+        for i in range(product_count):
+            price = Decimal(rng.randrange(100, 300000)) / 100
+            products.append(Product(
+                name=f'Plan check product {i}', category=rng.choice(categories), price=price,
+                discount=Decimal(0), price_after_discount=price, description='', specifications={},
+                stock=0 if rng.random() < 0.3 else rng.randrange(1, 50),
+            ))
+        products = Product.objects.bulk_create(products, batch_size=2000)
+        ProductStats.objects.bulk_create(
+            [ProductStats(product=product, score=rng.random() * 1000) for product in products], batch_size=2000,
+        )
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product=product, related=products[(i + rank + 1) % len(products)], rank=rank, score=1)
+            for i, product in enumerate(products[:5000]) for rank in range(5)
+        ], batch_size=5000)
+
+        attributes = SpecAttribute.objects.bulk_create([
+            SpecAttribute(category=category, name=name, type=kind, unit=unit)
+            for category in categories
+            for name, kind, unit in (('ram', SpecAttribute.NUMBER, 'GB'), ('processor', SpecAttribute.TEXT, ''))
+        ])
+        ProductSpecValue.objects.bulk_create([
+            ProductSpecValue(product=product, attribute=attribute, number=rng.choice([4, 8, 16, 32, 64]))
+            if attribute.type == SpecAttribute.NUMBER else
+            ProductSpecValue(product=product, attribute=attribute, text=rng.choice(['i5', 'i7', 'Ryzen 5', 'M2']))
+            for product in products for attribute in attributes if attribute.category_id == product.category_id
+        ], batch_size=5000)
+
+        users = User.objects.bulk_create(
+            [User(username=f'plan-check-{run}-{i}', password='!') for i in range(user_count)], batch_size=2000,
+        )
+        carts = Cart.objects.bulk_create([Cart(user=user) for user in users], batch_size=2000)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1, price=product.price)
+            for cart in carts for product in rng.sample(products, 3)
+        ], batch_size=5000)
+        Address.objects.bulk_create([
+            Address(
+                user=user, first_name='Plan', last_name='Check', phone='0', address='1 Street', city='City',
+                state='State', zip_code='0', is_default=n == 0,
+            )
+            for user in users for n in range(2)
+        ], batch_size=5000)
+        now = timezone.now()
+        AuthToken.objects.bulk_create([
+            AuthToken(key=f'{run}-{user.pk}-{n}', user=user, expires_at=now + timedelta(days=rng.uniform(-3, 14)))
+            for user in users for n in range(5)
+        ], batch_size=5000)
+        return {
+            'user': users[0].pk,
+            'cart': carts[0].pk,
+            'product': products[0].pk,
+            'products': [product.pk for product in products[:50]],
+            'attribute': attributes[0].pk,
+            'text_attribute': attributes[1].pk,
+            'category': categories[0].pk,
+            'updated_since': timezone.now(),
+        }
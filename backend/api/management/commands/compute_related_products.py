@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.similarity import compute_related
+
+
+class Command(BaseCommand):
+    help = (
+        'Precompute "related products" from specifications, price band and category. '
+        'By default only products whose features changed (and the products they affect) are recomputed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=12, help='Neighbours stored per product.')
+        parser.add_argument('--block-size', type=int, default=1024, help='Query rows scored per matrix block.')
+        parser.add_argument('--full', action='store_true', help='Recompute every product.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        recomputed, total = compute_related(k=options['k'], block_size=options['block_size'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed related products for {recomputed} of {total} products '
+            f'in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,39 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from api import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream the product catalog to a file (or stdout) as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-format', choices=sorted(exports.FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write to. Defaults to stdout.')
+        parser.add_argument('--gzip', action='store_true', help='Gzip-compress the output.')
+        parser.add_argument('--updated-since', help='Only export products changed since this ISO 8601 datetime.')
+        parser.add_argument('--base-url', default='', help='Prefix for image URLs, e.g. https://shop.example.com')
+
+    def handle(self, *args, **options):
+        updated_since = None
+        if options['updated_since']:
+            updated_since = parse_datetime(options['updated_since'])
+            if updated_since is None:
+                raise CommandError('--updated-since must be an ISO 8601 datetime')
+
+        base_url = options['base_url'].rstrip('/')
+        media_url = lambda name: f'{base_url}{settings.MEDIA_URL}{name}'
+        chunks = exports.iter_export(
+            options['output_format'], media_url, updated_since=updated_since, compress=options['gzip'],
+        )
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if options['output']:
+                out.close()
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.storage import file_fields
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete media files that no model references. References are streamed from the database '
+        'into an on-disk index and the media tree is walked lazily, so memory use stays flat.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--grace-minutes', type=int, default=60,
+            help='Skip files modified this recently, so in-flight uploads are not collected.',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        batch_size = options['batch_size']
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        skip_dirs = {os.path.abspath(settings.CHUNKED_UPLOAD_DIR)}
+        cutoff = time.time() - options['grace_minutes'] * 60
+
+        with tempfile.TemporaryDirectory() as workdir:
+            refs = sqlite3.connect(os.path.join(workdir, 'refs.sqlite3'))
+            refs.execute('CREATE TABLE refs (name TEXT PRIMARY KEY) WITHOUT ROWID')
+            referenced = self.load_references(refs, batch_size)
+
+            scanned = deleted = freed = 0
+            batch = []
+            for path, size, mtime in self.iter_files(media_root, skip_dirs):
+                scanned += 1
+                if mtime > cutoff:
+                    continue
+                batch.append((os.path.relpath(path, media_root).replace(os.sep, '/'), path, size))
+                if len(batch) >= batch_size:
+                    d, f = self.collect(refs, batch, options['dry_run'])
+                    deleted, freed, batch = deleted + d, freed + f, []
+            if batch:
+                d, f = self.collect(refs, batch, options['dry_run'])
+                deleted, freed = deleted + d, freed + f
+            refs.close()
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{referenced} references, {scanned} files scanned. '
+            f'{verb} {deleted} orphaned files ({freed / (1024 * 1024):.1f} MiB).'
+        ))
+
+    def load_references(self, refs, batch_size):
+        count = 0
+        for model, field_name in file_fields():
+            names = (
+                model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .values_list(field_name, flat=True).order_by()
+            )
+            batch = []
+            for name in names.iterator(chunk_size=batch_size):
+                batch.append((name,))
+                if len(batch) >= batch_size:
+                    refs.executemany('INSERT OR IGNORE INTO refs VALUES (?)', batch)
+                    count += len(batch)
+                    batch = []
+            refs.executemany('INSERT OR IGNORE INTO refs VALUES (?)', batch)
+            count += len(batch)
+        refs.commit()
+        return count
+
+    def iter_files(self, root, skip_dirs):
+        # os.scandir streams directory entries, unlike os.walk which lists
+        # each directory in full first.
+        stack = [root] if os.path.isdir(root) else []
+        while stack:
+            directory = stack.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.abspath(entry.path) not in skip_dirs:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        yield entry.path, stat.st_size, stat.st_mtime
+
+    def collect(self, refs, batch, dry_run):
+        names = [name for name, _, _ in batch]
+        found = set()
+        # SQLite caps bound parameters per statement.
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(row[0] for row in refs.execute(f'SELECT name FROM refs WHERE name IN ({placeholders})', chunk))
+
+        # A row may have started using an old orphan since the references
+        # were loaded; check the candidates again just before unlinking.
+        candidates = [name for name in names if name not in found]
+        for model, field_name in file_fields():
+            for start in range(0, len(candidates), 500):
+                found.update(
+                    model._default_manager.filter(**{f'{field_name}__in': candidates[start:start + 500]})
+                    .values_list(field_name, flat=True)
+                )
+
+        deleted = freed = 0
+        for name, path, size in batch:
+            if name in found:
+                continue
+            if self.verbosity >= 2:
+                self.stdout.write(f'orphan: {name}')
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+            deleted += 1
+            freed += size
+        return deleted, freed
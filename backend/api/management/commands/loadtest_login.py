@@ -0,0 +1,121 @@
+import json
+import math
+import statistics
+import threading
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+from api.views import login
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure legitimate login latency before and during a credential-stuffing burst against '
+        'existing accounts. Creates scratch users and deletes them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10, help='Length of each phase.')
+        parser.add_argument('--attackers', type=int, default=8, help='Concurrent attacking threads.')
+        parser.add_argument('--attacker-ips', type=int, default=2)
+        parser.add_argument(
+            '--attack-interval', type=float, default=0.05,
+            help='Seconds between attempts per attacking thread. A thread that never yields starves the '
+                 'measuring thread of the GIL, which says nothing about the server.',
+        )
+        parser.add_argument(
+            '--ramp', type=float, default=5,
+            help='Seconds the attack runs before legitimate latency is measured, so the burst allowance is spent.',
+        )
+        parser.add_argument('--users', type=int, default=30, help='Legitimate accounts to rotate through.')
+        parser.add_argument('--legit-interval', type=float, default=0.5, help='Seconds between legitimate logins.')
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        password = 'correct horse battery staple'
+        hashed = make_password(password)
+        users = User.objects.bulk_create([
+            User(username=f'loadtest-{run}-{i}', email=f'loadtest-{run}-{i}@example.com', password=hashed)
+            for i in range(options['users'] + 5)
+        ])
+        legit, decoys = users[:options['users']], users[options['users']:]
+        factory = RequestFactory()
+
+        def attempt(email, secret, ip):
+            request = factory.post(
+                '/api/login/', json.dumps({'email': email, 'password': secret}),
+                content_type='application/json', REMOTE_ADDR=ip,
+            )
+            start = time.perf_counter()
+            response = login(request)
+            return response.status_code, (time.perf_counter() - start) * 1000
+
+        def legit_phase():
+            latencies, statuses = [], []
+            deadline = time.monotonic() + options['seconds']
+            i = 0
+            while time.monotonic() < deadline:
+                user = legit[i % len(legit)]
+                status, ms = attempt(user.email, password, f'198.51.100.{i % 250 + 1}')
+                latencies.append(ms)
+                statuses.append(status)
+                i += 1
+                time.sleep(options['legit_interval'])
+            return latencies, statuses
+
+        try:
+            self.stdout.write('Baseline (no attack)...')
+            baseline, _ = legit_phase()
+
+            stop = threading.Event()
+            attack_statuses = []
+
+            def attacker(n):
+                try:
+                    i = 0
+                    while not stop.is_set():
+                        decoy = decoys[i % len(decoys)]
+                        ip = f'203.0.113.{n % options["attacker_ips"] + 1}'
+                        attack_statuses.append(attempt(decoy.email, f'guess-{i}', ip)[0])
+                        i += 1
+                        stop.wait(options['attack_interval'])
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=attacker, args=(n,)) for n in range(options['attackers'])]
+            self.stdout.write(f'Under attack ({options["attackers"]} threads)...')
+            for thread in threads:
+                thread.start()
+            try:
+                time.sleep(options['ramp'])
+                attacked, statuses = legit_phase()
+            finally:
+                stop.set()
+                for thread in threads:
+                    thread.join()
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+        self.report('legit, baseline', baseline)
+        self.report('legit, under attack', attacked)
+        rejected = sum(1 for status in attack_statuses if status == 429)
+        self.stdout.write(
+            f'attack: {len(attack_statuses)} attempts, {rejected} rejected with 429 '
+            f'({100 * rejected / max(1, len(attack_statuses)):.1f}%)'
+        )
+        failed = sum(1 for status in statuses if status != 200)
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} legitimate logins failed during the attack'))
+
+    def report(self, label, latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[min(len(latencies) - 1, math.ceil(len(latencies) * 0.95) - 1)]
+        self.stdout.write(
+            f'{label:<22} n={len(latencies):<4} p50 {statistics.median(latencies):7.1f} ms  p95 {p95:7.1f} ms'
+        )
@@ -0,0 +1,129 @@
+import re
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F, Func, IntegerField, Max, Sum
+
+from api import specs
+from api.models import Product, ProductSpecValue, SpecAttribute
+
+NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+# Share of a key's values that must agree on a type for --infer-schemas.
+TYPE_AGREEMENT = 0.9
+
+
+def value_kind(raw):
+    if isinstance(raw, bool):
+        return (SpecAttribute.BOOLEAN, '')
+    if not isinstance(raw, str):
+        return None
+    entry = specs.normalize_value(raw)
+    if 'value' in entry:
+        return (SpecAttribute.NUMBER, entry['unit'])
+    if NUMBER_RE.fullmatch(raw.strip()):
+        return (SpecAttribute.NUMBER, '')
+    return (SpecAttribute.TEXT, '')
+
+
+def choose_type(kinds, seen):
+    typed = {kind: count for kind, count in kinds.items() if kind is not None}
+    if typed:
+        (kind, unit), count = max(typed.items(), key=lambda item: item[1])
+        if count >= TYPE_AGREEMENT * seen:
+            return kind, unit
+    # Numbers in mixed units, or mixed with words, still read fine as text.
+    strings = sum(count for (kind, _), count in typed.items() if kind != SpecAttribute.BOOLEAN)
+    if strings >= TYPE_AGREEMENT * seen:
+        return SpecAttribute.TEXT, ''
+    return None, ''
+
+
+class Command(BaseCommand):
+    help = (
+        'Move Product.specifications values that a category spec schema covers into typed ProductSpecValue '
+        'rows, in primary-key batches. Safe to re-run; run it again after changing a schema. What the API '
+        'returns does not change.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--category', type=int, help='Only convert products of this category.')
+        parser.add_argument(
+            '--infer-schemas', action='store_true',
+            help='First add schema attributes for keys common in each category, typed from their values.',
+        )
+        parser.add_argument(
+            '--min-share', type=float, default=0.5,
+            help='With --infer-schemas, the share of a category\'s products a key must appear in.',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.order_by('pk')
+        if options['category']:
+            products = products.filter(category_id=options['category'])
+        if options['infer_schemas']:
+            self.infer_schemas(products, options['min_share'])
+
+        before = self.json_bytes(products)
+        last, checked, changed = 0, 0, 0
+        while True:
+            batch = specs.for_conversion(products.filter(pk__gt=last)[:options['batch_size']])
+            if not batch:
+                break
+            changed += specs.convert(batch)
+            checked += len(batch)
+            last = batch[-1].pk
+            self.stdout.write(f'{checked} products checked, {changed} changed')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Converted {changed} of {checked} products; {ProductSpecValue.objects.count()} typed values stored'
+        ))
+        if before is not None:
+            self.stdout.write(f'specifications JSON: {before} bytes before, {self.json_bytes(products)} after')
+
+    def json_bytes(self, products):
+        if connection.vendor != 'postgresql':
+            return None
+        size = Func(F('specifications'), function='pg_column_size', output_field=IntegerField())
+        return products.aggregate(size=Sum(size))['size'] or 0
+
+    def infer_schemas(self, products, min_share):
+        totals = Counter()
+        keys = defaultdict(Counter)
+        kinds = defaultdict(Counter)
+        rows = products.exclude(category=None).values_list('category_id', 'specifications')
+        for category_id, specifications in rows.iterator(chunk_size=5000):
+            totals[category_id] += 1
+            if not isinstance(specifications, dict):
+                continue
+            for key, raw in specifications.items():
+                canonical = specs.canonical_key(key)
+                keys[(category_id, canonical)][key] += 1
+                kinds[(category_id, canonical)][value_kind(raw)] += 1
+
+        existing = specs.schemas(totals)
+        positions = dict(
+            SpecAttribute.objects.filter(category_id__in=list(totals))
+            .values('category_id').annotate(last=Max('position')).values_list('category_id', 'last')
+        )
+        created = []
+        for (category_id, canonical), counts in sorted(keys.items(), key=lambda item: -sum(item[1].values())):
+            seen = sum(counts.values())
+            if not canonical or canonical in existing.get(category_id, {}) or seen < min_share * totals[category_id]:
+                continue
+            kind, unit = choose_type(kinds[(category_id, canonical)], seen)
+            if kind is None:
+                continue
+            name = counts.most_common(1)[0][0]
+            if len(name) > 64:
+                continue
+            positions[category_id] = positions.get(category_id, -1) + 1
+            created.append(SpecAttribute(
+                category_id=category_id, name=name, label=name.replace('_', ' ').capitalize() if name.islower() else name,
+                type=kind, unit=unit, position=positions[category_id],
+            ))
+        SpecAttribute.objects.bulk_create(created)
+        for attribute in created:
+            unit = f' ({attribute.unit})' if attribute.unit else ''
+            self.stdout.write(f'category {attribute.category_id}: added {attribute.type} attribute {attribute.name!r}{unit}')
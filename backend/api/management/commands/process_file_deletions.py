@@ -0,0 +1,74 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import PendingFileDeletion
+from api.storage import file_fields
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete queued media files (see PendingFileDeletion) that no row references any more. '
+        'Content-hashed files can be shared, so each name is checked before it is removed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+        parser.add_argument(
+            '--grace-minutes', type=int, default=60,
+            help='Leave entries and files this recent for a later run, so in-flight uploads that reuse '
+                 'a hashed name are not deleted.',
+        )
+
+    def handle(self, *args, **options):
+        fields = list(file_fields())
+        cutoff = time.time() - options['grace_minutes'] * 60
+        queued_before = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        last_id = 0
+        removed = kept = deferred = 0
+        while True:
+            pending = list(
+                PendingFileDeletion.objects.filter(pk__gt=last_id, created_at__lt=queued_before)
+                .order_by('pk')[:options['batch_size']]
+            )
+            if not pending:
+                break
+            last_id = pending[-1].pk
+            names = {entry.name for entry in pending}
+            referenced = set()
+            for model, field in fields:
+                referenced.update(
+                    model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True)
+                )
+            # ContentHashedStorage.save() touches a file it hands out again,
+            # so a recent mtime means an upload may be about to reference it.
+            recent = set()
+            for name in names - referenced:
+                try:
+                    if os.path.getmtime(default_storage.path(name)) > cutoff:
+                        recent.add(name)
+                        continue
+                except FileNotFoundError:
+                    pass
+                if not options['dry_run']:
+                    default_storage.delete(name)
+                removed += 1
+            kept += len(names & referenced)
+            deferred += len(recent)
+            if not options['dry_run']:
+                with transaction.atomic():
+                    PendingFileDeletion.objects.filter(
+                        pk__in=[entry.pk for entry in pending if entry.name not in recent],
+                    ).delete()
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {removed} files; {kept} are still referenced and were kept, '
+            f'{deferred} were used too recently and stay queued.'
+        ))
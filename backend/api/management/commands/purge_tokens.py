@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import AuthToken
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired API tokens in small batches, each its own short transaction, so sign-ins and '
+        'token renewals are never held up behind one long DELETE. Revoked tokens are never renewed and '
+        'are removed once they expire.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now()
+        expired = AuthToken.objects.filter(expires_at__lt=cutoff).order_by('expires_at')
+        deleted = 0
+        while True:
+            keys = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            count, _ = AuthToken.objects.filter(pk__in=keys, expires_at__lt=cutoff).delete()
+            deleted += count
+            self.stdout.write(f'{deleted} tokens deleted')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} expired tokens'))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import uploads
+from api.models import ChunkedUpload
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads that were abandoned before completion.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Age after which an unfinished upload is abandoned.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = ChunkedUpload.objects.filter(created_at__lt=cutoff)
+        count = 0
+        for upload in stale.iterator():
+            uploads.discard(upload)
+            upload.delete()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} abandoned uploads'))
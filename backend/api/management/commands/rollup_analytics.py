@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api import analytics
+
+
+class Command(BaseCommand):
+    help = 'Fold new analytics events into the hourly and daily rollups. Safe to run from cron every few minutes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Event ids per transaction.')
+        parser.add_argument(
+            '--purge-days', type=int, default=None,
+            help='Afterwards, delete rolled-up events older than this many days.',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            consumed = analytics.roll_up(batch_size=options['batch_size'])
+            if consumed is None:
+                break
+            total += consumed
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {total} events'))
+        if options['purge_days'] is not None:
+            purged = analytics.purge_events(options['purge_days'])
+            self.stdout.write(f'Purged {purged} old events')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import inventory
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Split a hot product\'s stock across N counter rows (or merge it back with --shards 0).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('--shards', type=int, required=True)
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shards'] <= 256:
+            raise CommandError('--shards must be between 0 and 256')
+        try:
+            product = Product.objects.get(pk=options['product_id'])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product {options['product_id']} does not exist")
+
+        product = inventory.set_shards(product, options['shards'])
+        mode = f'{product.stock_shards} shards' if product.stock_shards else 'a single row'
+        self.stdout.write(self.style.SUCCESS(f'{product} now holds {product.stock} units in {mode}'))
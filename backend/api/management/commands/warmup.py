@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import warmup
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the worker warm-up steps (api/warmup.py) in this process and report how long each took. '
+        'Run after a deploy, this pulls the home-page queries into Postgres\' buffers and fails if a '
+        'warm-up page errors. Each worker still warms its own process when WARMUP_ON_STARTUP is set.'
+    )
+    # System checks import the URLconf, which is part of what is measured.
+    requires_system_checks = []
+
+    def handle(self, *args, **options):
+        state = warmup.run()
+        for name, ms in state['steps'].items():
+            error = state['errors'].get(name)
+            line = f'{name:<12} {ms:8.1f} ms'
+            self.stdout.write(self.style.ERROR(f'{line}  {error}') if error else line)
+        if state['errors']:
+            raise CommandError(f'Warm-up failed: {", ".join(state["errors"])}')
+        self.stdout.write(self.style.SUCCESS(f'Warmed up in {sum(state["steps"].values()):.1f} ms'))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, and avoids
+    # locking auth_user against logins while the index builds.
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0018_stock_shards'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS api_auth_user_email_idx ON auth_user (email);',
+            'DROP INDEX CONCURRENTLY IF EXISTS api_auth_user_email_idx;',
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_auth_user_email_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsCursor',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnalyticsEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('cart_add', 'Added to cart'), ('cart_remove', 'Removed from cart'), ('stock_change', 'Stock changed')], max_length=12)),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('category', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.category')),
+                ('product', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('units_added', models.PositiveIntegerField(default=0)),
+                ('units_removed', models.PositiveIntegerField(default=0)),
+                ('stock_delta', models.IntegerField(default=0)),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'category'), name='unique_category_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('units_added', models.PositiveIntegerField(default=0)),
+                ('units_removed', models.PositiveIntegerField(default=0)),
+                ('stock_delta', models.IntegerField(default=0)),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'period', 'bucket'], name='product_rollup_product_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'product'), name='unique_product_rollup')],
+            },
+        ),
+    ]
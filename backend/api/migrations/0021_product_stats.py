@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def create_stats_rows(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    ProductStats = apps.get_model('api', 'ProductStats')
+    now = timezone.now()
+    batch = []
+    for pk in Product.objects.values_list('pk', flat=True).iterator(chunk_size=5000):
+        batch.append(ProductStats(product_id=pk, updated_at=now))
+        if len(batch) >= 5000:
+            ProductStats.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ProductStats.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_analytics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.product')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('cart_adds', models.PositiveBigIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-product'], name='product_stats_score_idx')],
+            },
+        ),
+        migrations.RunPython(create_stats_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_pending_file_deletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpecAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('label', models.CharField(blank=True, max_length=100)),
+                ('type', models.CharField(choices=[('text', 'Text'), ('number', 'Number'), ('boolean', 'Boolean')], default='text', max_length=7)),
+                ('unit', models.CharField(blank=True, max_length=10)),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spec_attributes', to='api.category')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductSpecValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.FloatField(blank=True, null=True)),
+                ('text', models.CharField(blank=True, max_length=255)),
+                ('key', models.CharField(blank=True, max_length=64)),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='spec_values', to='api.product')),
+                ('attribute', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.RESTRICT, related_name='values', to='api.specattribute')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='specattribute',
+            constraint=models.UniqueConstraint(fields=('category', 'name'), name='unique_category_spec_attribute'),
+        ),
+        migrations.AddIndex(
+            model_name='productspecvalue',
+            index=models.Index(condition=models.Q(('number__isnull', False)), fields=['attribute', 'number', 'product'], name='spec_value_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productspecvalue',
+            index=models.Index(condition=models.Q(('number__isnull', True)), fields=['attribute', 'text'], name='spec_value_text_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productspecvalue',
+            constraint=models.UniqueConstraint(fields=('product', 'attribute'), name='unique_product_spec_value'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:04
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def one_default_per_user(apps, schema_editor):
+    # Keep the newest of several defaults; users with addresses but no
+    # default get the lowest-id one, which checkout used to fall back to.
+    Address = apps.get_model('api', 'Address')
+    duplicates = (
+        Address.objects.filter(is_default=True).values('user_id')
+        .annotate(rows=Count('id'), keep=Max('id')).filter(rows__gt=1)
+    )
+    for group in duplicates:
+        Address.objects.filter(user_id=group['user_id'], is_default=True).exclude(pk=group['keep']).update(is_default=False)
+    missing = (
+        Address.objects.exclude(user_id__in=Address.objects.filter(is_default=True).values('user_id'))
+        .values('user_id').annotate(first=Min('id')).values_list('first', flat=True)
+    )
+    Address.objects.filter(pk__in=list(missing)).update(is_default=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_spec_schemas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(one_default_per_user, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='address',
+            name='address_user_default_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='address',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('user',), name='unique_default_address'),
+        ),
+    ]
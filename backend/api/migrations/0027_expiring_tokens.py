@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:07
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def copy_authtoken_tokens(apps, schema_editor):
+    # rest_framework.authtoken is no longer installed; carry its keys over
+    # so signed-in users stay signed in. The old table is left in place.
+    connection = schema_editor.connection
+    if 'authtoken_token' not in connection.introspection.table_names():
+        return
+    AuthToken = apps.get_model('api', 'AuthToken')
+    expires_at = timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL_SECONDS)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT key, user_id FROM authtoken_token')
+        rows = cursor.fetchall()
+    AuthToken.objects.bulk_create(
+        [AuthToken(key=key, user_id=user_id, expires_at=expires_at) for key, user_id in rows],
+        batch_size=5000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_unique_default_address'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(copy_authtoken_tokens, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,9 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.postgres.indexes import OpClass
 from django.db import models
+from django.db.models.functions import Cast, Upper
 from django.contrib.auth.models import User
 
 class Profile(models.Model):
@@ -9,18 +14,42 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone = models.CharField(max_length=15, blank=True)
     role = models.CharField(max_length=5, choices=ROLE_CHOICES, default='user')
+    # Bumped to revoke every AuthToken of the user at once.
+    token_version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.user.username
 
-class Category(models.Model):
+class LoadedNameMixin:
+    """
+    Remembers the name an instance was loaded with, so the typeahead
+    signals (api/signals.py) can skip saves that leave it unchanged.
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
+    def name_changed(self):
+        """
+        Whether the name differs from the one last loaded or saved; marks
+        the current name as saved.
+        """
+        if 'name' in self.get_deferred_fields():
+            return False
+        changed = self.name != getattr(self, '_loaded_name', None)
+        self._loaded_name = self.name
+        return changed
+
+class Category(LoadedNameMixin, models.Model):
     name = models.CharField(max_length=255, unique=True)
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
 
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+class Product(LoadedNameMixin, models.Model):
     name = models.CharField(max_length=255)
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -28,8 +57,29 @@ class Product(models.Model):
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     specifications = models.JSONField(default=dict)
     stock = models.PositiveIntegerField(default=0)
+    # When > 0, stock is held in this many ProductStockShard rows and
+    # `stock` is only a snapshot; see api/inventory.py.
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0.00, null=True, blank=True)
     price_after_discount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock'], name='product_stock_idx'),
+            models.Index(fields=['discount'], name='product_discount_idx'),
+            # Category listings ordered by price, all and in-stock only.
+            models.Index(fields=['category', 'price_after_discount', 'id'], name='product_category_price_idx'),
+            models.Index(
+                fields=['category', 'price_after_discount', 'id'], condition=models.Q(stock__gt=0),
+                name='product_in_stock_idx',
+            ),
+            # Serves case-insensitive prefix searches (name__istartswith).
+            models.Index(
+                OpClass(Upper(Cast('name', output_field=models.TextField())), name='text_pattern_ops'),
+                name='product_name_search_idx',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if self.discount is not None and self.price is not None:
@@ -37,11 +87,130 @@ class Product(models.Model):
             self.price_after_discount = self.price - discount_amount
         else:
             self.price_after_discount = self.price
+        # Partial saves (e.g. stock changes) must still bump updated_at so
+        # incremental exports pick them up.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'updated_at']
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+class SpecAttribute(models.Model):
+    # A typed specification in a category's schema; see api/specs.py.
+    TEXT = 'text'
+    NUMBER = 'number'
+    BOOLEAN = 'boolean'
+    TYPE_CHOICES = (
+        (TEXT, 'Text'),
+        (NUMBER, 'Number'),
+        (BOOLEAN, 'Boolean'),
+    )
+    category = models.ForeignKey(Category, related_name='spec_attributes', on_delete=models.CASCADE)
+    # Key in Product.specifications, e.g. "ram". Differently spelled keys
+    # with the same canonical form ("RAM", "memory") map onto it too.
+    name = models.CharField(max_length=64)
+    label = models.CharField(max_length=100, blank=True)
+    type = models.CharField(max_length=7, choices=TYPE_CHOICES, default=TEXT)
+    # Canonical unit of numbers ("GB", "GHz", "inches"), blank if unitless.
+    unit = models.CharField(max_length=10, blank=True)
+    position = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'name'], name='unique_category_spec_attribute'),
+        ]
+
+    def __str__(self):
+        return f"{self.category_id}: {self.name}"
+
+class ProductSpecValue(models.Model):
+    # A specification stored as a typed row instead of in the product's JSON.
+    product = models.ForeignKey(Product, related_name='spec_values', on_delete=models.CASCADE, db_index=False)
+    attribute = models.ForeignKey(SpecAttribute, related_name='values', on_delete=models.RESTRICT, db_index=False)
+    # Numbers and booleans (1/0).
+    number = models.FloatField(null=True, blank=True)
+    # Text values, or the original wording of a number when it does not
+    # render back from number and unit ("16GB unified memory").
+    text = models.CharField(max_length=255, blank=True)
+    # The product's own key when it is not attribute.name ("RAM" for "ram").
+    key = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'attribute'], name='unique_product_spec_value'),
+        ]
+        indexes = [
+            # Range filters: ?spec.memory__gte=16.
+            models.Index(
+                fields=['attribute', 'number', 'product'], condition=models.Q(number__isnull=False),
+                name='spec_value_number_idx',
+            ),
+            models.Index(
+                fields=['attribute', 'text'], condition=models.Q(number__isnull=True),
+                name='spec_value_text_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.attribute_id}: {self.number if self.number is not None else self.text}"
+
+class ProductStockShard(models.Model):
+    product = models.ForeignKey(Product, related_name='stock_shard_rows', on_delete=models.CASCADE, db_index=False)
+    shard = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='unique_product_stock_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} shard {self.shard}: {self.stock}"
+
+class RelatedProduct(models.Model):
+    # Precomputed by the compute_related_products command.
+    product = models.ForeignKey(Product, related_name='related_products', on_delete=models.CASCADE, db_index=False)
+    related = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_related_product_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.related_id} related to {self.product_id} (#{self.rank})"
+
+class SimilarityState(models.Model):
+    # Fingerprint of the features last used for a product's neighbours, so
+    # incremental runs only recompute products whose features changed.
+    product = models.OneToOneField(Product, primary_key=True, related_name='+', on_delete=models.CASCADE)
+    signature = models.CharField(max_length=16)
+
+    def __str__(self):
+        return f"Similarity state for {self.product_id}"
+
+class ProductStats(models.Model):
+    # Popularity counters, written in batches by api/popularity.py. Every
+    # product has a row (created with the product) so ?ordering=popular can
+    # walk the score index with an inner join.
+    product = models.OneToOneField(Product, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    views = models.PositiveBigIntegerField(default=0)
+    cart_adds = models.PositiveBigIntegerField(default=0)
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-product'], name='product_stats_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"Stats for {self.product_id}: {self.score}"
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -55,6 +224,12 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # add_item relies on get_or_create finding at most one row.
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} of {self.product.name} in {self.cart.user.username}'s cart"
 
@@ -70,12 +245,162 @@ class Address(models.Model):
     country = models.CharField(max_length=255, default='India')
     is_default = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            # At most one default per user; also serves the default lookup.
+            models.UniqueConstraint(fields=['user'], condition=models.Q(is_default=True), name='unique_default_address'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.address}, {self.city}"
 
+class AuthToken(models.Model):
+    # API token with a sliding expiry; see api/authentication.py. Only
+    # valid while `version` matches the owner's Profile.token_version.
+    key = models.CharField(max_length=40, primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='auth_tokens')
+    version = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Token for {self.user_id}"
+
 class Advertisement(models.Model):
     image = models.ImageField(upload_to='advertisements/')
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Advertisement {self.id}"
\ No newline at end of file
+        return f"Advertisement {self.id}"
+
+class ChunkedUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chunked_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @property
+    def temp_path(self):
+        return settings.CHUNKED_UPLOAD_DIR / f"{self.id}.part"
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.size} bytes)"
+
+class AnalyticsEvent(models.Model):
+    # Append-only; written in batches by api/analytics.py and folded into
+    # the rollup tables by the rollup_analytics command. Product and
+    # category are plain references so deleting a product does not have to
+    # touch the history.
+    CART_ADD = 'cart_add'
+    CART_REMOVE = 'cart_remove'
+    STOCK_CHANGE = 'stock_change'
+    KIND_CHOICES = (
+        (CART_ADD, 'Added to cart'),
+        (CART_REMOVE, 'Removed from cart'),
+        (STOCK_CHANGE, 'Stock changed'),
+    )
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False)
+    category = models.ForeignKey(Category, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True)
+    # Units added or removed; signed for stock changes.
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity} of product {self.product_id}"
+
+class AnalyticsRollup(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    PERIOD_CHOICES = (
+        (HOUR, 'Hourly'),
+        (DAY, 'Daily'),
+    )
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    units_added = models.PositiveIntegerField(default=0)
+    units_removed = models.PositiveIntegerField(default=0)
+    stock_delta = models.IntegerField(default=0)
+    events = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class ProductRollup(AnalyticsRollup):
+    product = models.ForeignKey(Product, related_name='rollups', on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'product'], name='unique_product_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'period', 'bucket'], name='product_rollup_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"Product {self.product_id} {self.period} {self.bucket:%Y-%m-%d %H:%M}"
+
+class CategoryRollup(AnalyticsRollup):
+    category = models.ForeignKey(Category, related_name='rollups', on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'category'], name='unique_category_rollup'),
+        ]
+
+    def __str__(self):
+        return f"Category {self.category_id} {self.period} {self.bucket:%Y-%m-%d %H:%M}"
+
+class AnalyticsCursor(models.Model):
+    # Id of the last AnalyticsEvent folded into the rollups.
+    name = models.CharField(max_length=50, primary_key=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at event {self.last_event_id}"
+
+class RequestProfile(models.Model):
+    # One profiled request; see api/profiling.py. The raw cProfile dump is
+    # kept under PROFILE_ROOT, outside MEDIA_ROOT.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    trigger = models.CharField(max_length=10)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    view = models.CharField(max_length=255, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    sql_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+    summary = models.JSONField(default=dict)
+
+    @property
+    def stats_path(self):
+        return settings.PROFILE_ROOT / f"{self.id}.prof"
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+class PendingFileDeletion(models.Model):
+    # Storage names let go of by deleted rows, removed later by the
+    # process_file_deletions command if nothing references them any more.
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+class ProductDeletion(models.Model):
+    # Tombstones for deleted products, so incremental catalog exports
+    # (?updated_since=) can tell consumers to drop them.
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Product {self.product_id} deleted"
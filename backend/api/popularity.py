@@ -0,0 +1,88 @@
+"""
+Write-behind popularity counters.
+
+Product views and add-to-cart actions are counted in process memory and
+written to ``ProductStats`` every ``POPULARITY_FLUSH_SECONDS`` (or once
+``POPULARITY_BUFFER_SIZE`` products are pending) in a few set-based
+``UPDATE ... SET views = views + CASE product_id WHEN ... END``
+statements, whatever the traffic. ``CounterBuffer`` is a write-behind
+buffer (api/buffers.py), so counts still in memory when a worker is killed
+are lost.
+
+``score`` is ``views + POPULARITY_CART_ADD_WEIGHT * cart_adds`` and backs
+``?ordering=popular`` on the product list.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import BigIntegerField, Case, F, Value, When
+from django.utils import timezone
+
+from .buffers import WriteBehindBuffer
+from .models import Product, ProductStats
+
+UPDATE_BATCH_SIZE = 500
+
+
+class CounterBuffer(WriteBehindBuffer):
+    size_setting = 'POPULARITY_BUFFER_SIZE'
+    seconds_setting = 'POPULARITY_FLUSH_SECONDS'
+    description = 'products with popularity counts'
+
+    def __init__(self):
+        super().__init__()
+        self._views = Counter()
+        self._cart_adds = Counter()
+
+    def collect(self, product_id, views=0, cart_adds=0):
+        if views:
+            self._views[product_id] += views
+        if cart_adds:
+            self._cart_adds[product_id] += cart_adds
+
+    def pending_count(self):
+        return len(self._views.keys() | self._cart_adds.keys())
+
+    def take(self):
+        pending = self._views, self._cart_adds
+        self._views, self._cart_adds = Counter(), Counter()
+        return pending
+
+    def write(self, pending):
+        views, cart_adds = pending
+        product_ids = sorted(views.keys() | cart_adds.keys())
+        for start in range(0, len(product_ids), UPDATE_BATCH_SIZE):
+            write_counts(product_ids[start:start + UPDATE_BATCH_SIZE], views, cart_adds)
+
+
+def _delta(counts, product_ids):
+    whens = [When(product_id=product_id, then=Value(counts[product_id])) for product_id in product_ids if counts[product_id]]
+    if not whens:
+        return Value(0)
+    return Case(*whens, default=Value(0), output_field=BigIntegerField())
+
+
+def write_counts(product_ids, views, cart_adds):
+    # Rows normally exist already; this covers products created before the
+    # stats table. Deleted products are skipped.
+    live = list(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    ProductStats.objects.bulk_create([ProductStats(product_id=pk) for pk in live], ignore_conflicts=True)
+    view_delta = _delta(views, live)
+    cart_delta = _delta(cart_adds, live)
+    ProductStats.objects.filter(product_id__in=live).update(
+        views=F('views') + view_delta,
+        cart_adds=F('cart_adds') + cart_delta,
+        score=F('views') + view_delta + settings.POPULARITY_CART_ADD_WEIGHT * (F('cart_adds') + cart_delta),
+        updated_at=timezone.now(),
+    )
+
+
+buffer = CounterBuffer()
+
+
+def count_view(product_id):
+    buffer.add(product_id, views=1)
+
+
+def count_cart_add(product_id):
+    buffer.add(product_id, cart_adds=1)
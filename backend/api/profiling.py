@@ -0,0 +1,178 @@
+"""
+On-demand request profiling.
+
+With ``REQUEST_PROFILING`` off, ``ProfilingMiddleware`` raises
+``MiddlewareNotUsed`` and is dropped from the stack, so it costs nothing.
+With it on, a request is profiled when an admin sends the
+``X-Profile`` header, or by sampling at ``PROFILING_SAMPLE_RATE``.
+Unprofiled requests pay one header lookup and one ``random()``. At most
+one request per process is profiled at a time, which bounds the overhead
+however high the sampling rate is set.
+
+A profiled request runs under cProfile with every SQL statement
+timestamped through ``execute_wrapper``. The result is a
+``RequestProfile`` row holding the top-N functions, the SQL timeline and
+the time spent in serializers, plus the raw pstats dump under
+``PROFILE_ROOT`` for snakeviz or ``python -m pstats``.
+"""
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import RequestProfile
+from .permissions import IsAdminRole
+
+SERIALIZER_METHODS = {'data', 'to_representation', 'to_internal_value', 'is_valid', 'save', 'create', 'update'}
+
+
+class SQLTimeline:
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+        self.count = 0
+        self.total_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.total_ms += duration
+            if len(self.queries) < settings.PROFILING_MAX_QUERIES:
+                self.queries.append({
+                    'at_ms': round((start - self.started) * 1000, 2),
+                    'ms': round(duration, 2),
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                })
+
+
+def requesting_admin(request):
+    # Runs before the view, so authenticate the way DRF will.
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        if IsAdminRole().has_permission(drf_request, None):
+            return drf_request.user
+    except APIException:
+        pass
+    return None
+
+
+def _label(func):
+    filename, line, name = func
+    if 'site-packages' + os.sep in filename:
+        filename = filename.rsplit('site-packages' + os.sep, 1)[1]
+    elif filename.startswith(str(settings.BASE_DIR)):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    return f'{filename}:{line}({name})'
+
+
+def summarize(stats):
+    rows = []
+    serializers = []
+    for func, (calls, _, tottime, cumtime, _) in stats.stats.items():
+        row = {'function': _label(func), 'calls': calls, 'tottime_ms': round(tottime * 1000, 2), 'cumtime_ms': round(cumtime * 1000, 2)}
+        rows.append(row)
+        if func[0].endswith('serializers.py') and func[2] in SERIALIZER_METHODS:
+            serializers.append(row)
+    top = settings.PROFILING_TOP_N
+    return {
+        'top_cumulative': sorted(rows, key=lambda row: row['cumtime_ms'], reverse=True)[:top],
+        'top_own_time': sorted(rows, key=lambda row: row['tottime_ms'], reverse=True)[:top],
+        'serializers': sorted(serializers, key=lambda row: row['cumtime_ms'], reverse=True)[:top],
+    }
+
+
+def prune():
+    stale = RequestProfile.objects.order_by('-created_at')[settings.PROFILING_MAX_STORED:]
+    for profile in stale:
+        delete_profile(profile)
+
+
+def delete_profile(profile):
+    try:
+        os.remove(profile.stats_path)
+    except FileNotFoundError:
+        pass
+    profile.delete()
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._busy = threading.Lock()
+
+    def __call__(self, request):
+        trigger, user = None, None
+        if request.META.get(settings.PROFILING_HEADER):
+            user = requesting_admin(request)
+            if user is not None:
+                trigger = 'header'
+        if trigger is None and random.random() < settings.PROFILING_SAMPLE_RATE:
+            trigger = 'sample'
+        if trigger is None or not self._busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, trigger, user)
+        finally:
+            self._busy.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        cls = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None) or {}
+        if cls is not None:
+            action = actions.get(request.method.lower())
+            request.profiled_view = f'{cls.__name__}.{action}' if action else cls.__name__
+        else:
+            request.profiled_view = f'{view_func.__module__}.{view_func.__qualname__}'
+
+    def profile(self, request, trigger, user):
+        started = time.perf_counter()
+        timeline = SQLTimeline(started)
+        profile = cProfile.Profile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timeline))
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+        # Streaming bodies are produced after this point and not profiled.
+        duration = (time.perf_counter() - started) * 1000
+
+        stats = pstats.Stats(profile)
+        summary = summarize(stats)
+        summary['sql'] = timeline.queries
+        record = RequestProfile.objects.create(
+            user=user,
+            trigger=trigger,
+            method=request.method,
+            path=request.path[:255],
+            view=getattr(request, 'profiled_view', '')[:255],
+            status_code=response.status_code,
+            duration_ms=round(duration, 2),
+            sql_count=timeline.count,
+            sql_ms=round(timeline.total_ms, 2),
+            summary=summary,
+        )
+        settings.PROFILE_ROOT.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(record.stats_path)
+        prune()
+        response['X-Profile-Id'] = str(record.id)
+        return response
@@ -0,0 +1,115 @@
+"""
+Registry of hot queries and the tables each must reach through an index.
+
+``check_query_plans`` seeds a dataset, runs ``EXPLAIN`` on every entry
+and fails when a plan touches one of the listed tables with a sequential
+scan. Add an entry here when a view gains a query that runs on every
+request, and keep the query in step with the view it mirrors.
+"""
+import json
+
+from django.db.models import Q
+
+from .models import Address, AuthToken, CartItem, Product, ProductSpecValue, RelatedProduct
+
+# name -> (tables that must not be seq-scanned, queryset builder)
+HOT_QUERIES = {
+    # CartViewSet.add_item: get_or_create on unique_cart_product.
+    'cart_item_lookup': (
+        {'api_cartitem'},
+        lambda f: CartItem.objects.filter(cart_id=f['cart'], product_id=f['product']),
+    ),
+    # CartItemViewSet.get_queryset.
+    'cart_items_for_user': (
+        {'api_cartitem', 'api_cart'},
+        lambda f: CartItem.objects.filter(cart__user_id=f['user']),
+    ),
+    # AddressViewSet.get_queryset.
+    'addresses_for_user': (
+        {'api_address'},
+        lambda f: Address.objects.filter(user_id=f['user']),
+    ),
+    # AddressViewSet.default on a cache miss (unique_default_address).
+    'default_address': (
+        {'api_address'},
+        lambda f: Address.objects.filter(user_id=f['user'], is_default=True).order_by('pk')[:1],
+    ),
+    # ProductViewSet.list with ?category=&ordering=price.
+    'category_by_price': (
+        {'api_product'},
+        lambda f: Product.objects.filter(category_id=f['category']).order_by('price_after_discount', 'id'),
+    ),
+    # ProductViewSet.list with ?category=&in_stock=1&ordering=-price.
+    'category_in_stock_by_price': (
+        {'api_product'},
+        lambda f: Product.objects.filter(category_id=f['category'], stock__gt=0).order_by('-price_after_discount', '-id'),
+    ),
+    # Best sellers: the head of ProductViewSet.list with ?ordering=popular.
+    'popular_head': (
+        {'api_product', 'api_productstats'},
+        lambda f: Product.objects.filter(stats__isnull=False).order_by('-stats__score', '-id')[:24],
+    ),
+    # ProductViewSet.related.
+    'related_products': (
+        {'api_relatedproduct'},
+        lambda f: RelatedProduct.objects.filter(product_id=f['product']).order_by('rank'),
+    ),
+    # ProductViewSet.list with ?spec.<key>__gte= (specs.filter_products).
+    # Joining the matches back to api_product may rightly hash a small table.
+    'spec_range': (
+        {'api_productspecvalue'},
+        lambda f: Product.objects.filter(
+            pk__in=ProductSpecValue.objects.filter(attribute_id__in=[f['attribute']], number__gte=64).values('product_id'),
+        ),
+    ),
+    # ProductViewSet.list with ?spec.<key>=<text> (specs.filter_products).
+    'spec_text': (
+        {'api_productspecvalue'},
+        lambda f: Product.objects.filter(
+            pk__in=ProductSpecValue.objects.filter(
+                Q(attribute_id__in=[f['text_attribute']], number__isnull=True, text='i7'),
+            ).values('product_id'),
+        ),
+    ),
+    # Every product serialization: prefetch of typed specifications.
+    'spec_values_for_products': (
+        {'api_productspecvalue'},
+        lambda f: ProductSpecValue.objects.filter(product_id__in=f['products']).select_related('attribute'),
+    ),
+    # manage.py purge_tokens: one batch of expired tokens.
+    'expired_tokens': (
+        {'api_authtoken'},
+        lambda f: AuthToken.objects.filter(expires_at__lt=f['updated_since']).order_by('expires_at').values('pk')[:1000],
+    ),
+    # Incremental export (?updated_since=).
+    'export_updated_since': (
+        {'api_product'},
+        lambda f: Product.objects.filter(updated_at__gte=f['updated_since']).order_by('pk'),
+    ),
+    # Admin changelist "low stock" filter.
+    'low_stock': (
+        {'api_product'},
+        lambda f: Product.objects.filter(Q(stock__gt=0) & Q(stock__lt=5)),
+    ),
+}
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def explain(queryset):
+    return json.loads(queryset.explain(format='json'))[0]['Plan']
+
+
+def seq_scanned(plan, tables):
+    return sorted({
+        node['Relation Name'] for node in plan_nodes(plan)
+        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in tables
+    })
+
+
+def indexes_used(plan):
+    return sorted({node['Index Name'] for node in plan_nodes(plan) if 'Index Name' in node})
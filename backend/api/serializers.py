@@ -1,6 +1,10 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Product, Cart, CartItem, Profile, Category, Address, Advertisement
+from .models import Product, Cart, CartItem, Profile, Category, Address, Advertisement, ChunkedUpload, RequestProfile, SpecAttribute
+from . import specs
+from .uploads import IMAGE_EXTENSIONS
+from .inventory import available_stock
 
 class AdvertisementSerializer(serializers.ModelSerializer):
     class Meta:
@@ -43,6 +47,11 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = ('id', 'name', 'image')
 
+class SpecAttributeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SpecAttribute
+        fields = ('id', 'name', 'label', 'type', 'unit', 'position')
+
 class ProductSerializer(serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
@@ -53,8 +62,32 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = ('id', 'name', 'category', 'category_id', 'price', 'description', 'image', 'specifications', 'stock', 'discount', 'price_after_discount')
 
+    def create(self, validated_data):
+        category = validated_data.get('category')
+        values, validated_data['specifications'] = specs.split(
+            validated_data.get('specifications', {}), specs.schema(category.pk if category else None),
+        )
+        product = super().create(validated_data)
+        specs.replace_values({product.pk: values})
+        return product
+
+    def update(self, instance, validated_data):
+        category = validated_data.get('category', instance.category)
+        if 'specifications' not in validated_data and category == instance.category:
+            return super().update(instance, validated_data)
+        # A new category means a new schema, so re-split what is stored.
+        specifications = validated_data.get('specifications', specs.full_specifications(instance))
+        values, validated_data['specifications'] = specs.split(specifications, specs.schema(category.pk if category else None))
+        product = super().update(instance, validated_data)
+        specs.replace_values({product.pk: values})
+        getattr(product, '_prefetched_objects_cache', {}).pop('spec_values', None)
+        return product
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
+        representation['specifications'] = specs.full_specifications(instance)
+        if instance.stock_shards:
+            representation['stock'] = available_stock(instance)
         if instance.image:
             request = self.context.get('request')
             representation['image'] = request.build_absolute_uri(instance.image.url)
@@ -79,3 +112,34 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ('id', 'user', 'created_at', 'items')
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChunkedUpload
+        fields = ('id', 'filename', 'size', 'sha256', 'offset', 'created_at')
+        read_only_fields = ('offset', 'created_at')
+
+    def validate_filename(self, value):
+        if not value.lower().endswith(IMAGE_EXTENSIONS):
+            raise serializers.ValidationError(f"Only image files are accepted ({', '.join(IMAGE_EXTENSIONS)}).")
+        return value
+
+    def validate_size(self, value):
+        if value > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files larger than {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes are not accepted.")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if len(value) != 64 or any(c not in '0123456789abcdef' for c in value):
+            raise serializers.ValidationError('Expected a hex-encoded SHA-256 digest.')
+        return value
+
+class RequestProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RequestProfile
+        fields = ('id', 'created_at', 'user', 'trigger', 'method', 'path', 'view', 'status_code', 'duration_ms', 'sql_count', 'sql_ms')
+
+class RequestProfileDetailSerializer(RequestProfileSerializer):
+    class Meta(RequestProfileSerializer.Meta):
+        fields = RequestProfileSerializer.Meta.fields + ('summary',)
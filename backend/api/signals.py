@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .events import publish_product
+from .models import Category, Product, ProductDeletion, ProductStats
+from .typeahead import typeahead
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    # Every index update bumps the shared version, and each bump makes all
+    # other workers rebuild, so only renames and new rows update it.
+    if (update_fields is None or 'name' in update_fields) and instance.name_changed():
+        transaction.on_commit(lambda: typeahead.update('products', instance.pk, instance.name))
+
+
+@receiver(post_save, sender=Product)
+def product_created(sender, instance, created=False, **kwargs):
+    # Fixtures (raw saves) included: ?ordering=popular inner-joins the stats
+    # row, so a product without one would drop out of the listing.
+    if created:
+        ProductStats.objects.get_or_create(product=instance)
+
+
+@receiver(post_save, sender=Product)
+def product_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    if not created:
+        transaction.on_commit(lambda: publish_product(instance, update_fields))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    ProductDeletion.objects.create(product_id=pk)
+    transaction.on_commit(lambda: typeahead.update('products', pk))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, update_fields=None, **kwargs):
+    if (update_fields is None or 'name' in update_fields) and instance.name_changed():
+        transaction.on_commit(lambda: typeahead.update('categories', instance.pk, instance.name))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: typeahead.update('categories', pk))
@@ -0,0 +1,222 @@
+"""
+Offline "related products" computation.
+
+Each product is turned into a feature vector built from three blocks:
+hashed ``key=value`` specification tokens, a category one-hot and a
+smoothed log-price band. Vectors are L2-normalised, so the dot product of
+two rows is their cosine similarity. Top-k neighbours are found by
+multiplying a block of query rows against the whole matrix at a time,
+which keeps peak memory at ``block_size * n_products`` scores.
+"""
+import hashlib
+import json
+import math
+
+import numpy as np
+from django.db import transaction
+
+from .models import Product, RelatedProduct, SimilarityState
+from .specs import full_specifications, values_prefetch
+
+SPEC_DIMENSIONS = 128
+PRICE_BANDS = 24
+SPEC_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.7
+PRICE_WEIGHT = 0.5
+
+
+def _spec_tokens(specifications):
+    if not isinstance(specifications, dict):
+        return []
+    return [
+        f"{str(key).strip().lower()}={str(value).strip().lower()}"
+        for key, value in specifications.items()
+        if value not in (None, '')
+    ]
+
+
+def _token_slot(token):
+    digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % SPEC_DIMENSIONS
+
+
+def _price_band(price):
+    if price is None or price <= 0:
+        return None
+    return min(PRICE_BANDS - 1, int(math.log2(float(price))))
+
+
+def _signature(category_id, band, tokens):
+    payload = json.dumps([category_id, band, sorted(tokens)])
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _normalize_rows(block):
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    block /= norms
+
+
+def build_features():
+    """
+    Return ``(ids, matrix, signatures)`` for the whole catalog, ordered by id.
+    """
+    rows = (
+        Product.objects.order_by('pk')
+        .only('pk', 'category_id', 'price_after_discount', 'price', 'specifications')
+        .prefetch_related(values_prefetch())
+    )
+    count = rows.count()
+    category_ids = sorted(
+        set(Product.objects.exclude(category=None).values_list('category_id', flat=True).distinct())
+    )
+    category_slot = {category_id: i for i, category_id in enumerate(category_ids)}
+
+    ids = np.empty(count, dtype=np.int64)
+    specs = np.zeros((count, SPEC_DIMENSIONS), dtype=np.float32)
+    categories = np.zeros((count, max(1, len(category_ids))), dtype=np.float32)
+    prices = np.zeros((count, PRICE_BANDS), dtype=np.float32)
+    signatures = []
+
+    i = -1
+    for i, product in enumerate(rows.iterator(chunk_size=5000)):
+        if i >= count:
+            break
+        ids[i] = product.pk
+        category_id, discounted, price = product.category_id, product.price_after_discount, product.price
+        tokens = _spec_tokens(full_specifications(product))
+        for token in tokens:
+            specs[i, _token_slot(token)] += 1
+        if category_id in category_slot:
+            categories[i, category_slot[category_id]] = 1
+        band = _price_band(discounted if discounted is not None else price)
+        if band is not None:
+            prices[i, band] = 1
+            if band > 0:
+                prices[i, band - 1] = 0.5
+            if band < PRICE_BANDS - 1:
+                prices[i, band + 1] = 0.5
+        signatures.append(_signature(category_id, band, tokens))
+
+    # Products created while we were reading are picked up by the next run.
+    n = i + 1
+    ids, specs, categories, prices = ids[:n], specs[:n], categories[:n], prices[:n]
+
+    for block, weight in ((specs, SPEC_WEIGHT), (categories, CATEGORY_WEIGHT), (prices, PRICE_WEIGHT)):
+        _normalize_rows(block)
+        block *= weight
+    matrix = np.hstack((specs, categories, prices))
+    _normalize_rows(matrix)
+    return ids, matrix, signatures
+
+
+def changed_rows(ids, signatures):
+    """
+    Boolean mask of products whose stored signature differs from the current
+    one (or which have never been computed). Both sides are walked in id order
+    so the stored signatures never have to be held in memory at once.
+    """
+    changed = np.ones(len(ids), dtype=bool)
+    stored = SimilarityState.objects.order_by('product_id').values_list('product_id', 'signature')
+    position = 0
+    for product_id, signature in stored.iterator(chunk_size=5000):
+        while position < len(ids) and ids[position] < product_id:
+            position += 1
+        if position == len(ids):
+            break
+        if ids[position] == product_id and signatures[position] == signature:
+            changed[position] = False
+    return changed
+
+
+def affected_rows(ids, matrix, changed, k, block_size):
+    """
+    Rows that need recomputing because of the changed products: the changed
+    rows themselves, rows that currently list a changed product as a
+    neighbour, and rows for which a changed product now beats their weakest
+    stored neighbour.
+    """
+    affected = changed.copy()
+    changed_ids = ids[changed]
+
+    for start in range(0, len(changed_ids), 5000):
+        batch = changed_ids[start:start + 5000].tolist()
+        dependents = RelatedProduct.objects.filter(related_id__in=batch).values_list('product_id', flat=True)
+        dependent_ids = np.fromiter(dependents.iterator(), dtype=np.int64)
+        positions = np.searchsorted(ids, dependent_ids)
+        found = positions < len(ids)
+        found[found] = ids[positions[found]] == dependent_ids[found]
+        affected[positions[found]] = True
+
+    # Rows with fewer than k neighbours accept any positive score.
+    floor = np.zeros(len(ids), dtype=np.float32)
+    weakest = RelatedProduct.objects.filter(rank=k - 1).values_list('product_id', 'score')
+    for product_id, score in weakest.iterator(chunk_size=5000):
+        position = np.searchsorted(ids, product_id)
+        if position < len(ids) and ids[position] == product_id:
+            floor[position] = score
+
+    changed_matrix = matrix[changed]
+    if len(changed_matrix):
+        for start in range(0, len(ids), block_size):
+            scores = matrix[start:start + block_size] @ changed_matrix.T
+            best = scores.max(axis=1)
+            affected[start:start + block_size] |= best > floor[start:start + block_size]
+    return affected
+
+
+def top_k(matrix, rows, k):
+    """
+    Indices and scores of the k most similar products for each of ``rows``.
+    """
+    scores = matrix[rows] @ matrix.T
+    scores[np.arange(len(rows)), rows] = -np.inf
+    k = min(k, matrix.shape[0] - 1)
+    if k <= 0:
+        empty = np.empty((len(rows), 0))
+        return empty.astype(np.int64), empty
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def store_neighbors(ids, rows, neighbors, scores, signatures):
+    product_ids = ids[rows].tolist()
+    related = []
+    for product_id, row_neighbors, row_scores in zip(product_ids, neighbors, scores):
+        rank = 0
+        for neighbor, score in zip(row_neighbors, row_scores):
+            if score <= 0:
+                break
+            related.append(RelatedProduct(
+                product_id=product_id, related_id=int(ids[neighbor]), rank=rank, score=float(score),
+            ))
+            rank += 1
+    states = [SimilarityState(product_id=ids[row].item(), signature=signatures[row]) for row in rows]
+
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+        RelatedProduct.objects.bulk_create(related, batch_size=2000)
+        SimilarityState.objects.bulk_create(
+            states, batch_size=2000,
+            update_conflicts=True, unique_fields=['product'], update_fields=['signature'],
+        )
+
+
+def compute_related(k=12, block_size=1024, full=False):
+    """
+    Recompute related products and return ``(recomputed, total)``.
+    """
+    ids, matrix, signatures = build_features()
+    if full:
+        rows = np.arange(len(ids))
+    else:
+        changed = changed_rows(ids, signatures)
+        rows = np.flatnonzero(affected_rows(ids, matrix, changed, k, block_size))
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        neighbors, scores = top_k(matrix, block, k)
+        store_neighbors(ids, block, neighbors, scores, signatures)
+    return len(rows), len(ids)
@@ -0,0 +1,363 @@
+"""
+Typed storage and normalisation of ``Product.specifications``.
+
+Spec keys are entered by hand ("RAM", "memory", "Screen Size"), so they
+are folded onto canonical keys. Values such as "16GB LPDDR5", "1 TB SSD",
+"2400 MHz" or '15.6" FHD' are parsed into a number in a common unit (GB,
+GHz, inches), keeping the original text alongside. Normalised specs are
+cached per product and ``updated_at``, so an edit invalidates them
+without any explicit cache delete.
+
+A category may define a schema of ``SpecAttribute`` rows. Specifications
+whose key maps onto one of them are stored as ``ProductSpecValue`` rows
+(a float for numbers and booleans, text otherwise) instead of in the
+product's JSON, which keeps only the keys the schema does not cover.
+Storage is lossless: ``full_specifications`` renders the typed values back
+to the exact key and value the client sent, keeping the original wording
+in ``text`` only when the number and unit do not reproduce it. Typed
+numbers can be range-filtered through ``spec_value_number_idx``
+(``filter_products``).
+"""
+import operator
+import re
+from collections import defaultdict
+from functools import reduce
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch, Q
+
+from .models import Product, ProductSpecValue, SpecAttribute
+
+# Bump when the parsing rules change so cached results are not reused.
+NORMALIZER_VERSION = 1
+CACHE_TIMEOUT = 24 * 60 * 60
+
+KEY_ALIASES = {
+    'cpu': 'processor',
+    'chip': 'processor',
+    'ram': 'memory',
+    'memory_size': 'memory',
+    'ssd': 'storage',
+    'hdd': 'storage',
+    'storage_size': 'storage',
+    'screen': 'display',
+    'screen_size': 'display',
+    'display_size': 'display',
+    'gpu': 'graphics',
+}
+
+# unit pattern -> (canonical unit, factor)
+UNITS = [
+    (r'tb', 'GB', 1024),
+    (r'gb', 'GB', 1),
+    (r'mb', 'GB', 1 / 1024),
+    (r'ghz', 'GHz', 1),
+    (r'mhz', 'GHz', 1 / 1000),
+    (r'(?:-|\s)?(?:inch(?:es)?|in\b|")', 'inches', 1),
+    (r'cm', 'inches', 1 / 2.54),
+]
+UNIT_RE = [
+    (re.compile(r'(\d+(?:\.\d+)?)\s*' + pattern, re.IGNORECASE), unit, factor)
+    for pattern, unit, factor in UNITS
+]
+
+
+def canonical_key(key):
+    key = re.sub(r'[^a-z0-9]+', '_', str(key).strip().lower()).strip('_')
+    return KEY_ALIASES.get(key, key)
+
+
+def normalize_value(raw):
+    entry = {'raw': raw}
+    if isinstance(raw, bool) or raw is None:
+        return entry
+    if isinstance(raw, (int, float)):
+        entry['value'] = raw
+        return entry
+    text = str(raw)
+    for pattern, unit, factor in UNIT_RE:
+        match = pattern.search(text)
+        if match:
+            entry['value'] = round(float(match.group(1)) * factor, 2)
+            entry['unit'] = unit
+            break
+    return entry
+
+
+def normalize_specs(specifications):
+    if not isinstance(specifications, dict):
+        return {}
+    normalized = {}
+    for key, raw in specifications.items():
+        canonical = canonical_key(key)
+        if canonical and canonical not in normalized:
+            normalized[canonical] = normalize_value(raw)
+    return normalized
+
+
+def _cache_key(product):
+    return f'specs:{NORMALIZER_VERSION}:{product.pk}:{product.updated_at.timestamp()}'
+
+
+def normalized_specs(products):
+    """
+    Return ``{product_id: normalized specs}``, using one ``get_many`` for
+    the cached ones and one ``set_many`` for the rest.
+    """
+    keys = {_cache_key(product): product for product in products}
+    cached = cache.get_many(list(keys))
+    missing = {}
+    result = {}
+    for key, product in keys.items():
+        if key in cached:
+            result[product.pk] = cached[key]
+        else:
+            result[product.pk] = missing[key] = normalize_specs(full_specifications(product))
+    if missing:
+        cache.set_many(missing, CACHE_TIMEOUT)
+    return result
+
+
+def _comparable(entry):
+    if entry is None:
+        return None
+    if 'value' in entry:
+        return (entry['value'], entry.get('unit'))
+    return str(entry['raw']).strip().lower()
+
+
+def compare(products):
+    """
+    Build the spec matrix for ``products``: one row per canonical key, with
+    the values in product order (``None`` where a product lacks the spec),
+    whether they differ, and for numeric rows the ids with the highest value.
+    """
+    specs = normalized_specs(products)
+    keys = []
+    for product in products:
+        keys.extend(key for key in specs[product.pk] if key not in keys)
+
+    rows = []
+    for key in keys:
+        values = [specs[product.pk].get(key) for product in products]
+        comparable = [_comparable(entry) for entry in values]
+        row = {
+            'key': key,
+            'label': key.replace('_', ' ').capitalize(),
+            'values': values,
+            'differs': len(set(comparable)) > 1,
+        }
+        units = {entry.get('unit') for entry in values if entry is not None and 'value' in entry}
+        if len(units) == 1 and all(entry is not None and 'value' in entry for entry in values):
+            row['unit'] = units.pop()
+            if row['differs']:
+                best = max(entry['value'] for entry in values)
+                row['highest'] = [product.pk for product, entry in zip(products, values) if entry['value'] == best]
+        rows.append(row)
+    return rows
+
+
+LEADING_NUMBER_RE = re.compile(r'\s*(-?\d+(?:\.\d+)?)')
+SPEC_PARAM = 'spec.'
+SPEC_LOOKUPS = {'exact', 'gt', 'gte', 'lt', 'lte'}
+
+
+def values_prefetch(lookup='spec_values'):
+    return Prefetch(lookup, queryset=ProductSpecValue.objects.select_related('attribute'))
+
+
+def schemas(category_ids):
+    """
+    Return ``{category_id: {canonical key: SpecAttribute}}`` in one query.
+    """
+    result = defaultdict(dict)
+    for attribute in SpecAttribute.objects.filter(category_id__in=[pk for pk in category_ids if pk is not None]):
+        result[attribute.category_id].setdefault(canonical_key(attribute.name), attribute)
+    return result
+
+
+def schema(category_id):
+    return schemas([category_id]).get(category_id, {})
+
+
+def _number(raw, unit):
+    """
+    The number ``raw`` states in ``unit``, or ``None``.
+    """
+    entry = normalize_value(raw)
+    if 'value' in entry:
+        return entry['value'] if entry['unit'] == unit else None
+    if unit:
+        return None
+    match = LEADING_NUMBER_RE.match(raw)
+    return float(match.group(1)) if match else None
+
+
+def _render(attribute, number):
+    if attribute.type == SpecAttribute.BOOLEAN:
+        return bool(number)
+    text = f'{number:g}'
+    return f'{text} {attribute.unit}' if attribute.unit else text
+
+
+def render(value):
+    if value.number is None or value.text:
+        return value.text
+    return _render(value.attribute, value.number)
+
+
+def _typed(attribute, raw):
+    if attribute.type == SpecAttribute.BOOLEAN:
+        return ProductSpecValue(attribute=attribute, number=float(raw)) if isinstance(raw, bool) else None
+    # Anything else that is not a string (numbers, lists) stays JSON, so it
+    # comes back with its JSON type.
+    if not isinstance(raw, str) or len(raw) > 255:
+        return None
+    if attribute.type == SpecAttribute.TEXT:
+        return ProductSpecValue(attribute=attribute, text=raw)
+    number = _number(raw, attribute.unit)
+    if number is None:
+        return None
+    return ProductSpecValue(attribute=attribute, number=number, text='' if _render(attribute, number) == raw else raw)
+
+
+def split(specifications, schema):
+    """
+    Split ``specifications`` into unsaved ``ProductSpecValue`` rows for the
+    keys ``schema`` can type and a dict of the rest, which stays JSON.
+    """
+    if not isinstance(specifications, dict) or not schema:
+        return [], specifications
+    values, extras, typed = [], {}, set()
+    for key, raw in specifications.items():
+        attribute = schema.get(canonical_key(key))
+        value = None
+        if attribute is not None and attribute.pk not in typed and len(key) <= 64:
+            value = _typed(attribute, raw)
+        if value is None:
+            extras[key] = raw
+            continue
+        value.key = '' if key == attribute.name else key
+        typed.add(attribute.pk)
+        values.append(value)
+    return values, extras
+
+
+def full_specifications(product):
+    """
+    The specifications as the client wrote them: typed values merged back
+    into the JSON. Load products with ``values_prefetch()`` to avoid a
+    query per product.
+    """
+    values = product.spec_values.all()
+    if not values:
+        return product.specifications
+    specifications = {}
+    for value in sorted(values, key=lambda value: (value.attribute.position, value.attribute_id)):
+        specifications[value.key or value.attribute.name] = render(value)
+    if isinstance(product.specifications, dict):
+        specifications.update(product.specifications)
+    return specifications
+
+
+def replace_values(values_by_product):
+    """
+    Make ``{product_id: [ProductSpecValue, ...]}`` the typed values of
+    those products.
+    """
+    ProductSpecValue.objects.filter(product_id__in=list(values_by_product)).delete()
+    rows = []
+    for product_id, values in values_by_product.items():
+        for value in values:
+            value.product_id = product_id
+            rows.append(value)
+    ProductSpecValue.objects.bulk_create(rows, batch_size=1000)
+
+
+def _stored(values):
+    return sorted((value.attribute_id, value.number, value.text, value.key) for value in values)
+
+
+def for_conversion(queryset):
+    return list(queryset.only('pk', 'category_id', 'specifications').prefetch_related(values_prefetch()))
+
+
+def convert(products):
+    """
+    Re-split the specifications of ``products`` (loaded with
+    ``for_conversion``) under their category's current schema, writing
+    only the products whose storage changes. Returns how many changed.
+    What the API shows does not change, so ``updated_at`` is left alone.
+    """
+    category_schemas = schemas({product.category_id for product in products})
+    changed_values, changed_json = {}, []
+    for product in products:
+        current = list(product.spec_values.all())
+        values, extras = split(full_specifications(product), category_schemas.get(product.category_id))
+        if _stored(values) != _stored(current):
+            changed_values[product.pk] = values
+        if extras != product.specifications:
+            product.specifications = extras
+            changed_json.append(product)
+    with transaction.atomic():
+        if changed_values:
+            replace_values(changed_values)
+        # Small batches: each row is matched against every WHEN of the CASE.
+        Product.objects.bulk_update(changed_json, ['specifications'], batch_size=100)
+    return len(set(changed_values) | {product.pk for product in changed_json})
+
+
+def _condition(attributes, lookup, raw):
+    kind, unit = attributes[0].type, attributes[0].unit
+    ids = [attribute.pk for attribute in attributes]
+    if kind == SpecAttribute.TEXT:
+        if lookup != 'exact':
+            return None
+        # number IS NULL matches spec_value_text_idx's condition.
+        return Q(attribute_id__in=ids, number__isnull=True, text=raw)
+    if kind == SpecAttribute.BOOLEAN:
+        if lookup != 'exact' or raw.lower() not in ('1', '0', 'true', 'false'):
+            return None
+        return Q(attribute_id__in=ids, number=float(raw.lower() in ('1', 'true')))
+    try:
+        number = float(raw)
+    except ValueError:
+        number = _number(raw, unit)
+    if number is None:
+        return None
+    return Q(attribute_id__in=ids, **{f'number__{lookup}': number})
+
+
+def filter_products(queryset, params):
+    """
+    Apply ``spec.<key>[__<lookup>]=<value>`` query parameters, e.g.
+    ``spec.memory__gte=16`` or ``spec.memory__gte=1TB``. Each one becomes
+    a semi-join that spec_value_number_idx / spec_value_text_idx serve.
+    Only typed values are searched. Raises ``ValueError`` for a bad filter.
+    """
+    filters = [(param[len(SPEC_PARAM):], raw) for param, raw in params.items() if param.startswith(SPEC_PARAM)]
+    if not filters:
+        return queryset
+    attributes = defaultdict(list)
+    for attribute in SpecAttribute.objects.only('id', 'name', 'type', 'unit'):
+        attributes[canonical_key(attribute.name)].append(attribute)
+
+    for param, raw in filters:
+        name, _, lookup = param.partition('__')
+        lookup = lookup or 'exact'
+        if lookup not in SPEC_LOOKUPS:
+            raise ValueError(f'spec.{name} supports {", ".join(sorted(SPEC_LOOKUPS))}')
+        groups = defaultdict(list)
+        for attribute in attributes.get(canonical_key(name), []):
+            groups[(attribute.type, attribute.unit)].append(attribute)
+        conditions = [_condition(group, lookup, raw) for group in groups.values()]
+        conditions = [condition for condition in conditions if condition is not None]
+        if groups and not conditions:
+            raise ValueError(f'Invalid value for spec.{param}')
+        if not conditions:
+            # No category types this key.
+            queryset = queryset.none()
+            continue
+        queryset = queryset.filter(pk__in=ProductSpecValue.objects.filter(reduce(operator.or_, conditions)).values('product_id'))
+    return queryset
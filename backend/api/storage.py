@@ -0,0 +1,76 @@
+"""
+Content-addressed media storage.
+
+Files are stored under a name derived from the SHA-256 of their contents,
+``<upload_to>/<2 hex>/<32 hex><ext>``. Identical uploads therefore share a
+single file, and a URL never changes its content, so it can be cached
+forever (see ``api.views.serve_media``). Because files are shared, they are never
+deleted when a row lets go of one. The ``gc_media`` command reclaims
+unreferenced files instead. Reusing a stored file refreshes its mtime,
+which keeps it inside ``gc_media``'s grace period.
+"""
+import hashlib
+import os
+import re
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models import FileField
+
+HASHED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{32}(\.[A-Za-z0-9]+)?$')
+
+
+def hashed_name(name, digest):
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, digest[:2], f"{digest[:32]}{extension}").replace('\\', '/')
+
+
+def is_hashed_name(name):
+    return bool(HASHED_NAME_RE.search(name))
+
+
+def content_digest(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def touch(path):
+    """
+    Refresh the mtime of a file being reused, so ``gc_media`` treats it as
+    new even if it was an orphan until now.
+    """
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def file_fields():
+    """
+    ``(model, field_name)`` for every file field in the api app.
+    """
+    for model in apps.get_app_config('api').get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, FileField):
+                yield model, field.name
+
+
+class ContentHashedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = hashed_name(name, content_digest(content))
+        if self.exists(name):
+            # Same bytes already stored: reuse the file.
+            touch(self.path(name))
+            return name
+        # If an identical upload wins a race here, Django falls back to a
+        # suffixed name; that costs a duplicate file, never a wrong one.
+        return super().save(name, content, max_length=max_length)
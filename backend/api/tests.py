@@ -1,3 +1,1189 @@
-from django.test import TestCase
+import asyncio
+import errno
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from urllib.parse import urlencode
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail, serializers
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command, load_command_class
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.db.models import Count, F, Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+
+from . import addresses, analytics, checks, events, exports, guest_cart, inventory, popularity, specs, uploads, warmup
+from .admin import EstimatedCountPaginator
+from .profiling import ProfilingMiddleware
+from .throttling import LoginIPThrottle
+from .typeahead import VERSION_KEY, typeahead
+from .models import Address, AnalyticsEvent, AuthToken, Cart, CartItem, Category, ChunkedUpload, PendingFileDeletion, Product, ProductDeletion, ProductStats, ProductStockShard, Profile, RelatedProduct, RequestProfile, SimilarityState, SpecAttribute
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_product(category, name='Product', price='10.00', **fields):
+    return Product.objects.create(
+        name=name, category=category, price=Decimal(price), discount=Decimal('0'),
+        description='', **fields,
+    )
+
+
+def admin_client():
+    user = User.objects.create_user('admin', 'admin@example.com', 'password')
+    Profile.objects.create(user=user, role='admin')
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+class ConnectionStatsTests(TestCase):
+    @override_settings(DB_POOL_MODE='persistent')
+    def test_admins_see_connection_reuse_settings(self):
+        response = admin_client().get('/api/db-stats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['mode'], response.data['vendor'], response.data['connected']), ('persistent', 'postgresql', True))
+        self.assertEqual(response.data['persistent']['health_checks'], connection.settings_dict['CONN_HEALTH_CHECKS'])
+
+    def test_others_are_refused(self):
+        with self.assertLogs('api.permissions', 'WARNING'):
+            self.assertEqual(APIClient().get('/api/db-stats/').status_code, 401)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.category = Category.objects.create(name='Laptops')
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/products/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_product(self):
+        first = make_product(self.category, 'A', stock=3)
+        second = make_product(self.category, 'B')
+
+        rows = [json.loads(line) for line in self.export().splitlines()]
+
+        self.assertEqual([row['id'] for row in rows], [first.pk, second.pk])
+        self.assertEqual((rows[0]['name'], rows[0]['category'], rows[0]['stock'], rows[0]['deleted']), ('A', 'Laptops', 3, False))
+
+    def test_gzip_csv(self):
+        make_product(self.category, 'A')
+
+        response = self.client.get('/api/products/export/?output=csv&gzip=1')
+
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(lines[0].split(','), list(exports.EXPORT_FIELDS))
+        self.assertEqual(len(lines), 2)
+
+    def test_incremental_export_reports_deletions(self):
+        old = make_product(self.category, 'Old')
+        doomed = make_product(self.category, 'Doomed')
+        Product.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        since = timezone.now() - timedelta(hours=1)
+        changed = make_product(self.category, 'Changed')
+        doomed_id = doomed.pk
+        doomed.delete()
+        self.client.post('/api/products/bulk/delete/', {'ids': [old.pk]}, format='json')
+
+        rows = [json.loads(line) for line in self.export(urlencode({'updated_since': since.isoformat()})).splitlines()]
+
+        self.assertEqual([(row['id'], row['deleted']) for row in rows], [(changed.pk, False), (doomed_id, True), (old.pk, True)])
+        self.assertIsNone(rows[1]['name'])
+
+    def test_export_is_for_admins_only(self):
+        with self.assertLogs('api.permissions', 'WARNING'):
+            self.assertEqual(APIClient().get('/api/products/export/').status_code, 401)
+
+
+class CompareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Laptops')
+        self.first = make_product(category, 'A', specifications={'RAM': '16 GB', 'CPU': 'i7', 'Storage': '1 TB'})
+        self.second = make_product(category, 'B', specifications={'memory': '8192 MB', 'processor': 'i7'})
+
+    def compare(self, ids):
+        return self.client.get(f'/api/products/compare/?ids={ids}')
+
+    def test_spec_matrix_aligns_aliases_and_units(self):
+        response = self.compare(f'{self.second.pk},{self.first.pk}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.data['products']], [self.second.pk, self.first.pk])
+        rows = {row['key']: row for row in response.data['specifications']}
+        self.assertEqual([entry['value'] for entry in rows['memory']['values']], [8, 16])
+        self.assertEqual((rows['memory']['unit'], rows['memory']['highest']), ('GB', [self.first.pk]))
+        self.assertFalse(rows['processor']['differs'])
+        self.assertEqual(rows['storage']['values'][0], None)
+
+    def test_product_count_and_unknown_ids(self):
+        self.assertEqual(self.compare(str(self.first.pk)).status_code, 400)
+        self.assertEqual(self.compare('a,b').status_code, 400)
+        response = self.compare(f'{self.first.pk},999999')
+        self.assertEqual((response.status_code, response.data['ids']), (404, [999999]))
+
+
+class BulkDeleteTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.category = Category.objects.create(name='Laptops')
+
+    def test_deletes_products_referenced_through_hidden_relations(self):
+        doomed = make_product(self.category, 'Doomed')
+        kept = make_product(self.category, 'Kept')
+        RelatedProduct.objects.create(product=doomed, related=kept, rank=0, score=1)
+        RelatedProduct.objects.create(product=kept, related=doomed, rank=0, score=1)
+        SimilarityState.objects.create(product=doomed, signature='x')
+
+        response = self.client.post('/api/products/bulk/delete/', {'ids': [doomed.pk]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'deleted': 1})
+        self.assertFalse(Product.objects.filter(pk=doomed.pk).exists())
+        self.assertFalse(RelatedProduct.objects.exists())
+        self.assertFalse(SimilarityState.objects.exists())
+        # Foreign keys are deferred; this is where a dangling row would fail.
+        connection.check_constraints()
+
+    def test_replays_the_side_effects_of_the_skipped_delete_signals(self):
+        product = make_product(self.category, 'Doomed')
+        typeahead.build()
+        version = cache.get(VERSION_KEY, 0)
+
+        self.client.post('/api/products/bulk/delete/', {'ids': [product.pk]}, format='json')
+
+        self.assertEqual(list(ProductDeletion.objects.values_list('product_id', flat=True)), [product.pk])
+        self.assertGreater(cache.get(VERSION_KEY, 0), version)
+
+
+class BulkPatchTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.category = Category.objects.create(name='Laptops')
+
+    def test_price_items_do_not_load_deferred_fields_per_row(self):
+        products = [make_product(self.category, f'P{n}') for n in range(20)]
+        Product.objects.update(discount=Decimal('10'))
+        items = [{'id': product.pk, 'price': '20.00'} for product in products]
+
+        # Savepoint, select, one bulk_update batch, release.
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/products/bulk/patch/', {'items': items}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(Product.objects.values_list('price_after_discount', flat=True)), {Decimal('18.00')})
+
+
+    def test_price_patch_treats_a_null_discount_as_no_discount(self):
+        product = make_product(self.category)
+        Product.objects.filter(pk=product.pk).update(discount=None)
+
+        response = self.client.post(
+            '/api/products/bulk/patch/', {'ids': [product.pk], 'set': {'price': '25.00'}}, format='json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual(product.price_after_discount, Decimal('25.00'))
+
+
+class ShardedStockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = inventory.set_shards(make_product(Category.objects.create(name='Phones'), stock=10), 4)
+
+    def shard_total(self):
+        return ProductStockShard.objects.filter(product=self.product).aggregate(total=Sum('stock'))['total']
+
+    def test_stock_is_spread_over_the_shards(self):
+        self.assertEqual(
+            list(ProductStockShard.objects.filter(product=self.product).order_by('shard').values_list('stock', flat=True)),
+            [3, 3, 2, 2],
+        )
+
+    def test_reservation_larger_than_any_shard_drains_several(self):
+        inventory.reserve(self.product, 7)
+
+        self.assertEqual(self.shard_total(), 3)
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.reserve(self.product, 4)
+        self.assertEqual(self.shard_total(), 3)
+
+    def test_unsharding_keeps_the_total(self):
+        inventory.reserve(self.product, 1)
+
+        product = inventory.set_shards(self.product, 0)
+
+        self.assertEqual((product.stock, inventory.available_stock(product)), (9, 9))
+        self.assertFalse(ProductStockShard.objects.filter(product=self.product).exists())
+
+
+class BulkRestockTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.product = make_product(Category.objects.create(name='Phones'), stock=10)
+        self.product = inventory.set_shards(self.product, 4)
+
+    def test_sharded_restock_keeps_reservations_made_after_the_total_was_cached(self):
+        self.assertEqual(inventory.available_stock(self.product), 10)
+        inventory.reserve(self.product, 2)
+
+        response = self.client.post('/api/products/bulk/restock/', {'ids': [self.product.pk], 'quantity': 5}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ProductStockShard.objects.filter(product=self.product).aggregate(total=Sum('stock'))['total'], 13)
+
+    @override_settings(BULK_PUBLISH_LIMIT=0)
+    def test_large_sharded_restock_publishes_no_events(self):
+        with mock.patch('api.inventory.get_broadcaster') as get_broadcaster, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/products/bulk/restock/', {'ids': [self.product.pk], 'quantity': 5}, format='json')
+
+        get_broadcaster.return_value.publish.assert_not_called()
+
+
+class MediaReuseTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        overrides = override_settings(MEDIA_ROOT=self.media_root, CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'tmp'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.category = Category.objects.create(name='Phones')
+
+    def test_reusing_an_old_orphan_refreshes_its_mtime(self):
+        name = default_storage.save('products/a.png', ContentFile(b'same bytes'))
+        path = default_storage.path(name)
+        os.utime(path, (time.time() - 86400, time.time() - 86400))
+
+        self.assertEqual(default_storage.save('products/b.png', ContentFile(b'same bytes')), name)
+
+        self.assertGreater(os.path.getmtime(path), time.time() - 60)
+
+    def test_gc_media_keeps_files_referenced_after_references_were_loaded(self):
+        name = default_storage.save('products/a.png', ContentFile(b'image'))
+        os.utime(default_storage.path(name), (0, 0))
+        product = make_product(self.category)
+        command = load_command_class('api', 'gc_media')
+        load_references = command.load_references
+
+        def load_then_attach(refs, batch_size):
+            # A row takes the file after the references were read.
+            count = load_references(refs, batch_size)
+            Product.objects.filter(pk=product.pk).update(image=name)
+            return count
+
+        command.load_references = load_then_attach
+        call_command(command, grace_minutes=0, stdout=StringIO())
+
+        self.assertTrue(default_storage.exists(name))
+
+
+    def test_process_file_deletions_leaves_recently_used_files(self):
+        recent = default_storage.save('products/a.png', ContentFile(b'recent'))
+        old = default_storage.save('products/b.png', ContentFile(b'old'))
+        os.utime(default_storage.path(old), (0, 0))
+        touched = PendingFileDeletion.objects.create(name=recent)
+        PendingFileDeletion.objects.create(name=old)
+        PendingFileDeletion.objects.update(created_at=timezone.now() - timedelta(days=1))
+        queued_just_now = PendingFileDeletion.objects.create(name=old)
+
+        call_command('process_file_deletions', stdout=StringIO())
+
+        self.assertTrue(default_storage.exists(recent))
+        self.assertFalse(default_storage.exists(old))
+        self.assertEqual(sorted(PendingFileDeletion.objects.values_list('pk', flat=True)), [touched.pk, queued_just_now.pk])
+
+
+class ProductAdminChangelistTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Laptops')
+        self.low = make_product(category, 'Low', stock=2)
+        self.out = make_product(category, 'Out', stock=0)
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'password'))
+
+    def test_low_stock_filter(self):
+        response = self.client.get('/admin/api/product/?stock=low')
+
+        self.assertEqual(list(response.context['cl'].result_list), [self.low])
+
+    def test_large_tables_are_counted_from_estimates(self):
+        with mock.patch.object(EstimatedCountPaginator, 'exact_count_threshold', 0), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/api/product/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'] and 'api_product' in query['sql']])
+        # The list never shows the large text columns.
+        self.assertLessEqual({'description', 'specifications'}, response.context['cl'].result_list[0].get_deferred_fields())
+
+
+class SpecFilterTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Laptops')
+        SpecAttribute.objects.create(category=category, name='processor', type=SpecAttribute.TEXT)
+        SpecAttribute.objects.create(category=category, name='ram', type=SpecAttribute.NUMBER, unit='GB')
+        self.i7 = make_product(category, 'A', specifications={'processor': 'i7', 'ram': '16 GB'})
+        self.i5 = make_product(category, 'B', specifications={'processor': 'i5', 'ram': '8 GB'})
+        specs.convert(specs.for_conversion(Product.objects.all()))
+
+    def ids(self, query):
+        response = self.client.get(f'/api/products/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {product['id'] for product in response.json()}
+
+    def test_text_filter(self):
+        self.assertEqual(self.ids('spec.processor=i7'), {self.i7.pk})
+        self.assertEqual(self.ids('spec.processor=M2'), set())
+
+    def test_number_filter(self):
+        self.assertEqual(self.ids('spec.ram__gte=16'), {self.i7.pk})
+
+    def test_text_values_are_typed(self):
+        self.assertTrue(self.i7.spec_values.filter(attribute__name='processor', number__isnull=True, text='i7').exists())
+
+
+class PopularOrderingTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Phones')
+
+    def popular(self):
+        response = self.client.get('/api/products/?ordering=popular')
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.json()]
+
+    def test_most_popular_first_then_newest(self):
+        viewed, bought, unseen, newest = (make_product(self.category, name) for name in ('A', 'B', 'C', 'D'))
+        popularity.write_counts([viewed.pk, bought.pk], {viewed.pk: 3, bought.pk: 1}, {viewed.pk: 0, bought.pk: 1})
+
+        self.assertEqual(self.popular(), [bought.pk, viewed.pk, newest.pk, unseen.pk])
+
+    def test_products_loaded_from_fixtures_are_listed(self):
+        product = make_product(self.category, 'Loaded')
+        fixture = Path(tempfile.mkdtemp(), 'products.json')
+        self.addCleanup(shutil.rmtree, fixture.parent)
+        fixture.write_text(serializers.serialize('json', [product]))
+        product_id = product.pk
+        product.delete()
+        self.assertFalse(ProductStats.objects.exists())
+
+        call_command('loaddata', fixture, verbosity=0)
+
+        self.assertEqual(self.popular(), [product_id])
+
+
+class SpecAttributeAdminTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Laptops')
+        self.ram = SpecAttribute.objects.create(category=self.category, name='ram', type=SpecAttribute.NUMBER, unit='GB')
+        make_product(self.category, specifications={'ram': '16 GB'})
+        specs.convert(specs.for_conversion(Product.objects.all()))
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'password'))
+
+    def post(self, **row):
+        data = {
+            'name': self.category.name,
+            'spec_attributes-TOTAL_FORMS': '1', 'spec_attributes-INITIAL_FORMS': '1',
+            'spec_attributes-MIN_NUM_FORMS': '0', 'spec_attributes-MAX_NUM_FORMS': '1000',
+            'spec_attributes-0-id': str(self.ram.pk), 'spec_attributes-0-category': str(self.category.pk),
+            'spec_attributes-0-name': 'memory', 'spec_attributes-0-label': 'Memory',
+            'spec_attributes-0-type': SpecAttribute.TEXT, 'spec_attributes-0-unit': 'MB',
+            'spec_attributes-0-position': '0',
+        }
+        data.update({f'spec_attributes-0-{key}': value for key, value in row.items()})
+        return self.client.post(f'/admin/api/category/{self.category.pk}/change/', data)
+
+    def test_rendering_fields_are_fixed_once_values_exist(self):
+        response = self.post()
+
+        self.assertEqual(response.status_code, 302)
+        self.ram.refresh_from_db()
+        self.assertEqual((self.ram.name, self.ram.type, self.ram.unit, self.ram.label), ('ram', SpecAttribute.NUMBER, 'GB', 'Memory'))
+
+    def test_attribute_with_values_cannot_be_deleted(self):
+        response = self.post(DELETE='on')
+
+        self.assertEqual(response.status_code, 200)
+        # The admin's own check for RESTRICT relations turns this into a form error.
+        self.assertContains(response, 'would require deleting the following protected related objects')
+        self.assertTrue(SpecAttribute.objects.filter(pk=self.ram.pk).exists())
+
+
+class TypeaheadTests(TestCase):
+    def test_products_are_ranked_by_popularity(self):
+        category = Category.objects.create(name='Laptops')
+        quiet = make_product(category, 'Dell Inspiron')
+        popular = make_product(category, 'Dell XPS')
+        make_product(category, 'Dell Latitude')
+        ProductStats.objects.filter(product=quiet).update(score=1)
+        ProductStats.objects.filter(product=popular).update(score=50)
+
+        with self.assertNumQueries(2):
+            typeahead.build()
+        names = [item['name'] for item in typeahead.search('dell')['products']]
+
+        self.assertEqual(names, ['Dell XPS', 'Dell Inspiron', 'Dell Latitude'])
+
+
+    def test_only_renames_bump_the_shared_version(self):
+        product = make_product(Category.objects.create(name='Laptops'), 'Dell XPS')
+        product = Product.objects.get(pk=product.pk)
+        version = cache.get(VERSION_KEY, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.stock = 3
+            product.save()
+        self.assertEqual(cache.get(VERSION_KEY, 0), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Dell XPS 13'
+            product.save()
+        self.assertEqual(cache.get(VERSION_KEY, 0), version + 1)
+
+
+class WriteBehindBufferTests(TestCase):
+    def setUp(self):
+        self.product = make_product(Category.objects.create(name='Phones'))
+
+    def test_popularity_counts_are_written_on_flush(self):
+        popularity.count_view(self.product.pk)
+        popularity.count_view(self.product.pk)
+        popularity.count_cart_add(self.product.pk)
+        self.assertEqual(ProductStats.objects.get(product=self.product).views, 0)
+
+        popularity.buffer.flush()
+
+        stats = ProductStats.objects.get(product=self.product)
+        self.assertEqual((stats.views, stats.cart_adds), (2, 1))
+
+    @override_settings(ANALYTICS_BUFFER_SIZE=2)
+    def test_analytics_events_are_written_once_the_buffer_is_full(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            analytics.record(AnalyticsEvent.CART_ADD, self.product, 1)
+        self.assertFalse(AnalyticsEvent.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            analytics.record(AnalyticsEvent.CART_ADD, self.product, 2)
+
+        self.assertEqual(AnalyticsEvent.objects.count(), 2)
+        self.assertEqual(analytics.buffer.pending_count(), 0)
+
+
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        self.phones, self.cases = Category.objects.create(name='Phones'), Category.objects.create(name='Cases')
+        self.phone = make_product(self.phones, 'Phone')
+        self.case = make_product(self.cases, 'Case')
+        self.hour = (timezone.now() - timedelta(days=2)).replace(hour=10, minute=0, second=0, microsecond=0)
+        self.event(AnalyticsEvent.CART_ADD, self.phone, 2, minutes=5)
+        self.event(AnalyticsEvent.CART_REMOVE, self.phone, 1, minutes=30)
+        self.event(AnalyticsEvent.STOCK_CHANGE, self.phone, -4, minutes=40)
+        self.event(AnalyticsEvent.CART_ADD, self.phone, 3, minutes=70)
+        self.event(AnalyticsEvent.CART_ADD, self.case, 1, minutes=10)
+        self.client = admin_client()
+
+    def event(self, kind, product, quantity, minutes=0, created_at=None):
+        AnalyticsEvent.objects.create(
+            kind=kind, product_id=product.pk, category_id=product.category_id, quantity=quantity,
+            created_at=created_at or self.hour + timedelta(minutes=minutes),
+        )
+
+    def rollup(self):
+        call_command('rollup_analytics', stdout=StringIO())
+
+    def get(self, path, **params):
+        return self.client.get(f'/api/analytics/{path}/', {'since': self.hour.replace(hour=0).isoformat(), **params})
+
+    def totals(self, response, key):
+        return {
+            row[key]: (row['units_added'], row['units_removed'], row['stock_delta'], row['events'])
+            for row in response.json()['results']
+        }
+
+    def test_rollup_fills_hour_and_day_buckets(self):
+        self.rollup()
+
+        response = self.get('products', period='hour', product=self.phone.pk)
+
+        self.assertEqual(
+            [(row['units_added'], row['units_removed'], row['stock_delta'], row['events']) for row in response.json()['results']],
+            [(2, 1, -4, 3), (3, 0, 0, 1)],
+        )
+        self.assertEqual(
+            self.totals(self.get('products', period='day'), 'product_id'),
+            {self.phone.pk: (5, 1, -4, 4), self.case.pk: (1, 0, 0, 1)},
+        )
+        self.assertEqual(
+            self.totals(self.get('categories', period='day'), 'category_id'),
+            {self.phones.pk: (5, 1, -4, 4), self.cases.pk: (1, 0, 0, 1)},
+        )
+
+    def test_recent_events_wait_for_the_lag_and_are_counted_once(self):
+        self.event(AnalyticsEvent.CART_ADD, self.phone, 7, created_at=timezone.now())
+        self.rollup()
+        self.rollup()
+
+        self.assertEqual(self.totals(self.get('products', period='day'), 'product_id')[self.phone.pk], (5, 1, -4, 4))
+
+        with override_settings(ANALYTICS_ROLLUP_LAG_SECONDS=0):
+            self.rollup()
+
+        self.assertEqual(self.totals(self.get('products', period='day'), 'product_id')[self.phone.pk], (12, 1, -4, 5))
+
+    def test_products_can_be_filtered_by_category(self):
+        self.rollup()
+
+        response = self.get('products', period='day', category=self.cases.pk)
+
+        self.assertEqual(list(self.totals(response, 'product_id')), [self.case.pk])
+
+    def test_bad_period_or_since_is_rejected(self):
+        for path in ('products', 'categories'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path, period='week').status_code, 400)
+                self.assertEqual(self.get(path, since='yesterday').status_code, 400)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        # The middleware is set up on a client's first request, so the
+        # settings must be in place before the client is made.
+        overrides = override_settings(REQUEST_PROFILING=True, PROFILING_SAMPLE_RATE=0, PROFILE_ROOT=Path(root))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.admin = admin_client()
+        self.product = make_product(Category.objects.create(name='Phones'))
+
+    def test_admin_header_profiles_the_request(self):
+        response = self.admin.get(f'/api/products/{self.product.pk}/', HTTP_X_PROFILE='1')
+
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual((profile.trigger, profile.view, profile.status_code), ('header', 'ProductViewSet.retrieve', 200))
+        self.assertGreater(profile.sql_count, 0)
+        self.assertEqual(len(profile.summary['sql']), profile.sql_count)
+        self.assertTrue(profile.stats_path.exists())
+
+    def test_header_from_others_is_ignored(self):
+        with self.assertLogs('api.permissions', 'WARNING'):
+            response = APIClient().get(f'/api/products/{self.product.pk}/', HTTP_X_PROFILE='1')
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_middleware_is_dropped_when_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+
+@override_settings(WARMUP_ON_STARTUP=True)
+class ReadinessTests(TestCase):
+    def setUp(self):
+        state = {'started_at': None, 'finished_at': None, 'steps': {}, 'errors': {}}
+        patcher = mock.patch.dict(warmup.state, state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_warmup(self):
+        # Like the test client: the pages are rendered through a real WSGI
+        # handler, which would otherwise close the test's connection.
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            warmup.run()
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+
+    def test_not_ready_until_warm_up_has_run(self):
+        self.assertEqual(self.client.get('/api/ready/').status_code, 503)
+
+        self.run_warmup()
+
+        response = self.client.get('/api/ready/')
+        self.assertEqual((response.status_code, response.json()['failed_steps']), (200, []))
+        self.assertEqual(set(response.json()['steps_ms']), {name for name, _ in warmup.STEPS})
+
+    def test_failed_step_is_reported_without_blocking_readiness(self):
+        with mock.patch.object(warmup, 'STEPS', [('cache', mock.Mock(side_effect=RuntimeError('down')))]), \
+                self.assertLogs('api.warmup', 'ERROR'):
+            self.run_warmup()
+
+        response = self.client.get('/api/ready/')
+        self.assertEqual((response.status_code, response.json()['failed_steps']), (200, ['cache']))
+
+    @override_settings(WARMUP_ON_STARTUP=False)
+    def test_always_ready_without_warm_up(self):
+        self.assertEqual(self.client.get('/api/ready/').status_code, 200)
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_queries_use_indexes(self):
+        # Raises CommandError naming any query in api/query_plans.py that
+        # regressed to a sequential scan.
+        call_command('check_query_plans', stdout=StringIO())
+
+        # The seeded rows are rolled back.
+        self.assertFalse(Product.objects.exists())
+
+
+class DefaultAddressTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, **fields):
+        data = {
+            'first_name': 'A', 'last_name': 'B', 'phone': '1', 'address': '1 Street', 'city': 'City',
+            'state': 'State', 'zip_code': '1', 'country': 'India', **fields,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/addresses/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def default_id(self):
+        response = self.client.get('/api/addresses/default/')
+        return response.data['id'] if response.status_code == 200 else None
+
+    def test_first_address_becomes_the_default(self):
+        self.assertIsNone(self.default_id())
+        first = self.create()
+        self.create()
+
+        self.assertEqual(self.default_id(), first)
+
+    def test_set_default_moves_the_default_and_refreshes_the_cache(self):
+        first = self.create()
+        second = self.create()
+        self.assertEqual(self.default_id(), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/addresses/{second}/set_default/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Address.objects.filter(user=self.user, is_default=True).values_list('pk', flat=True)), [second])
+        self.assertEqual(self.default_id(), second)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.default_id(), second)
+
+    def test_deleting_the_default_promotes_the_newest_address(self):
+        first = self.create()
+        self.create()
+        newest = self.create()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/addresses/{first}/')
+
+        self.assertEqual(self.default_id(), newest)
+
+    def test_default_cannot_be_unset(self):
+        first = self.create()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/addresses/{first}/', {'is_default': False}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_default'])
+        self.assertEqual(self.default_id(), first)
+
+    @override_settings(CACHES=LOCMEM, WEB_CONCURRENCY=4)
+    def test_default_is_not_cached_in_a_per_process_cache(self):
+        first = self.create()
+        self.assertEqual(self.default_id(), first)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(addresses.default_address(self.user.pk).pk, first)
+
+    def test_set_default_on_another_users_address_is_not_found(self):
+        other = User.objects.create_user('other')
+        address = Address.objects.create(
+            user=other, first_name='A', last_name='B', phone='1', address='1', city='C', state='S', zip_code='1',
+            is_default=True,
+        )
+
+        response = self.client.post(f'/api/addresses/{address.pk}/set_default/')
+
+        self.assertEqual(response.status_code, 404)
+
+
+class AuthTokenTests(TestCase):
+    def setUp(self):
+        # Login throttles count attempts in the cache.
+        cache.clear()
+        self.user = User.objects.create_user('shopper', 'shopper@example.com', 'password')
+        Profile.objects.create(user=self.user)
+
+    def login(self):
+        response = self.client.post('/api/login/', {'email': 'shopper@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        return response.data['token']
+
+    def get(self, token):
+        return self.client.get('/api/addresses/', HTTP_AUTHORIZATION=f'Token {token}')
+
+    def test_each_login_issues_a_separate_token(self):
+        first, second = self.login(), self.login()
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.get(first).status_code, 200)
+        self.assertEqual(self.get(second).status_code, 200)
+
+    def test_expired_token_is_rejected(self):
+        token = self.login()
+        AuthToken.objects.filter(pk=token).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.get(token)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'Token has expired.')
+
+    @override_settings(AUTH_TOKEN_TTL_SECONDS=3600, AUTH_TOKEN_RENEW_SECONDS=600)
+    def test_token_is_renewed_at_most_once_per_interval(self):
+        token = self.login()
+        AuthToken.objects.filter(pk=token).update(expires_at=timezone.now() + timedelta(seconds=1800))
+
+        self.assertEqual(self.get(token).status_code, 200)
+        expires_at = AuthToken.objects.get(pk=token).expires_at
+        self.assertGreater(expires_at, timezone.now() + timedelta(seconds=3500))
+
+        with self.assertNumQueries(2):
+            # Token lookup and the address list; no renewal write.
+            self.assertEqual(self.get(token).status_code, 200)
+
+    def test_logout_revokes_only_the_current_token(self):
+        token, other = self.login(), self.login()
+
+        response = self.client.post('/api/logout/', HTTP_AUTHORIZATION=f'Token {token}')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get(token).status_code, 401)
+        self.assertEqual(self.get(other).status_code, 200)
+
+    def test_logout_all_revokes_every_token_in_one_write(self):
+        token, other = self.login(), self.login()
+
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/logout-all/', HTTP_AUTHORIZATION=f'Token {token}')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get(token).data['detail'], 'Token has been revoked.')
+        self.assertEqual(self.get(other).status_code, 401)
+        self.assertEqual(self.get(self.login()).status_code, 200)
+
+    def test_purge_tokens_deletes_expired_tokens(self):
+        live, expired = self.login(), self.login()
+        AuthToken.objects.filter(pk=expired).update(expires_at=timezone.now() - timedelta(days=1))
+
+        call_command('purge_tokens', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(list(AuthToken.objects.values_list('pk', flat=True)), [live])
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch.dict(LoginIPThrottle.THROTTLE_RATES, {'login_ip': '2/min'})
+    def test_forwarded_for_does_not_change_the_ip_bucket(self):
+        statuses = [
+            self.client.post(
+                '/api/login/', {'email': f'user{n}@example.com', 'password': 'x'}, HTTP_X_FORWARDED_FOR=f'10.0.0.{n}',
+            ).status_code
+            for n in range(3)
+        ]
+
+        self.assertEqual(statuses[-1], 429)
+
+    def statuses(self, path, bodies, addresses):
+        return [
+            self.client.post(path, body, REMOTE_ADDR=address).status_code
+            for body, address in zip(bodies, addresses)
+        ]
+
+    @mock.patch.dict(LoginIPThrottle.THROTTLE_RATES, {'login_ip': '100/min', 'login_email': '2/min'})
+    def test_login_attempts_per_email_are_limited_across_ips(self):
+        body = {'email': 'Victim@example.com ', 'password': 'x'}
+        addresses = [f'10.0.0.{n}' for n in range(3)]
+
+        self.assertEqual(self.statuses('/api/login/', [body] * 3, addresses), [400, 400, 429])
+        self.assertEqual(self.statuses('/api/login/', [{'email': 'other@example.com', 'password': 'x'}], ['10.0.0.9']), [400])
+
+    @mock.patch.dict(LoginIPThrottle.THROTTLE_RATES, {'signup_ip': '2/hour'})
+    def test_signups_per_ip_are_limited(self):
+        bodies = [{'username': f'user{n}', 'email': f'user{n}@example.com', 'password': 'password'} for n in range(3)]
+
+        self.assertEqual(self.statuses('/api/signup/', bodies, ['10.0.0.1'] * 3), [200, 200, 429])
+        self.assertFalse(User.objects.filter(username='user2').exists())
+
+    @mock.patch.dict(LoginIPThrottle.THROTTLE_RATES, {'otp_ip': '2/hour', 'otp_email': '100/hour'})
+    def test_otp_requests_per_ip_are_limited(self):
+        bodies = [{'email': f'user{n}@example.com'} for n in range(3)]
+
+        self.assertEqual(self.statuses('/api/send-otp/', bodies, ['10.0.0.1'] * 3), [200, 200, 429])
+        self.assertEqual(len(mail.outbox), 2)
+
+    @mock.patch.dict(LoginIPThrottle.THROTTLE_RATES, {'otp_ip': '100/hour', 'otp_email': '2/hour'})
+    def test_otp_requests_per_email_are_limited_across_ips(self):
+        body = {'email': 'user@example.com'}
+
+        self.assertEqual(self.statuses('/api/send-otp/', [body] * 3, ['10.0.0.1', '10.0.0.2', '10.0.0.3']), [200, 200, 429])
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Phones')
+        self.phone = make_product(category, 'Phone', stock=10)
+        self.case = make_product(category, 'Case', stock=5)
+
+    def add_as_guest(self, product, quantity):
+        response = self.client.post(
+            '/api/guest-cart/add_item/', {'product_id': product.pk, 'quantity': quantity}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def assertGuestCartCleared(self, response):
+        cookie = response.cookies[guest_cart.COOKIE_NAME]
+        self.assertEqual((cookie.value, cookie['max-age']), ('', 0))
+        self.assertEqual(self.client.get('/api/guest-cart/').json(), {'items': []})
+
+    def test_login_merges_into_the_existing_cart_and_reserves_stock(self):
+        user = User.objects.create_user('shopper', 'shopper@example.com', 'password')
+        Profile.objects.create(user=user)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.phone, quantity=1, price=self.phone.price)
+        self.add_as_guest(self.phone, 2)
+        self.add_as_guest(self.case, 4)
+        # Sold elsewhere while it sat in the guest cart.
+        Product.objects.filter(pk=self.case.pk).update(stock=3)
+
+        response = self.client.post('/api/login/', {'email': 'shopper@example.com', 'password': 'password'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')), [(self.phone.pk, 3)])
+        self.assertEqual(
+            dict(Product.objects.filter(pk__in=[self.phone.pk, self.case.pk]).values_list('pk', 'stock')),
+            {self.phone.pk: 8, self.case.pk: 3},
+        )
+        self.assertGuestCartCleared(response)
+
+    def test_signup_moves_the_guest_cart_to_the_new_user(self):
+        self.add_as_guest(self.case, 2)
+
+        response = self.client.post('/api/signup/', {'username': 'new', 'email': 'new@example.com', 'password': 'password'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(CartItem.objects.filter(cart__user__username='new').values_list('product_id', 'quantity')),
+            [(self.case.pk, 2)],
+        )
+        self.assertEqual(Product.objects.get(pk=self.case.pk).stock, 3)
+        self.assertGuestCartCleared(response)
+
+    def test_deleted_product_can_be_removed(self):
+        product = self.case
+        self.client.post('/api/guest-cart/add_item/', {'product_id': product.pk, 'quantity': 1}, content_type='application/json')
+        product_id = product.pk
+        product.delete()
+
+        response = self.client.post('/api/guest-cart/remove_item/', {'product_id': product_id}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'items': []})
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    @override_settings(CACHES=LOCMEM, WEB_CONCURRENCY=4)
+    def test_guest_carts_refuse_a_per_process_cache_with_several_workers(self):
+        self.assertEqual([error.id for error in checks.check_guest_cart_cache(None)], ['api.E001'])
+
+    @override_settings(CACHES=LOCMEM, WEB_CONCURRENCY=1)
+    def test_a_single_worker_may_use_a_local_cache(self):
+        self.assertEqual(checks.check_guest_cart_cache(None), [])
+
+
+class RelatedProductsTests(TestCase):
+    def test_related_products_in_rank_order(self):
+        category = Category.objects.create(name='Phones')
+        product, first, second = (make_product(category, name) for name in ('A', 'B', 'C'))
+        RelatedProduct.objects.create(product=product, related=second, rank=1, score=0.5)
+        RelatedProduct.objects.create(product=product, related=first, rank=0, score=0.9)
+
+        response = self.client.get(f'/api/products/{product.pk}/related/')
+
+        self.assertEqual([item['id'] for item in response.json()], [first.pk, second.pk])
+
+    def test_product_without_related_products(self):
+        product = make_product(Category.objects.create(name='Phones'))
+
+        response = self.client.get(f'/api/products/{product.pk}/related/')
+
+        self.assertEqual((response.status_code, response.json()), (200, []))
+
+    def test_unknown_or_malformed_product_is_not_found(self):
+        self.assertEqual(self.client.get('/api/products/999999/related/').status_code, 404)
+        self.assertEqual(self.client.get('/api/products/abc/related/').status_code, 404)
+
+    def test_command_ranks_similar_products_first(self):
+        laptops, phones = Category.objects.create(name='Laptops'), Category.objects.create(name='Phones')
+        laptop = make_product(laptops, 'A', '1000.00', specifications={'processor': 'i7', 'ram': '16 GB'})
+        twin = make_product(laptops, 'B', '1100.00', specifications={'processor': 'i7', 'ram': '16 GB'})
+        budget = make_product(laptops, 'C', '500.00', specifications={'processor': 'i5', 'ram': '8 GB'})
+        make_product(phones, 'D', '1000.00')
+
+        call_command('compute_related_products', k=2, stdout=StringIO())
+
+        related = RelatedProduct.objects.filter(product=laptop).order_by('rank')
+        self.assertEqual([row.related_id for row in related], [twin.pk, budget.pk])
+        self.assertGreater(related[0].score, related[1].score)
+        self.assertFalse(RelatedProduct.objects.filter(product=F('related')).exists())
+        counts = RelatedProduct.objects.values('product').annotate(n=Count('pk')).values_list('n', flat=True)
+        self.assertEqual(sorted(counts), [2, 2, 2, 2])
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        overrides = override_settings(MEDIA_ROOT=os.path.join(root, 'media'), CHUNKED_UPLOAD_DIR=Path(root, 'tmp'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client = admin_client()
+        self.user = User.objects.get(username='admin')
+
+    def test_malformed_upload_id_is_not_found(self):
+        self.assertEqual(self.client.get('/api/uploads/not-a-uuid/').status_code, 404)
+        self.assertEqual(self.client.post('/api/uploads/not-a-uuid/complete/').status_code, 404)
+
+    def test_complete_rejects_malformed_product_id(self):
+        upload = ChunkedUpload.objects.create(user=self.user, filename='a.png', size=10, sha256='0' * 64)
+
+        response = self.client.post(f'/api/uploads/{upload.pk}/complete/', {'product_id': 'abc'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def uploaded(self, content):
+        upload = ChunkedUpload.objects.create(
+            user=self.user, filename='a.png', size=len(content), offset=len(content),
+            sha256=hashlib.sha256(content).hexdigest(),
+        )
+        uploads.start(upload)
+        upload.temp_path.write_bytes(content)
+        return upload
+
+    def complete(self, upload, product):
+        return self.client.post(f'/api/uploads/{upload.pk}/complete/', {'product_id': product.pk})
+
+    def test_complete_rejects_files_that_are_not_images(self):
+        product = make_product(Category.objects.create(name='Phones'))
+        upload = self.uploaded(b'not an image')
+
+        response = self.complete(upload, product)
+
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Upload is not a valid image'))
+        product.refresh_from_db()
+        self.assertFalse(product.image)
+
+    def test_complete_copies_across_filesystems(self):
+        product = make_product(Category.objects.create(name='Phones'))
+        buffer = BytesIO()
+        PILImage.new('RGB', (2, 2)).save(buffer, 'PNG')
+        upload = self.uploaded(buffer.getvalue())
+        replace = os.replace
+
+        def cross_device(source, destination):
+            if source == upload.temp_path:
+                raise OSError(errno.EXDEV, 'Invalid cross-device link')
+            return replace(source, destination)
+
+        with mock.patch('api.uploads.os.replace', cross_device):
+            response = self.complete(upload, product)
+
+        self.assertEqual(response.status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual(Path(product.image.path).read_bytes(), buffer.getvalue())
+        self.assertFalse(upload.temp_path.exists())
+
+    def image(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (16, 16), 'red').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def start(self, content, sha256=None):
+        response = self.client.post('/api/uploads/', {
+            'filename': 'a.png', 'size': len(content), 'sha256': sha256 or hashlib.sha256(content).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put(self, upload_id, offset, chunk):
+        return self.client.put(f'/api/uploads/{upload_id}/chunk/?offset={offset}', chunk, content_type='application/octet-stream')
+
+    def test_upload_in_two_chunks(self):
+        product = make_product(Category.objects.create(name='Phones'))
+        content = self.image()
+        upload_id = self.start(content)
+        half = len(content) // 2
+
+        first = self.put(upload_id, 0, content[:half])
+        second = self.put(upload_id, half, content[half:])
+        response = self.client.post(f'/api/uploads/{upload_id}/complete/', {'product_id': product.pk})
+
+        self.assertEqual(first.data, {'offset': half, 'size': len(content)})
+        self.assertEqual(second.data, {'offset': len(content), 'size': len(content)})
+        self.assertEqual(response.status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual(Path(product.image.path).read_bytes(), content)
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_offset_mismatch_reports_the_current_offset(self):
+        upload_id = self.start(b'0123456789')
+        self.put(upload_id, 0, b'01234')
+
+        response = self.put(upload_id, 3, b'34567')
+
+        self.assertEqual((response.status_code, response.data['offset']), (409, 5))
+
+    @override_settings(CHUNKED_UPLOAD_MAX_CHUNK_SIZE=4)
+    def test_oversize_and_empty_chunks_are_refused(self):
+        upload_id = self.start(b'0123456789')
+
+        self.assertEqual(self.put(upload_id, 0, b'01234').status_code, 413)
+        self.assertEqual(self.put(upload_id, 0, b'').status_code, 400)
+        self.assertEqual(ChunkedUpload.objects.get(pk=upload_id).offset, 0)
+
+    def test_complete_checks_size_and_checksum(self):
+        product = make_product(Category.objects.create(name='Phones'))
+        content = self.image()
+        short = self.start(content)
+        self.put(short, 0, content[:-1])
+        corrupt = self.start(content, sha256='0' * 64)
+        self.put(corrupt, 0, content)
+
+        incomplete = self.client.post(f'/api/uploads/{short}/complete/', {'product_id': product.pk})
+        mismatch = self.client.post(f'/api/uploads/{corrupt}/complete/', {'product_id': product.pk})
+
+        self.assertEqual((incomplete.status_code, incomplete.data['error']), (400, 'Upload is incomplete'))
+        self.assertEqual((mismatch.status_code, mismatch.data['error']), (400, 'Checksum mismatch'))
+        product.refresh_from_db()
+        self.assertFalse(product.image)
+
+    def test_chunks_are_stored_outside_media_root(self):
+        upload = ChunkedUpload(user=self.user)
+
+        self.assertFalse(upload.temp_path.resolve().is_relative_to(Path(settings.MEDIA_ROOT).resolve()))
+
+
+@override_settings(PRODUCT_EVENTS_COALESCE_SECONDS=0, PRODUCT_EVENTS_BROADCASTER='api.events.InProcessBroadcaster')
+class ProductEventsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(Category.objects.create(name='Phones'), stock=8)
+        self.sharded = inventory.set_shards(make_product(self.product.category, 'Sharded', stock=10), 2)
+        # set_shards() leaves the base column as a snapshot.
+        Product.objects.filter(pk=self.sharded.pk).update(stock=0)
+
+    async def read(self, events):
+        message = (await asyncio.wait_for(anext(events), 5)).decode()
+        event, data = message.split('\n')[:2]
+        return event, {int(pk): delta for pk, delta in json.loads(data.removeprefix('data: ')).items()}
+
+    def change_stock(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 5
+            self.product.save(update_fields=['stock'])
+        ProductStockShard.objects.filter(product=self.sharded, shard=0).update(stock=F('stock') + 3)
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=self.sharded.pk).save()
+
+    async def test_snapshot_then_changes_with_sharded_stock_summed(self):
+        response = await self.async_client.get(f'/api/products/events/?ids={self.product.pk},{self.sharded.pk}')
+        events = aiter(response.streaming_content)
+
+        event, snapshot = await self.read(events)
+        self.assertEqual(event, 'event: snapshot')
+        self.assertEqual((snapshot[self.product.pk]['stock'], snapshot[self.sharded.pk]['stock']), (8, 10))
+
+        await sync_to_async(self.change_stock)()
+
+        event, update = await self.read(events)
+        self.assertEqual(event, 'event: update')
+        self.assertEqual(update[self.product.pk], {'stock': 5})
+        self.assertEqual(update[self.sharded.pk]['stock'], 13)
+        await events.aclose()
+
+    def test_too_many_ids_are_rejected(self):
+        ids = ','.join(str(n) for n in range(settings.PRODUCT_EVENTS_MAX_IDS + 1))
+
+        self.assertEqual(self.client.get(f'/api/products/events/?ids={ids}').status_code, 400)
+
+
+@override_settings(REDIS_URL='redis://example.invalid/0')
+class RedisBroadcasterTests(SimpleTestCase):
+    def test_listener_reconnects_after_the_connection_drops(self):
+        delivered = threading.Event()
+        messages = [[], [{'data': json.dumps([1, {'stock': 2}])}]]
+
+        class PubSub:
+            def __init__(self, messages):
+                self.messages = messages
+
+            def subscribe(self, channel):
+                pass
+
+            def listen(self):
+                yield from self.messages
+                if not self.messages:
+                    raise ConnectionError('connection dropped')
+                threading.Event().wait()
+
+            def close(self):
+                pass
+
+        client = mock.Mock()
+        client.pubsub.side_effect = lambda **kwargs: PubSub(messages.pop(0))
+        redis = mock.Mock(RedisError=Exception)
+        redis.Redis.from_url.return_value = client
+
+        with mock.patch.dict(sys.modules, {'redis': redis}), mock.patch('api.events.time.sleep'), \
+                self.assertLogs('api.events', 'ERROR'):
+            broadcaster = events.RedisBroadcaster()
+            with mock.patch.object(broadcaster, 'deliver', side_effect=lambda *args: delivered.set()) as deliver:
+                broadcaster._ensure_listener()
+                self.assertTrue(delivered.wait(5))
+
+        deliver.assert_called_once_with(1, {'stock': 2})
+        self.assertEqual(client.pubsub.call_count, 2)
@@ -0,0 +1,79 @@
+"""
+Abuse throttles for the unauthenticated auth endpoints.
+
+DRF's SimpleRateThrottle keeps a list of request timestamps per client and
+rewrites it on every request. That read-modify-write is not atomic, so
+concurrent bursts slip through, and the list grows with the rate. These
+throttles keep one integer counter per client per window and update it
+with ``cache.incr``, which is atomic on Redis and memcached. They
+approximate a token bucket refilled at ``num_requests`` per ``duration``:
+the allowance is the current window's count plus the previous window's
+count weighted by how much of it still overlaps the sliding window.
+
+Throttles run in ``APIView.initial()``, so an over-limit request gets a
+429 before the view does any password hashing or database work.
+"""
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class AtomicRateThrottle(SimpleRateThrottle):
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window, offset = divmod(now, self.duration)
+        current_key = f'{self.key}:{int(window)}'
+        previous = self.cache.get(f'{self.key}:{int(window) - 1}', 0)
+
+        self.cache.add(current_key, 0, self.duration * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Evicted between add() and incr().
+            self.cache.set(current_key, 1, self.duration * 2)
+            current = 1
+
+        overlap = 1 - offset / self.duration
+        allowed = previous * overlap + current <= self.num_requests
+        self.remaining = self.duration - offset
+        return allowed
+
+    def wait(self):
+        return self.remaining
+
+
+class IPThrottle(AtomicRateThrottle):
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class EmailThrottle(AtomicRateThrottle):
+    def get_cache_key(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': email.strip().lower()}
+
+
+class LoginIPThrottle(IPThrottle):
+    scope = 'login_ip'
+
+
+class LoginEmailThrottle(EmailThrottle):
+    scope = 'login_email'
+
+
+class SignupIPThrottle(IPThrottle):
+    scope = 'signup_ip'
+
+
+class OTPIPThrottle(IPThrottle):
+    scope = 'otp_ip'
+
+
+class OTPEmailThrottle(EmailThrottle):
+    scope = 'otp_email'
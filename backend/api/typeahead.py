@@ -0,0 +1,220 @@
+"""
+In-process autocomplete over product and category names.
+
+Every name is indexed under each of its word suffixes ("dell xps 13" is
+found by "dell", "xps" and "13") in a sorted list, so a lookup is a
+``bisect`` into that list. Results for very short prefixes, which match a
+large slice of the catalog, are memoised. The index is built from the
+database once per process, then kept current in the writing process
+through model signals. Other processes notice a bumped version stamp in
+the shared cache and rebuild in the background.
+
+Matches are ranked by weight, then by name. A product's weight is its
+popularity score at the time the index was built.
+"""
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Category, Product
+
+VERSION_KEY = 'typeahead:version'
+MAX_WORDS = 8
+MEMO_PREFIX_LENGTH = 3
+MAX_SCAN = 5000
+MAX_RESULTS = 20
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+class PrefixIndex:
+    def __init__(self, entries=()):
+        # entries: (id, name, weight)
+        self._items = {}
+        self._keys = []
+        self._memo = {}
+        for item_id, name, weight in entries:
+            self._items[item_id] = (name, weight)
+            self._keys.extend((token, item_id) for token in self._tokens(name))
+        self._keys.sort()
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def _tokens(name):
+        words = normalize(name).split(' ')[:MAX_WORDS]
+        return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+    def add(self, item_id, name, weight=None):
+        if weight is None:
+            # A rename keeps the entry's current weight.
+            weight = self._items.get(item_id, (None, 0))[1]
+        self.remove(item_id)
+        self._items[item_id] = (name, weight)
+        for token in self._tokens(name):
+            insort(self._keys, (token, item_id))
+            self._forget(token)
+
+    def remove(self, item_id):
+        if item_id not in self._items:
+            return
+        name, _ = self._items.pop(item_id)
+        for token in self._tokens(name):
+            position = bisect_left(self._keys, (token, item_id))
+            if position < len(self._keys) and self._keys[position] == (token, item_id):
+                del self._keys[position]
+            self._forget(token)
+
+    def _forget(self, token):
+        for length in range(1, MEMO_PREFIX_LENGTH + 1):
+            self._memo.pop(token[:length], None)
+
+    def search(self, prefix, limit):
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            memo = self._memo.get(prefix)
+            if memo is None:
+                memo = self._memo[prefix] = self._scan(prefix, MAX_RESULTS, max_scan=None)
+            return memo[:limit]
+        return self._scan(prefix, limit, max_scan=MAX_SCAN)
+
+    def _scan(self, prefix, limit, max_scan):
+        # Past max_scan entries the ranking is approximate, but a prefix
+        # that long almost never matches that many names.
+        keys = self._keys
+        position = bisect_left(keys, (prefix,))
+        end = len(keys) if max_scan is None else min(len(keys), position + max_scan)
+        matches = set()
+        while position < end and keys[position][0].startswith(prefix):
+            matches.add(keys[position][1])
+            position += 1
+        best = heapq.nsmallest(limit, matches, key=lambda item_id: (-self._items[item_id][1], self._items[item_id][0]))
+        return [{'id': item_id, 'name': self._items[item_id][0]} for item_id in best]
+
+
+class Typeahead:
+    def __init__(self):
+        self.products = None
+        self.categories = None
+        self.version = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        self._batch = threading.local()
+
+    def build(self):
+        version = cache.get(VERSION_KEY, 0)
+        # Products are weighted by popularity (ProductStats.score), read in
+        # the same query through a left join.
+        rows = Product.objects.values_list('pk', 'name', 'stats__score').iterator(chunk_size=10000)
+        products = PrefixIndex((pk, name, score or 0) for pk, name, score in rows)
+        categories = PrefixIndex((pk, name, 1) for pk, name in Category.objects.values_list('pk', 'name'))
+        with self._lock:
+            self.products, self.categories, self.version = products, categories, version
+            self._checked_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.products is None:
+            with self._build_lock:
+                if self.products is None:
+                    self.build()
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < settings.TYPEAHEAD_VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if cache.get(VERSION_KEY, 0) != self.version and not self._rebuilding:
+            # Keep serving the current index while a fresh one is built.
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        finally:
+            self._rebuilding = False
+
+    def search(self, query, limit=8):
+        limit = min(limit, MAX_RESULTS)
+        self.ensure_built()
+        self._check_version()
+        prefix = normalize(query)
+        if not prefix:
+            return {'products': [], 'categories': []}
+        with self._lock:
+            return {
+                'products': self.products.search(prefix, limit),
+                'categories': self.categories.search(prefix, limit),
+            }
+
+    @contextmanager
+    def batch(self):
+        """
+        Defer index maintenance for bulk operations: changes made in the
+        block are not applied one by one, and on exit the version is bumped
+        once so every process, this one included, rebuilds in the background.
+        """
+        depth = getattr(self._batch, 'depth', 0)
+        self._batch.depth = depth + 1
+        if not depth:
+            self._batch.dirty = False
+        try:
+            yield
+        finally:
+            self._batch.depth = depth
+            if not depth and self._batch.dirty:
+                self._bump()
+                self._checked_at = 0
+
+    def invalidate(self):
+        """
+        Force every process to rebuild, for changes made behind the signals.
+        """
+        if getattr(self._batch, 'depth', 0):
+            self._batch.dirty = True
+        else:
+            self._bump()
+            self._checked_at = 0
+
+    def update(self, kind, item_id, name=None):
+        """
+        Apply a single change locally and bump the shared version stamp so
+        other processes rebuild. ``name=None`` removes the entry.
+        """
+        if getattr(self._batch, 'depth', 0):
+            self._batch.dirty = True
+            return
+        if self.products is not None:
+            with self._lock:
+                index = getattr(self, kind)
+                if name is None:
+                    index.remove(item_id)
+                else:
+                    index.add(item_id, name)
+        version = self._bump()
+        if version is None:
+            return
+        with self._lock:
+            # Only skip our own rebuild when no other process changed
+            # anything since our last sync.
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def _bump(self):
+        cache.add(VERSION_KEY, 0, timeout=None)
+        try:
+            return cache.incr(VERSION_KEY)
+        except ValueError:
+            return None
+
+
+typeahead = Typeahead()
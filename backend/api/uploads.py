@@ -0,0 +1,121 @@
+"""
+Resumable chunked uploads.
+
+Chunks are streamed from the request straight into a ``.part`` file, so
+worker memory stays flat whatever the file size. When the upload
+completes, the checksum is verified, the file is checked to be an image
+the way ``ImageField`` checks multipart uploads, and it is renamed to its
+content-hashed name in the media tree and attached to the model's image
+field. Only when ``CHUNKED_UPLOAD_DIR`` is on another filesystem is it
+copied instead.
+"""
+import errno
+import hashlib
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from .storage import hashed_name, touch
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+def start(upload):
+    settings.CHUNKED_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    upload.temp_path.touch()
+
+
+def append_chunk(upload, stream, length):
+    """
+    Write ``length`` bytes from ``stream`` at the upload's current offset and
+    return the new offset. The caller must hold a lock on the upload row.
+    """
+    if upload.offset + length > upload.size:
+        raise UploadError('Chunk runs past the declared file size')
+
+    written = 0
+    with open(upload.temp_path, 'r+b') as part:
+        # Drop anything left over from an interrupted earlier attempt.
+        part.truncate(upload.offset)
+        part.seek(upload.offset)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+        if written != length:
+            part.truncate(upload.offset)
+            raise UploadError('Request body ended before the chunk was complete')
+    return upload.offset + written
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def attach(upload, instance, field_name='image'):
+    """
+    Verify a finished upload and move it into ``instance.<field_name>``.
+    """
+    if upload.offset != upload.size:
+        raise UploadError('Upload is incomplete')
+    digest = file_sha256(upload.temp_path)
+    if digest != upload.sha256.lower():
+        raise UploadError('Checksum mismatch')
+    try:
+        with Image.open(upload.temp_path) as image:
+            image.verify()
+    except Exception:
+        # Pillow raises a variety of errors for corrupt or non-image files.
+        raise UploadError('Upload is not a valid image')
+
+    field = instance._meta.get_field(field_name)
+    name = hashed_name(field.generate_filename(instance, upload.filename), digest)
+    destination = default_storage.path(name)
+    if os.path.exists(destination):
+        # Identical content is already stored; share it.
+        touch(destination)
+        discard(upload)
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        _move(upload.temp_path, destination)
+
+    getattr(instance, field_name).name = name
+    if instance.pk:
+        instance.save(update_fields=[field_name])
+    else:
+        instance.save()
+
+
+def _move(source, destination):
+    try:
+        os.replace(source, destination)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Across filesystems: copy next to the destination first so the
+        # final name only ever appears complete.
+        partial = f'{destination}.part'
+        shutil.copyfile(source, partial)
+        os.replace(partial, destination)
+        os.remove(source)
+
+
+def discard(upload):
+    try:
+        os.remove(upload.temp_path)
+    except FileNotFoundError:
+        pass
@@ -1,19 +1,31 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, CartViewSet, send_otp, signup, login, CategoryViewSet, CartItemViewSet, AddressViewSet, AdvertisementViewSet
+from .views import ProductViewSet, CartViewSet, send_otp, signup, login, logout, logout_all, CategoryViewSet, CartItemViewSet, AddressViewSet, AdvertisementViewSet, ChunkedUploadViewSet, GuestCartViewSet, RequestProfileViewSet, db_stats, ready, autocomplete, product_events, analytics_products, analytics_categories
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'cart', CartViewSet, basename='cart')
 router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'cart/items', CartItemViewSet, basename='cart-item')
+router.register(r'guest-cart', GuestCartViewSet, basename='guest-cart')
 router.register(r'addresses', AddressViewSet, basename='address')
 router.register(r'advertisement', AdvertisementViewSet, basename='advertisement')
+router.register(r'uploads', ChunkedUploadViewSet, basename='upload')
+router.register(r'profiles', RequestProfileViewSet, basename='profile')
 
 urlpatterns = [
+    # Before the router, which would otherwise treat "events" as a product pk.
+    path('products/events/', product_events, name='product-events'),
     path('', include(router.urls)),
     path('send-otp/', send_otp, name='send-otp'),
     path('signup/', signup, name='signup'),
     path('login/', login, name='login'),
+    path('logout/', logout, name='logout'),
+    path('logout-all/', logout_all, name='logout-all'),
+    path('db-stats/', db_stats, name='db-stats'),
+    path('ready/', ready, name='ready'),
+    path('autocomplete/', autocomplete, name='autocomplete'),
+    path('analytics/products/', analytics_products, name='analytics-products'),
+    path('analytics/categories/', analytics_categories, name='analytics-categories'),
 
 ]
\ No newline at end of file
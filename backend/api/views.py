@@ -1,19 +1,45 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import Product, Cart, CartItem, Profile, Category, Address, Advertisement
-from .serializers import ProductSerializer, CartSerializer, CartItemSerializer, UserSerializer, RegisterSerializer, CategorySerializer, AddressSerializer, AdvertisementSerializer
-from rest_framework.decorators import api_view
+from .models import Product, Cart, CartItem, Profile, Category, Address, Advertisement, RelatedProduct, ChunkedUpload, AnalyticsEvent, AnalyticsRollup, RequestProfile, PendingFileDeletion, SpecAttribute
+from .serializers import ProductSerializer, CartSerializer, CartItemSerializer, UserSerializer, RegisterSerializer, CategorySerializer, AddressSerializer, AdvertisementSerializer, ChunkedUploadSerializer, RequestProfileSerializer, RequestProfileDetailSerializer, SpecAttributeSerializer
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, throttle_classes
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from rest_framework.authtoken.models import Token
 from django.core.mail import send_mail
 from django.conf import settings
 import random
+import uuid
 from .permissions import IsAdminRole
 import json
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from .db import connection_stats
+from . import exports
+from .typeahead import typeahead
+from . import uploads
+from . import inventory
+from . import analytics
+from . import popularity
+from . import specs
+from . import profiling
+from . import bulk
+from . import warmup
+from . import addresses
+from . import authentication
+from .guest_cart import GuestCart, merge_guest_cart
+from .throttling import LoginIPThrottle, LoginEmailThrottle, SignupIPThrottle, OTPIPThrottle, OTPEmailThrottle
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.views.static import serve
+from .storage import is_hashed_name
+from .events import get_broadcaster, product_snapshot
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse, FileResponse, Http404
+from django.utils.dateparse import parse_datetime
 
 class AdvertisementViewSet(viewsets.ModelViewSet):
     queryset = Advertisement.objects.all()
@@ -36,12 +62,18 @@ class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'specifications']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAdminRole]
         return [permission() for permission in permission_classes]
 
+    @action(detail=True, methods=['get'])
+    def specifications(self, request, pk=None):
+        # The category's typed spec schema, for building product forms.
+        attributes = SpecAttribute.objects.filter(category=self.get_object()).order_by('position', 'id')
+        return Response(SpecAttributeSerializer(attributes, many=True).data)
+
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
@@ -51,47 +83,179 @@ class ProductViewSet(viewsets.ModelViewSet):
         return {'request': self.request}
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'related', 'compare']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAdminRole]
         return [permission() for permission in permission_classes]
 
+    def get_queryset(self):
+        queryset = super().get_queryset().prefetch_related(specs.values_prefetch())
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        if params.get('category'):
+            try:
+                queryset = queryset.filter(category_id=int(params['category']))
+            except ValueError:
+                raise ValidationError({'error': 'category must be an integer'})
+        if params.get('in_stock') in ('1', 'true'):
+            # Sharded products keep a snapshot in stock; close enough for a listing filter.
+            queryset = queryset.filter(stock__gt=0)
+        try:
+            queryset = specs.filter_products(queryset, params)
+        except ValueError as e:
+            raise ValidationError({'error': str(e)})
+        # Each ordering is backed by an index; see api/query_plans.py.
+        ordering = params.get('ordering')
+        if ordering == 'popular':
+            # Inner join so the walk can follow product_stats_score_idx; every
+            # product gets a stats row when it is created (api/signals.py).
+            queryset = queryset.filter(stats__isnull=False).order_by('-stats__score', '-id')
+        elif ordering == 'price':
+            queryset = queryset.order_by('price_after_discount', 'id')
+        elif ordering == '-price':
+            queryset = queryset.order_by('-price_after_discount', '-id')
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        popularity.count_view(instance.pk)
+        return Response(self.get_serializer(instance).data)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        fmt = request.query_params.get('output', 'ndjson')
+        if fmt not in exports.FORMATS:
+            return Response({'error': f"output must be one of: {', '.join(exports.FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        updated_since = request.query_params.get('updated_since')
+        if updated_since:
+            updated_since = parse_datetime(updated_since)
+            if updated_since is None:
+                return Response({'error': 'updated_since must be an ISO 8601 datetime'}, status=status.HTTP_400_BAD_REQUEST)
+
+        compress = request.query_params.get('gzip') in ('1', 'true')
+        media_url = lambda name: request.build_absolute_uri(default_storage.url(name))
+        chunks = exports.iter_export(fmt, media_url, updated_since=updated_since or None, compress=compress)
+
+        _, content_type = exports.FORMATS[fmt]
+        filename = f'products.{fmt}'
+        if compress:
+            content_type = 'application/gzip'
+            filename += '.gz'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def compare(self, request):
+        try:
+            ids = list(dict.fromkeys(int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()))
+        except ValueError:
+            return Response({'error': 'ids must be a comma-separated list of product ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 2 <= len(ids) <= settings.PRODUCT_COMPARE_MAX:
+            return Response({'error': f'Compare between 2 and {settings.PRODUCT_COMPARE_MAX} products'}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = Product.objects.select_related('category').prefetch_related(specs.values_prefetch()).in_bulk(ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            return Response({'error': 'Product not found', 'ids': missing}, status=status.HTTP_404_NOT_FOUND)
+        products = [found[pk] for pk in ids]
+        return Response({
+            'products': self.get_serializer(products, many=True).data,
+            'specifications': specs.compare(products),
+        })
+
+    @action(detail=False, methods=['post'], url_path='bulk/patch', parser_classes=[JSONParser])
+    def bulk_patch(self, request):
+        # {"ids": [...] | "filter": {...}, "set": {...}} or {"items": [{"id": 1, ...}, ...]}
+        try:
+            if 'items' in request.data:
+                updated = bulk.patch_items(request.data['items'])
+            else:
+                updated = bulk.patch(bulk.select(request.data), request.data.get('set') or {})
+        except bulk.BulkError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['post'], url_path='bulk/restock', parser_classes=[JSONParser])
+    def bulk_restock(self, request):
+        try:
+            quantity = int(request.data.get('quantity'))
+        except (TypeError, ValueError):
+            return Response({'error': 'quantity must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity < 1:
+            return Response({'error': 'quantity must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            updated = bulk.restock(bulk.select(request.data), quantity)
+        except bulk.BulkError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['post'], url_path='bulk/delete', parser_classes=[JSONParser])
+    def bulk_delete(self, request):
+        try:
+            deleted = bulk.delete(bulk.select(request.data))
+        except bulk.BulkError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'deleted': deleted})
+
+    def perform_destroy(self, instance):
+        # Image files may be shared (content-hashed); process_file_deletions
+        # removes them later if nothing else uses them.
+        with transaction.atomic():
+            if instance.image:
+                PendingFileDeletion.objects.create(name=instance.image.name)
+            instance.delete()
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        # Served straight from the precomputed table: one query on the
+        # (product, rank) unique index.
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404('Product not found')
+        rows = list(
+            RelatedProduct.objects.filter(product_id=pk).select_related('related__category')
+            .prefetch_related(specs.values_prefetch('related__spec_values')).order_by('rank')
+        )
+        if not rows and not Product.objects.filter(pk=pk).exists():
+            raise Http404('Product not found')
+        serializer = self.get_serializer([row.related for row in rows], many=True)
+        return Response(serializer.data)
+
     def create(self, request, *args, **kwargs):
-        data = request.data.copy()
-        if 'specifications' in data and isinstance(data['specifications'], str):
-            data['specifications'] = json.loads(data['specifications'])
-        
-        serializer = self.get_serializer(data=data)
+        # JSONField parses the form's specifications string itself.
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        with transaction.atomic():
+            self.perform_create(serializer)
+            analytics.record(AnalyticsEvent.STOCK_CHANGE, serializer.instance, serializer.instance.stock)
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
-        data = request.data.copy()
-        if 'specifications' in data and isinstance(data['specifications'], str):
-            data['specifications'] = json.loads(data['specifications'])
-            
-        serializer = self.get_serializer(instance, data=data, partial=True)
+        serializer = self.get_serializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+        old_stock = inventory.available_stock(instance)
+        with transaction.atomic():
+            self.perform_update(serializer)
+            if 'stock' in serializer.validated_data:
+                if instance.stock_shards:
+                    inventory.set_stock(instance, serializer.validated_data['stock'])
+                analytics.record(AnalyticsEvent.STOCK_CHANGE, instance, serializer.validated_data['stock'] - old_stock)
         return Response(serializer.data)
 
-    def destroy(self, request, *args, **kwargs):
-        instance = self.get_object()
-        if instance.image:
-            # Delete the image file from the filesystem
-            instance.image.delete(save=False)
-        self.perform_destroy(instance)
-        return Response(status=status.HTTP_204_NO_CONTENT)
 
 class CartViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
         cart, _ = Cart.objects.get_or_create(user=request.user)
+        prefetch_related_objects([cart], 'items__product__category', specs.values_prefetch('items__product__spec_values'))
         serializer = CartSerializer(cart, context={'request': request})
         return Response(serializer.data)
 
@@ -103,39 +267,130 @@ class CartViewSet(viewsets.ViewSet):
         if not product_id:
             return Response({'error': 'Product ID is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+        if quantity < 1:
+            return Response({'error': 'Quantity must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             product = Product.objects.get(id=product_id)
         except Product.DoesNotExist:
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Check if there is enough stock
-        if product.stock < quantity:
-            return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
-
         # Calculate the price
         discounted_price = product.price
         if product.discount is not None and product.discount > 0:
             discount_amount = (product.discount / 100) * product.price
             discounted_price -= discount_amount
 
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+            # Serialises with a guest cart merge into the same cart. Like the
+            # merge, lock the cart before reserve() locks the product row, so
+            # the two never wait on each other in opposite orders.
+            Cart.objects.select_for_update().get(pk=cart.pk)
 
-        if not created:
-            cart_item.quantity += quantity
-        else:
-            cart_item.quantity = quantity
-        
-        cart_item.price = discounted_price
-        cart_item.save()
+            # The conditional decrement is the stock check.
+            try:
+                inventory.reserve(product, quantity)
+            except inventory.OutOfStock:
+                return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
+
+            cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
 
-        # Decrement the stock
-        product.stock -= quantity
-        product.save(update_fields=['stock'])
+            if not created:
+                cart_item.quantity += quantity
+            else:
+                cart_item.quantity = quantity
 
+            cart_item.price = discounted_price
+            cart_item.save()
+            analytics.record(AnalyticsEvent.CART_ADD, product, quantity)
+            transaction.on_commit(lambda: popularity.count_cart_add(product.pk))
+
+        prefetch_related_objects([cart], 'items__product__category', specs.values_prefetch('items__product__spec_values'))
         serializer = CartSerializer(cart, context={'request': request})
         return Response(serializer.data)
 
+class GuestCartViewSet(viewsets.ViewSet):
+    """
+    Cart for visitors who are not logged in, held in the cache and keyed by
+    a signed cookie. It is merged into the user's cart at login/signup.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def cart_data(self, request, guest_cart):
+        items = guest_cart.items if guest_cart is not None else {}
+        products = Product.objects.select_related('category').prefetch_related(specs.values_prefetch()).in_bulk(list(items))
+        data = []
+        for product_id, quantity in items.items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            data.append({
+                'product': ProductSerializer(product, context={'request': request}).data,
+                'quantity': quantity,
+                'price': product.price_after_discount if product.price_after_discount is not None else product.price,
+            })
+        return {'items': data}
+
+    def parse_item(self, request, default_quantity=1):
+        try:
+            product_id = int(request.data.get('product_id'))
+            quantity = int(request.data.get('quantity', default_quantity))
+        except (TypeError, ValueError):
+            return None, None, Response({'error': 'product_id and quantity must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        product = Product.objects.filter(pk=product_id).only('id', 'stock', 'stock_shards').first()
+        if product is None:
+            return None, None, Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        return product, quantity, None
+
+    def store(self, request, guest_cart, product, quantity):
+        if quantity > 0 and inventory.available_stock(product) < quantity:
+            return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
+        if product.pk not in guest_cart.items and len(guest_cart.items) >= settings.GUEST_CART_MAX_ITEMS:
+            return Response({'error': 'Cart is full'}, status=status.HTTP_400_BAD_REQUEST)
+        guest_cart.set_quantity(product.pk, quantity)
+        response = Response(self.cart_data(request, guest_cart))
+        guest_cart.save(response)
+        return response
+
+    def list(self, request):
+        return Response(self.cart_data(request, GuestCart.from_request(request)))
+
+    @action(detail=False, methods=['post'])
+    def add_item(self, request):
+        product, quantity, error = self.parse_item(request)
+        if error:
+            return error
+        if quantity < 1:
+            return Response({'error': 'Quantity must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+        guest_cart = GuestCart.from_request(request, create=True)
+        response = self.store(request, guest_cart, product, guest_cart.items.get(product.pk, 0) + quantity)
+        if response.status_code == status.HTTP_200_OK:
+            popularity.count_cart_add(product.pk)
+        return response
+
+    @action(detail=False, methods=['post'])
+    def update_item(self, request):
+        product, quantity, error = self.parse_item(request)
+        if error:
+            return error
+        return self.store(request, GuestCart.from_request(request, create=True), product, max(quantity, 0))
+
+    @action(detail=False, methods=['post'])
+    def remove_item(self, request):
+        # No product lookup: a product deleted since it was added must
+        # still be removable.
+        try:
+            product_id = int(request.data.get('product_id'))
+        except (TypeError, ValueError):
+            return Response({'error': 'product_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        guest_cart = GuestCart.from_request(request, create=True)
+        guest_cart.set_quantity(product_id, 0)
+        response = Response(self.cart_data(request, guest_cart))
+        guest_cart.save(response)
+        return response
+
 class CartItemViewSet(viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
     permission_classes = [IsAuthenticated]
@@ -144,7 +399,10 @@ class CartItemViewSet(viewsets.ModelViewSet):
         return {'request': self.request}
 
     def get_queryset(self):
-        return CartItem.objects.filter(cart__user=self.request.user)
+        return (
+            CartItem.objects.filter(cart__user=self.request.user).select_related('product__category')
+            .prefetch_related(specs.values_prefetch('product__spec_values'))
+        )
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -158,23 +416,28 @@ class CartItemViewSet(viewsets.ModelViewSet):
 
         product = instance.product
 
-        if product.stock < quantity_diff:
-            return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            try:
+                if quantity_diff > 0:
+                    inventory.reserve(product, quantity_diff)
+                    analytics.record(AnalyticsEvent.CART_ADD, product, quantity_diff)
+                elif quantity_diff < 0:
+                    inventory.release(product, -quantity_diff)
+                    analytics.record(AnalyticsEvent.CART_REMOVE, product, -quantity_diff)
+            except inventory.OutOfStock:
+                return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
 
-        product.stock -= quantity_diff
-        product.save(update_fields=['stock'])
-        
-        self.perform_update(serializer)
+            self.perform_update(serializer)
 
         return Response(serializer.data)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        # Add back the stock
-        product = instance.product
-        product.stock += instance.quantity
-        product.save(update_fields=['stock'])
-        self.perform_destroy(instance)
+        with transaction.atomic():
+            # Add back the stock
+            inventory.release(instance.product, instance.quantity)
+            analytics.record(AnalyticsEvent.CART_REMOVE, instance.product, instance.quantity)
+            self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class AddressViewSet(viewsets.ModelViewSet):
@@ -185,9 +448,160 @@ class AddressViewSet(viewsets.ModelViewSet):
         return Address.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        addresses.save(serializer, self.request.user)
+
+    def perform_update(self, serializer):
+        addresses.save(serializer, self.request.user)
+
+    def perform_destroy(self, instance):
+        addresses.delete(instance)
+
+    @action(detail=True, methods=['post'])
+    def set_default(self, request, pk=None):
+        address = addresses.set_default(self.get_object())
+        return Response(self.get_serializer(address).data)
+
+    @action(detail=False, methods=['get'])
+    def default(self, request):
+        # Checkout's shipping address: cached, else one read of unique_default_address.
+        address = addresses.default_address(request.user.pk)
+        if address is None:
+            return Response({'error': 'No default address'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(address).data)
+
+class ChunkedUploadViewSet(viewsets.GenericViewSet):
+    """
+    Resumable image uploads: create with filename/size/sha256, PUT raw
+    chunks to chunk/?offset=N, then POST complete/ naming the product or
+    advertisement the image belongs to.
+    """
+    serializer_class = ChunkedUploadSerializer
+    permission_classes = [IsAdminRole]
+
+    def get_queryset(self):
+        return ChunkedUpload.objects.filter(user=self.request.user)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # A malformed id would fail in the UUIDField lookup.
+        if 'pk' in kwargs:
+            try:
+                uuid.UUID(kwargs['pk'])
+            except ValueError:
+                raise Http404('Upload not found')
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save(user=request.user)
+        uploads.start(upload)
+        data = serializer.data
+        data['chunk_size'] = settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def destroy(self, request, pk=None):
+        upload = self.get_object()
+        uploads.discard(upload)
+        upload.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        try:
+            offset = int(request.query_params['offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'error': 'offset query parameter and Content-Length header are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if length <= 0:
+            return Response({'error': 'Empty chunk'}, status=status.HTTP_400_BAD_REQUEST)
+        if length > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+            return Response({'error': f'Chunks are limited to {settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE} bytes'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        with transaction.atomic():
+            # The row lock serialises concurrent appends to the same upload.
+            upload = self.get_queryset().select_for_update().filter(pk=pk).first()
+            if upload is None:
+                return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+            if offset != upload.offset:
+                return Response({'error': 'Offset mismatch', 'offset': upload.offset}, status=status.HTTP_409_CONFLICT)
+            try:
+                upload.offset = uploads.append_chunk(upload, request.stream, length)
+            except uploads.UploadError as e:
+                return Response({'error': str(e), 'offset': upload.offset}, status=status.HTTP_400_BAD_REQUEST)
+            upload.save(update_fields=['offset'])
+
+        return Response({'offset': upload.offset, 'size': upload.size})
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        try:
+            product_id = int(request.data.get('product_id') or 0)
+            advertisement_id = int(request.data.get('advertisement_id') or 0)
+        except (TypeError, ValueError):
+            return Response({'error': 'product_id and advertisement_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if product_id:
+            target = Product.objects.filter(pk=product_id).first()
+            serializer_class = ProductSerializer
+        elif advertisement_id:
+            target = Advertisement.objects.filter(pk=advertisement_id).first()
+            serializer_class = AdvertisementSerializer
+        elif request.data.get('advertisement'):
+            target = Advertisement()
+            serializer_class = AdvertisementSerializer
+        else:
+            return Response({'error': 'product_id, advertisement_id or advertisement is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if target is None:
+            return Response({'error': 'Target not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        with transaction.atomic():
+            upload = self.get_queryset().select_for_update().filter(pk=pk).first()
+            if upload is None:
+                return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+            try:
+                uploads.attach(upload, target)
+            except uploads.UploadError as e:
+                return Response({'error': str(e), 'offset': upload.offset}, status=status.HTTP_400_BAD_REQUEST)
+            upload.delete()
+
+        return Response(serializer_class(target, context={'request': request}).data)
+
+class RequestProfileViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Profiles captured by api.profiling.ProfilingMiddleware, newest first.
+    Filter with ?view=CartViewSet.add_item; download/ returns the pstats dump.
+    """
+    permission_classes = [IsAdminRole]
+
+    def get_queryset(self):
+        queryset = RequestProfile.objects.order_by('-created_at')
+        if self.action == 'list':
+            queryset = queryset.defer('summary')
+            if self.request.query_params.get('view'):
+                queryset = queryset.filter(view=self.request.query_params['view'])
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return RequestProfileDetailSerializer
+        return RequestProfileSerializer
+
+    def destroy(self, request, pk=None):
+        profiling.delete_profile(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        profile = self.get_object()
+        try:
+            return FileResponse(open(profile.stats_path, 'rb'), as_attachment=True, filename=f'{profile.id}.prof')
+        except FileNotFoundError:
+            raise Http404('Profile data has been removed')
 
 @api_view(['POST'])
+@throttle_classes([OTPIPThrottle, OTPEmailThrottle])
 def send_otp(request):
     email = request.data.get('email')
     if not email:
@@ -210,19 +624,23 @@ def send_otp(request):
     return Response({'message': 'OTP sent successfully'})
 
 @api_view(['POST'])
+@throttle_classes([SignupIPThrottle])
 def signup(request):
     serializer = RegisterSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
-        token, _ = Token.objects.get_or_create(user=user)
+        token = authentication.issue(user)
         user_serializer = UserSerializer(user)
-        return Response({
+        response = Response({
             'token': token.key,
             'user': user_serializer.data
         })
+        merge_guest_cart(request, response, user)
+        return response
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
+@throttle_classes([LoginIPThrottle, LoginEmailThrottle])
 def login(request):
     email = request.data.get('email')
     password = request.data.get('password')
@@ -239,10 +657,140 @@ def login(request):
     if not user:
         return Response({'error': 'Invalid credentials'}, status=400)
 
-    token, _ = Token.objects.get_or_create(user=user)
+    token = authentication.issue(user)
     serializer = UserSerializer(user)
 
-    return Response({
+    response = Response({
         'token': token.key,
         'user': serializer.data
     })
+    merge_guest_cart(request, response, user)
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    request.auth.delete()
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout_all(request):
+    # Signs the user out on every device, this one included.
+    authentication.revoke_all(request.user)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+@api_view(['GET'])
+@permission_classes([IsAdminRole])
+def db_stats(request):
+    return Response(connection_stats())
+
+def ready(request):
+    # Readiness probe: 503 until this worker has finished warming up. A
+    # plain view, so probes skip DRF's authentication and content negotiation.
+    is_ready = warmup.is_ready()
+    return JsonResponse(
+        {'ready': is_ready, 'steps_ms': warmup.state['steps'], 'failed_steps': sorted(warmup.state['errors'])},
+        status=200 if is_ready else 503,
+    )
+
+def analytics_range(request):
+    period = request.query_params.get('period', AnalyticsRollup.DAY)
+    if period not in (AnalyticsRollup.HOUR, AnalyticsRollup.DAY):
+        raise ValueError('period must be hour or day')
+    since = until = None
+    if request.query_params.get('since'):
+        since = parse_datetime(request.query_params['since'])
+        if since is None:
+            raise ValueError('since must be an ISO 8601 datetime')
+    if request.query_params.get('until'):
+        until = parse_datetime(request.query_params['until'])
+        if until is None:
+            raise ValueError('until must be an ISO 8601 datetime')
+    return period, since or analytics.default_since(period), until
+
+@api_view(['GET'])
+@permission_classes([IsAdminRole])
+def analytics_products(request):
+    # Reads only the rollup tables; see api/analytics.py.
+    try:
+        period, since, until = analytics_range(request)
+        limit = min(int(request.query_params.get('limit', 20)), 200)
+        product_id = request.query_params.get('product')
+        category_id = request.query_params.get('category')
+        product_id = int(product_id) if product_id else None
+        category_id = int(category_id) if category_id else None
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if product_id is not None:
+        results = analytics.product_series(product_id, period, since, until)
+    else:
+        results = analytics.product_summary(period, since, until, category_id=category_id, limit=max(1, limit))
+    return Response({'period': period, 'since': since, 'until': until, **analytics.freshness(), 'results': results})
+
+@api_view(['GET'])
+@permission_classes([IsAdminRole])
+def analytics_categories(request):
+    try:
+        period, since, until = analytics_range(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    results = analytics.category_summary(period, since, until)
+    return Response({'period': period, 'since': since, 'until': until, **analytics.freshness(), 'results': results})
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def autocomplete(request):
+    # No authentication: the hot path must not touch the database.
+    try:
+        limit = int(request.query_params.get('limit', 8))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(typeahead.search(request.query_params.get('q', ''), limit=max(1, limit)))
+
+def serve_media(request, path):
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_hashed_name(path):
+        # Content-addressed names never change content.
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+async def product_events(request):
+    """
+    Server-sent events for ?ids=1,2,3: a snapshot of each product's stock
+    and price, then merged deltas as they change. Serve under ASGI; each
+    idle connection holds no thread.
+    """
+    try:
+        ids = {int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()}
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma-separated list of product IDs'}, status=400)
+    if not ids:
+        return JsonResponse({'error': 'ids is required'}, status=400)
+    if len(ids) > settings.PRODUCT_EVENTS_MAX_IDS:
+        return JsonResponse({'error': f'At most {settings.PRODUCT_EVENTS_MAX_IDS} products per connection'}, status=400)
+
+    async def stream():
+        broadcaster = get_broadcaster()
+        # Subscribe before reading the snapshot, so a change committed in
+        # between arrives as an update instead of being lost.
+        subscription = broadcaster.subscribe(ids)
+        try:
+            snapshot = await sync_to_async(product_snapshot)(ids)
+            yield f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+            while True:
+                batch = await subscription.next_batch(settings.PRODUCT_EVENTS_HEARTBEAT_SECONDS)
+                if batch is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield f"event: update\ndata: {json.dumps(batch)}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
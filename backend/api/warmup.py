@@ -0,0 +1,155 @@
+"""
+Worker warm-up.
+
+A fresh worker pays on its first requests for lazy imports, its first
+database connections, the autocomplete index build and the first render
+of every public page. ``run`` pays for them up front:
+
+* imports the view and serializer modules and compiles the URL patterns,
+* opens the database connections; in pool mode it waits until the pool
+  holds ``DB_POOL_MIN_SIZE`` connections,
+* opens the cache connection,
+* builds the in-memory typeahead index,
+* renders ``WARMUP_PATHS`` (categories, advertisements and the home-page
+  product lists) through the WSGI handler, so those code paths run once
+  and their table and index pages are pulled into Postgres' buffers.
+
+With ``WARMUP_ON_STARTUP`` set, wsgi.py and asgi.py call ``start`` as
+the worker boots. Warm-up then runs in a background thread, and
+``/api/ready/`` answers 503 until it has finished. ``manage.py warmup``
+runs the same steps in its own process. That only warms what is shared
+(Postgres buffers and the cache), but it reports the timing of each step.
+"""
+import importlib
+import io
+import logging
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+MODULES = ('api.serializers', 'api.views', 'api.urls')
+
+state = {'started_at': None, 'finished_at': None, 'steps': {}, 'errors': {}}
+_started = threading.Lock()
+
+
+def import_modules():
+    for name in (*MODULES, settings.ROOT_URLCONF):
+        importlib.import_module(name)
+    # Compiles every pattern of the URLconf.
+    get_resolver().reverse_dict
+
+
+def open_connections():
+    for connection in connections.all():
+        connection.ensure_connection()
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            pool.wait(timeout=settings.DB_POOL_TIMEOUT)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+
+def open_cache():
+    cache.get('warmup')
+
+
+def build_indexes():
+    from .typeahead import typeahead
+    typeahead.ensure_built()
+
+
+def _host():
+    for host in settings.ALLOWED_HOSTS:
+        host = host.lstrip('.')
+        if host and '*' not in host:
+            return host
+    return 'localhost'
+
+
+def get(application, path):
+    """
+    GET ``path`` through the WSGI ``application`` and return the status line.
+    """
+    path, _, query = path.partition('?')
+    host = _host()
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    statuses = []
+    body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return statuses[0]
+
+
+def render_pages():
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    failed = []
+    for path in settings.WARMUP_PATHS:
+        status = get(application, path)
+        if not status.startswith('2'):
+            failed.append(f'{path}: {status}')
+    if failed:
+        raise RuntimeError('; '.join(failed))
+
+
+STEPS = [
+    ('imports', import_modules),
+    ('connections', open_connections),
+    ('cache', open_cache),
+    ('indexes', build_indexes),
+    ('pages', render_pages),
+]
+
+
+def run():
+    """
+    Run every step, recording its duration in ``state``. A failing step is
+    logged and skipped: a worker that cannot warm a page can still serve it.
+    """
+    state['started_at'] = time.time()
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.exception('Warm-up step %s failed', name)
+            state['errors'][name] = str(e)
+        state['steps'][name] = round((time.perf_counter() - started) * 1000, 1)
+    state['finished_at'] = time.time()
+    return state
+
+
+def _run_in_thread():
+    try:
+        run()
+    finally:
+        # Hand this thread's connections back (to the pool, in pool mode).
+        connections.close_all()
+
+
+def start():
+    if not settings.WARMUP_ON_STARTUP or not _started.acquire(blocking=False):
+        return
+    threading.Thread(target=_run_in_thread, name='warmup', daemon=True).start()
+
+
+def is_ready():
+    return not settings.WARMUP_ON_STARTUP or state['finished_at'] is not None
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_project.settings')
 
 application = get_asgi_application()
+
+# Optional warm-up (WARMUP_ON_STARTUP); see api/warmup.py.
+from api import warmup  # noqa: E402
+
+warmup.start()
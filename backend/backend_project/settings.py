@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,14 +38,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
-    'rest_framework.authtoken',
     'corsheaders',
     'api',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,26 +81,160 @@ WSGI_APPLICATION = 'backend_project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'Computer',
-        'USER': 'ashikgurung',
-        'PASSWORD': '2020Bca01!',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.environ.get('DB_NAME', 'Computer'),
+        'USER': os.environ.get('DB_USER', 'ashikgurung'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', '2020Bca01!'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
     }
 }
 
+# Connection reuse. DB_POOL_MODE is one of:
+#   "persistent" - keep each worker thread's connection open for
+#                  DB_CONN_MAX_AGE seconds and health-check it before reuse
+#   "pool"       - share a psycopg 3 connection pool between the threads of a
+#                  worker process (requires psycopg[pool])
+#   "off"        - open and close a connection for every request
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'persistent')
+
+# The pool is sized from the server's connection budget split across worker
+# processes, so scaling out workers never exhausts max_connections.
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', '100'))
+DB_RESERVED_CONNECTIONS = int(os.environ.get('DB_RESERVED_CONNECTIONS', '10'))
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+DB_POOL_MAX_SIZE = int(os.environ.get(
+    'DB_POOL_MAX_SIZE',
+    max(2, (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) // WEB_CONCURRENCY),
+))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', min(2, DB_POOL_MAX_SIZE)))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+if DB_POOL_MODE == 'pool':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+        },
+    }
+elif DB_POOL_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Cache
+# Features that must agree across worker processes (guest carts, the
+# autocomplete index version) need a shared cache: set REDIS_URL (requires
+# the redis package). Without it every process gets its own local-memory
+# cache, which the api.E001 system check refuses when WEB_CONCURRENCY > 1.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds between checks of the shared autocomplete index version.
+TYPEAHEAD_VERSION_CHECK_INTERVAL = float(os.environ.get('TYPEAHEAD_VERSION_CHECK_INTERVAL', '5'))
+
+# Live stock/price updates (api/events.py). The in-process broadcaster only
+# reaches subscribers of the same worker; use api.events.RedisBroadcaster to
+# fan out across workers.
+PRODUCT_EVENTS_BROADCASTER = os.environ.get('PRODUCT_EVENTS_BROADCASTER', 'api.events.InProcessBroadcaster')
+PRODUCT_EVENTS_MAX_IDS = 100
+PRODUCT_EVENTS_HEARTBEAT_SECONDS = 15
+PRODUCT_EVENTS_COALESCE_SECONDS = 0.25
+
+# How stale the public stock figure of a sharded product may be.
+SHARDED_STOCK_CACHE_SECONDS = 1
+
+# Guest carts (api/guest_cart.py) live in the cache for this many seconds.
+GUEST_CART_TTL = 30 * 24 * 60 * 60
+GUEST_CART_MAX_ITEMS = 50
+
+# Analytics events (api/analytics.py) are written in batches of up to
+# ANALYTICS_BUFFER_SIZE, at least every ANALYTICS_FLUSH_SECONDS. The rollup
+# job leaves the newest ANALYTICS_ROLLUP_LAG_SECONDS of events for later.
+ANALYTICS_BUFFER_SIZE = int(os.environ.get('ANALYTICS_BUFFER_SIZE', '200'))
+ANALYTICS_FLUSH_SECONDS = float(os.environ.get('ANALYTICS_FLUSH_SECONDS', '5'))
+ANALYTICS_ROLLUP_LAG_SECONDS = 60
+
+# Popularity counters (api/popularity.py) are flushed to ProductStats this
+# often, or once this many products have pending counts.
+POPULARITY_FLUSH_SECONDS = float(os.environ.get('POPULARITY_FLUSH_SECONDS', '10'))
+POPULARITY_BUFFER_SIZE = 1000
+POPULARITY_CART_ADD_WEIGHT = 10
+
+# Most products accepted by /api/products/compare/.
+PRODUCT_COMPARE_MAX = 4
+
+# Bulk product operations (api/bulk.py): largest explicit id list, and the
+# largest restock for which live stock events are still published.
+BULK_MAX_IDS = 100000
+BULK_PUBLISH_LIMIT = 1000
+
+# How long a user's default address is cached (api/addresses.py). Changes
+# invalidate it, so this only bounds memory.
+ADDRESS_DEFAULT_CACHE_SECONDS = 3600
+
+# API tokens (api/authentication.py) expire AUTH_TOKEN_TTL_SECONDS after
+# their last use. To spare a write per request, a token in use is renewed
+# at most every AUTH_TOKEN_RENEW_SECONDS.
+AUTH_TOKEN_TTL_SECONDS = int(os.environ.get('AUTH_TOKEN_TTL_SECONDS', str(14 * 24 * 3600)))
+AUTH_TOKEN_RENEW_SECONDS = int(os.environ.get('AUTH_TOKEN_RENEW_SECONDS', '3600'))
+
+# Worker warm-up (api/warmup.py). When on, each worker warms itself in the
+# background as it boots and /api/ready/ answers 503 until it is done.
+# WARMUP_PATHS are the public pages rendered once: categories,
+# advertisements and the home-page product lists.
+WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', '').lower() in ('1', 'true', 'yes')
+WARMUP_PATHS = [
+    '/api/categories/',
+    '/api/advertisement/',
+    '/api/products/',
+    '/api/products/?ordering=popular',
+]
+
+# Only these origins may make credentialed requests (see below), so no
+# wildcard. CORS_ALLOWED_ORIGINS is a comma-separated list; the default
+# covers local development (5173 is the Vite dev server).
 CORS_ALLOWED_ORIGINS = [
-    "http://localhost:3000",
-    "http://127.0.0.1:3000",
+    origin.strip()
+    for origin in os.environ.get(
+        'CORS_ALLOWED_ORIGINS',
+        'http://localhost:3000,http://127.0.0.1:3000,http://localhost:5173,http://127.0.0.1:5173',
+    ).split(',')
+    if origin.strip()
 ]
 
-CORS_ORIGIN_ALLOW_ALL = True
+# The guest cart cookie must travel with cross-origin API calls.
+CORS_ALLOW_CREDENTIALS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.ExpiringTokenAuthentication',
     ],
+    # Used by api/throttling.py on login, signup and send-otp.
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.environ.get('THROTTLE_LOGIN_IP', '10/min'),
+        'login_email': os.environ.get('THROTTLE_LOGIN_EMAIL', '5/min'),
+        'signup_ip': os.environ.get('THROTTLE_SIGNUP_IP', '10/hour'),
+        'otp_ip': os.environ.get('THROTTLE_OTP_IP', '10/hour'),
+        'otp_email': os.environ.get('THROTTLE_OTP_EMAIL', '5/hour'),
+    },
+    # Number of trusted reverse proxies in front of the app. With 0, the
+    # per-IP throttles use REMOTE_ADDR and ignore X-Forwarded-For, which
+    # clients can set to anything.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
 }
 
 
@@ -141,6 +277,41 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded media is stored under content-hashed names (see api/storage.py).
+# When a front-end server serves MEDIA_ROOT instead of Django, it should send
+# "Cache-Control: public, max-age=31536000, immutable" for hashed names.
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.ContentHashedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', str(DEBUG)).lower() in ('1', 'true', 'yes')
+
+# Chunked uploads are assembled next to MEDIA_ROOT, not inside it, so
+# partial files are never served; on the same filesystem, completing one is
+# a rename rather than a copy.
+CHUNKED_UPLOAD_DIR = Path(os.environ.get('CHUNKED_UPLOAD_DIR', BASE_DIR / 'uploads_tmp'))
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_SIZE', 100 * 1024 * 1024))
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024))
+
+# Request profiling (api/profiling.py). Off by default, in which case the
+# middleware removes itself at startup. When on, admins can profile a
+# request with the PROFILING_HEADER header and a PROFILING_SAMPLE_RATE
+# fraction of all requests is profiled, one at a time per process. The
+# middleware is sync-only: under ASGI enabling it makes Django adapt every
+# request, including the product event stream, so turn it on for triage
+# on a WSGI worker.
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', '').lower() in ('1', 'true', 'yes')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_HEADER = 'HTTP_X_PROFILE'
+PROFILING_TOP_N = 30
+PROFILING_MAX_QUERIES = 500
+PROFILING_MAX_STORED = 200
+PROFILE_ROOT = Path(os.environ.get('PROFILE_ROOT', BASE_DIR / 'profiles'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_project.settings')
 
 application = get_wsgi_application()
+
+# Optional warm-up (WARMUP_ON_STARTUP); see api/warmup.py.
+from api import warmup  # noqa: E402
+
+warmup.start()
@@ -1,4 +1,5 @@
-import React, { createContext, useContext, useState, useEffect } from 'react';
+import React, { createContext, useContext, useState, useEffect, useRef } from 'react';
+import { setUnauthorizedHandler } from '@/lib/api';
 
 const AuthContext = createContext();
 
@@ -38,11 +39,42 @@ localStorage.removeItem('tamki_token');
       localStorage.setItem('tamki_user', JSON.stringify(user));
       localStorage.setItem('tamki_token', token);
     } else {
-localStorage.removeItem('tamki_user');
-      localStorage.removeItem('techstore_token');
+      localStorage.removeItem('tamki_user');
+      localStorage.removeItem('tamki_token');
     }
   }, [user, token]);
 
+  const tokenRef = useRef(null);
+
+  const clearSession = () => {
+    tokenRef.current = null;
+    setUser(null);
+    setToken(null);
+    localStorage.removeItem('tamki_user');
+    localStorage.removeItem('tamki_token');
+  };
+
+  // Tokens expire after two idle weeks and "log out everywhere" revokes
+  // them. A 401 on an authFetch request sent with the current token means
+  // it is no longer valid: sign out locally and go to the login page.
+  useEffect(() => {
+    tokenRef.current = token;
+    if (!token) {
+      return;
+    }
+    setUnauthorizedHandler((authorization) => {
+      if (tokenRef.current && authorization === `Token ${tokenRef.current}`) {
+        clearSession();
+        if (window.location.pathname !== '/login') {
+          window.location.assign('/login');
+        }
+      }
+    });
+    return () => {
+      setUnauthorizedHandler(null);
+    };
+  }, [token]);
+
   const login = async (credentials) => {
     try {
       setLoading(true);
@@ -114,10 +146,16 @@ localStorage.removeItem('tamki_user');
   };
 
   const logout = () => {
-    setUser(null);
-    setToken(null);
-    localStorage.removeItem('techstore_user');
-    localStorage.removeItem('techstore_token');
+    if (token) {
+      // Revoke the token server-side; the local sign-out doesn't wait for it.
+      fetch('http://127.0.0.1:8000/api/logout/', {
+        method: 'POST',
+        headers: {
+          'Authorization': `Token ${token}`,
+        },
+      }).catch((error) => console.error('Error logging out:', error));
+    }
+    clearSession();
   };
 
   const sendOTP = async (email) => {
@@ -1,5 +1,6 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import { useAuth } from './AuthContext';
+import { authFetch } from '@/lib/api';
 
 const CartContext = createContext();
 
@@ -20,7 +21,7 @@ export const CartProvider = ({ children }) => {
     if (!token) return;
     setLoading(true);
     try {
-      const response = await fetch('http://127.0.0.1:8000/api/cart/', {
+      const response = await authFetch('http://127.0.0.1:8000/api/cart/', {
         headers: {
           'Authorization': `Token ${token}`,
         },
@@ -50,7 +51,7 @@ export const CartProvider = ({ children }) => {
     if (!token) return;
     setLoading(true);
     try {
-      const response = await fetch('http://127.0.0.1:8000/api/cart/add_item/', {
+      const response = await authFetch('http://127.0.0.1:8000/api/cart/add_item/', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -75,7 +76,7 @@ export const CartProvider = ({ children }) => {
     if (!token) return;
     setLoading(true);
     try {
-      const response = await fetch(`http://127.0.0.1:8000/api/cart/items/${itemId}/`, {
+      const response = await authFetch(`http://127.0.0.1:8000/api/cart/items/${itemId}/`, {
         method: 'DELETE',
         headers: {
           'Authorization': `Token ${token}`,
@@ -101,7 +102,7 @@ export const CartProvider = ({ children }) => {
     if (!token) return;
     setLoading(true);
     try {
-      const response = await fetch(`http://127.0.0.1:8000/api/cart/items/${itemId}/`, {
+      const response = await authFetch(`http://127.0.0.1:8000/api/cart/items/${itemId}/`, {
         method: 'PUT',
         headers: {
           'Content-Type': 'application/json',
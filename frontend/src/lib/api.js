@@ -0,0 +1,17 @@
+// Requests sent with the user's token go through authFetch, so a token
+// that has expired or been revoked is noticed in one place. AuthProvider
+// registers the handler; it receives the Authorization header of the
+// rejected request and decides whether that was the current token.
+let unauthorizedHandler = null;
+
+export function setUnauthorizedHandler(handler) {
+  unauthorizedHandler = handler;
+}
+
+export async function authFetch(input, init = {}) {
+  const response = await fetch(input, init);
+  if (response.status === 401 && unauthorizedHandler) {
+    unauthorizedHandler(new Headers(init.headers).get('Authorization'));
+  }
+  return response;
+}
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { useAuth } from '../contexts/AuthContext';
+import { authFetch } from '@/lib/api';
 
 const AddAdvertisement = () => {
   const [image, setImage] = useState(null);
@@ -41,7 +42,7 @@ const AddAdvertisement = () => {
     formData.append('image', image);
 
     try {
-      const response = await fetch('http://127.0.0.1:8000/api/advertisement/', {
+      const response = await authFetch('http://127.0.0.1:8000/api/advertisement/', {
         method: 'POST',
         headers: {
           'Authorization': `Token ${token}`,
@@ -64,7 +65,7 @@ const AddAdvertisement = () => {
   const handleDelete = async (id) => {
     if (window.confirm('Are you sure you want to delete this advertisement?')) {
       try {
-        const response = await fetch(`http://127.0.0.1:8000/api/advertisement/${id}/`, {
+        const response = await authFetch(`http://127.0.0.1:8000/api/advertisement/${id}/`, {
           method: 'DELETE',
           headers: {
             'Authorization': `Token ${token}`,
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
+import { authFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Input } from '@/components/ui/input';
@@ -40,7 +41,7 @@ const AddressManagement = () => {
       return;
     }
     try {
-      const response = await fetch(`${API_BASE_URL}/addresses/`, {
+      const response = await authFetch(`${API_BASE_URL}/addresses/`, {
         headers: {
           'Authorization': `Token ${token}`,
         },
@@ -76,7 +77,7 @@ const AddressManagement = () => {
       : `${API_BASE_URL}/addresses/`;
 
     try {
-      const response = await fetch(url, {
+      const response = await authFetch(url, {
         method,
         headers: {
           'Content-Type': 'application/json',
@@ -117,7 +118,7 @@ const AddressManagement = () => {
   const handleDeleteAddress = async (id) => {
     setLoading(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/addresses/${id}/`, {
+      const response = await authFetch(`${API_BASE_URL}/addresses/${id}/`, {
         method: 'DELETE',
         headers: {
           'Authorization': `Token ${token}`,
@@ -147,27 +148,12 @@ const AddressManagement = () => {
   const handleSetDefault = async (id) => {
     setLoading(true);
     try {
-      // First, unset current default if any
-      const currentDefault = addresses.find(addr => addr.is_default);
-      if (currentDefault && currentDefault.id !== id) {
-        await fetch(`${API_BASE_URL}/addresses/${currentDefault.id}/`, {
-          method: 'PATCH',
-          headers: {
-            'Content-Type': 'application/json',
-            'Authorization': `Token ${token}`,
-          },
-          body: JSON.stringify({ is_default: false }),
-        });
-      }
-
-      // Then set the new default
-      const response = await fetch(`${API_BASE_URL}/addresses/${id}/`, {
-        method: 'PATCH',
+      // The server unsets the previous default in the same transaction.
+      const response = await authFetch(`${API_BASE_URL}/addresses/${id}/set_default/`, {
+        method: 'POST',
         headers: {
-          'Content-Type': 'application/json',
           'Authorization': `Token ${token}`,
         },
-        body: JSON.stringify({ is_default: true }),
       });
 
       if (response.ok) {
@@ -2,6 +2,7 @@ import React, { useState } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { useCart } from '../contexts/CartContext';
 import { useAuth } from '../contexts/AuthContext';
+import { authFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
@@ -51,7 +52,7 @@ const Cart = () => {
   const handleProceedToCheckout = async () => {
     setAddressLoading(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/addresses/`, {
+      const response = await authFetch(`${API_BASE_URL}/addresses/`, {
         headers: {
           'Authorization': `Token ${token}`,
         },
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import { useCart } from '../contexts/CartContext';
 import { useAuth } from '../contexts/AuthContext';
+import { authFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Input } from '@/components/ui/input';
@@ -47,6 +48,7 @@ const Checkout = () => {
   const [addresses, setAddresses] = useState([]);
   const [selectedAddress, setSelectedAddress] = useState(null);
   const [addressLoading, setAddressLoading] = useState(true);
+  const [addressesLoaded, setAddressesLoaded] = useState(false);
   const [isAddingAddress, setIsAddingAddress] = useState(false);
   const [newAddress, setNewAddress] = useState({
     first_name: '',
@@ -70,13 +72,42 @@ const Checkout = () => {
 
   const API_BASE_URL = 'http://127.0.0.1:8000/api';
 
-  const fetchAddresses = async () => {
+  // Checkout only needs the default address up front; the full list is
+  // loaded when the user opens the address picker.
+  const fetchDefaultAddress = async () => {
     if (!token) {
       setAddressLoading(false);
       return;
     }
+    if (location.state && location.state.selectedAddress) {
+      setSelectedAddress(location.state.selectedAddress);
+      setAddressLoading(false);
+      return;
+    }
+    try {
+      const response = await authFetch(`${API_BASE_URL}/addresses/default/`, {
+        headers: {
+          'Authorization': `Token ${token}`,
+        },
+      });
+      if (response.ok) {
+        setSelectedAddress(await response.json());
+      } else if (response.status === 404) {
+        setSelectedAddress(null);
+      } else {
+        toast.error('Failed to fetch your default address.');
+      }
+    } catch (error) {
+      console.error('Error fetching default address:', error);
+      toast.error('Error fetching your default address.');
+    } finally {
+      setAddressLoading(false);
+    }
+  };
+
+  const fetchAddresses = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/addresses/`, {
+      const response = await authFetch(`${API_BASE_URL}/addresses/`, {
         headers: {
           'Authorization': `Token ${token}`,
         },
@@ -84,25 +115,19 @@ const Checkout = () => {
       if (response.ok) {
         const data = await response.json();
         setAddresses(data);
-        if (location.state && location.state.selectedAddress) {
-          setSelectedAddress(location.state.selectedAddress);
-        } else {
-          const defaultAddr = data.find(addr => addr.is_default) || data[0];
-          setSelectedAddress(defaultAddr);
-        }
-      } else {
-        toast.error('Failed to fetch addresses.');
+        setAddressesLoaded(true);
+        return data;
       }
+      toast.error('Failed to fetch addresses.');
     } catch (error) {
       console.error('Error fetching addresses:', error);
       toast.error('Error fetching addresses.');
-    } finally {
-      setAddressLoading(false);
     }
+    return addresses;
   };
 
   useEffect(() => {
-    fetchAddresses();
+    fetchDefaultAddress();
   }, [token, location.state]);
 
   const subtotal = getCartTotal();
@@ -147,7 +172,7 @@ const Checkout = () => {
     e.preventDefault();
     setIsProcessing(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/addresses/`, {
+      const response = await authFetch(`${API_BASE_URL}/addresses/`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -172,12 +197,16 @@ const Checkout = () => {
           is_default: false,
         });
 
-        let updatedAddresses = [...addresses, addedAddress];
+        const currentAddresses = addressesLoaded ? addresses : await fetchAddresses();
+        let updatedAddresses = [
+          ...currentAddresses.filter(address => address.id !== addedAddress.id),
+          addedAddress,
+        ];
 
         if (updatedAddresses.length > 3) {
           const oldestAddress = updatedAddresses[0]; // Assuming oldest is the first one
           try {
-            await fetch(`${API_BASE_URL}/addresses/${oldestAddress.id}/`, {
+            await authFetch(`${API_BASE_URL}/addresses/${oldestAddress.id}/`, {
               method: 'DELETE',
               headers: {
                 'Authorization': `Token ${token}`,
@@ -385,6 +414,11 @@ const Checkout = () => {
                   <Label>Select Address</Label>
                   <Select 
                     value={selectedAddress ? selectedAddress.id : ''}
+                    onOpenChange={(open) => {
+                      if (open && !addressesLoaded) {
+                        fetchAddresses();
+                      }
+                    }}
                     onValueChange={(value) => {
                       const address = addresses.find(a => a.id === parseInt(value));
                       setSelectedAddress(address);
@@ -394,7 +428,7 @@ const Checkout = () => {
                       <SelectValue placeholder="Select an address" />
                     </SelectTrigger>
                     <SelectContent>
-                      {addresses.map(address => (
+                      {(addressesLoaded ? addresses : (selectedAddress ? [selectedAddress] : [])).map(address => (
                         <SelectItem key={address.id} value={address.id}>
                           {address.first_name} {address.last_name}, {address.address}, {address.city}
                         </SelectItem>
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate, useParams } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
+import { authFetch } from '@/lib/api';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
@@ -111,7 +112,7 @@ const UpdateProduct = () => {
     productData.append('specifications', JSON.stringify(specifications));
 
     try {
-      const response = await fetch(`http://127.0.0.1:8000/api/products/${id}/`, {
+      const response = await authFetch(`http://127.0.0.1:8000/api/products/${id}/`, {
         method: 'PUT',
         headers: {
           'Authorization': `Token ${token}`,